@@ -0,0 +1,53 @@
+# 房间 actor：每个房间一个命令队列，房间内的 socket 事件、阶段超时与合并后的轻量事件
+# 都作为命令投递到所属房间的队列，由该房间唯一的处理协程按到达顺序逐条执行。
+# 同一房间的处理函数不会交错 (处理中途让出 hub 时，其它房间照常运行)；队列空了协程即退出，空闲房间不占协程。
+#
+# 命令只是 (函数, 参数)，处理函数自己按房间 id 取状态，不依赖投递方的上下文。
+# 把重负载的房间挪出共享 hub 时只需替换投递的目的地 (与 room_event 跨 worker 转发的消息相同)，不必修改游戏逻辑。
+import logging
+import time
+from collections import deque
+
+import eventlet
+
+LOG = logging.getLogger('balance.actor')
+
+
+class RoomActor:
+    __slots__ = ("room_id", "pending", "running")
+
+    def __init__(self, room_id):
+        self.room_id = room_id
+        self.pending = deque()  # [(投递时间, 函数, 参数)]
+        self.running = False
+
+
+class RoomActors:
+    def __init__(self, on_wait=None):
+        self.on_wait = on_wait  # on_wait(秒)：命令在队列中等待的时间
+        self.actors = {}        # room_id -> 有待处理命令的 RoomActor
+
+    def post(self, room_id, func, *args):
+        actor = self.actors.get(room_id)
+        if actor is None:
+            actor = self.actors[room_id] = RoomActor(room_id)
+        actor.pending.append((time.monotonic(), func, args))
+        if not actor.running:
+            actor.running = True
+            eventlet.spawn_n(self._drain, actor)
+
+    def _drain(self, actor):
+        # 检查队列与退出之间没有让出点，不会漏掉新投递的命令
+        try:
+            while actor.pending:
+                queued, func, args = actor.pending.popleft()
+                if self.on_wait:
+                    self.on_wait(time.monotonic() - queued)
+                try:
+                    func(*args)
+                except Exception:
+                    LOG.exception("room %s: command %s failed", actor.room_id, getattr(func, '__name__', func))
+        finally:
+            actor.running = False
+            if not actor.pending and self.actors.get(actor.room_id) is actor:
+                del self.actors[actor.room_id]
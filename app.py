@@ -1,31 +1,160 @@
 import eventlet
 eventlet.monkey_patch()
 
-from flask import Flask, render_template, request
+from eventlet.queue import LightQueue, Empty
+from flask import Flask, Response, render_template, request
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_sqlalchemy import SQLAlchemy
+from itsdangerous import BadData, URLSafeTimedSerializer
+from socketio import packet as sio_packet
 import time
-import threading
 import random
 import math
 import json
 import os
+import functools
+import itertools
 from copy import deepcopy
-
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'secret!'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///game.db'
+from datetime import datetime
+import atexit
+import logging
+import secrets
+import sqlite3
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from writebehind import WriteBehindQueue
+from roundstore import RoundStore
+from replay import encode_replay, iter_replay, CHUNK_SIZE
+from lrucache import LRUCache
+from leaderboard import Leaderboard
+from cluster import check_worker_id, make_broker
+from views import audience_of, project_room
+from state import Room, Spectator
+import wire
+from metrics import REGISTRY, timed
+from profiler import SlowEventLog, deep_sizeof, profile_hub
+from actor import RoomActors
+from snapshots import SnapshotLog
+from roomevents import RateLimiter, RoomEventBus
+from game import (
+    PERMANENT_RULE_POOL, ROUND_EVENT_POOL, PERM_RULE_BY_ID,
+    init_room_state, new_player, new_spectator, reset_room_state, trigger_room_rule,
+    apply_pending_perm_rules, begin_round, resolve_room_round, compile_room_rules
+)
+
+# DATABASE_URL / INSTANCE_PATH 可指向临时目录 (测试与压测用，见 loadtest.py)，写后日志等随 instance 目录隔离
+app = Flask(__name__, instance_path=os.environ.get('INSTANCE_PATH'))
+LOG = logging.getLogger('balance.server')
+DEFAULT_SECRET_KEY = 'secret!'
+
+def load_secret_key():
+    # SECRET_KEY 未配置时在 instance 目录生成一次并保存；各 worker 共用 instance 目录，也就共用密钥
+    key = os.environ.get('SECRET_KEY')
+    if key: return key
+    path = os.path.join(app.instance_path, 'secret_key')
+    os.makedirs(app.instance_path, exist_ok=True)
+    if not os.path.exists(path):
+        # 先写完临时文件再硬链接到位：同时启动的 worker 只有一个能链接成功，不会读到写了一半的密钥
+        tmp_path = f"{path}.{os.getpid()}"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+    with open(path, encoding='utf-8') as f:
+        return f.read().strip()
+
+app.config['SECRET_KEY'] = load_secret_key()
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///game.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 db = SQLAlchemy(app)
-socketio = SocketIO(app, cors_allowed_origins="*")
+
+# 多进程部署 (见 cluster.py)：本进程编号与房间容量；广播经 BROKER 的消息队列扇出
+WORKER_ID = check_worker_id(os.environ.get('WORKER_ID', '0'))
+MAX_ROOMS_PER_WORKER = int(os.environ.get('MAX_ROOMS_PER_WORKER', 5))
+WORKER_HEARTBEAT = 5
+BROKER = make_broker(os.environ.get('MESSAGE_QUEUE'))
+
+# --- 指标 (见 metrics.py，由 /metrics 导出) ---
+EVENT_LATENCY = REGISTRY.histogram('balance_event_duration_seconds', 'Socket.IO 事件处理耗时', ['event'])
+FRAMES_SENT = REGISTRY.counter('balance_frames_sent_total', '发出的事件帧数 (广播按一次编码计)', ['event'])
+BYTES_SENT = REGISTRY.counter('balance_frame_bytes_sent_total', '发出的事件帧字节数 (含二进制附件)', ['event'])
+TIMER_LAG = REGISTRY.histogram('balance_phase_timer_lag_seconds', '阶段计时器实际触发晚于截止时间的秒数')
+TIMER_DURATION = REGISTRY.histogram('balance_phase_timer_duration_seconds', '阶段超时处理耗时')
+ROOM_QUEUE_WAIT = REGISTRY.histogram('balance_room_queue_wait_seconds', '房间命令在队列中等待的时间')
+ROUND_DURATION = REGISTRY.histogram('balance_calculate_round_seconds', 'calculate_round 耗时')
+POINTS_DURATION = REGISTRY.histogram('balance_calculate_points_seconds', 'calculate_points_and_save_room 耗时')
+DB_QUERIES = REGISTRY.counter('balance_db_queries_total', '执行的 SQL 语句数', ['statement'])
+REGISTRY.gauge('balance_rooms', '本进程的房间数', ['phase'], collect=lambda: rooms_by_phase())
+REGISTRY.gauge('balance_room_members', '本进程房间内的玩家与观战者', ['role'], collect=lambda: {
+    ("player",): sum(len(r.players) for r in rooms.values()),
+    ("spectator",): sum(len(r.spectators) for r in rooms.values()),
+})
+REGISTRY.gauge('balance_connections', '本进程的 Socket.IO 连接数', collect=lambda: {(): len(SID_CODECS)})
+REGISTRY.gauge('balance_session_entries', '连接、会话与房间回收相关登记表的条目数', ['table'], collect=lambda: {
+    (name,): count for name, count in session_table_sizes().items()
+})
+REGISTRY.gauge('balance_room_queue_depth', '房间命令队列中待处理的命令数', collect=lambda: {
+    (): sum(len(a.pending) for a in ROOM_ACTORS.actors.values())
+})
+
+class MeteredPacket(sio_packet.Packet):
+    # 事件包编码时按事件名累计帧数与字节数
+    def encode(self):
+        encoded = super().encode()
+        if self.packet_type in (sio_packet.EVENT, sio_packet.BINARY_EVENT) and self.data:
+            parts = encoded if isinstance(encoded, list) else [encoded]
+            size = sum(len(p.encode()) if isinstance(p, str) else len(p) for p in parts)
+            FRAMES_SENT.inc(1, self.data[0])
+            BYTES_SENT.inc(size, self.data[0])
+        return encoded
+
+def rooms_by_phase():
+    counts = {}
+    for room in rooms.values():
+        counts[(room.phase,)] = counts.get((room.phase,), 0) + 1
+    return counts
+
+socketio = SocketIO(app, cors_allowed_origins="*", json=wire, serializer=MeteredPacket,
+                    **BROKER.socketio_options())
+
+# 事件处理或计时回调超过预算 (毫秒) 时记入慢事件日志 (见 profiler.py)
+SLOW_EVENTS = SlowEventLog(float(os.environ.get('SLOW_EVENT_BUDGET_MS', 50)) / 1000)
+PROFILE_MAX_SECONDS = 30
+
+def observed(name):
+    # 事件耗时记入指标，超出预算的同时记入慢事件日志
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args):
+            started = time.perf_counter()
+            try:
+                return handler(*args)
+            finally:
+                elapsed = time.perf_counter() - started
+                EVENT_LATENCY.observe(elapsed, name)
+                SLOW_EVENTS.record(name, SID_TO_ROOM.get(request.sid), elapsed)
+        return wrapper
+    return decorator
+
+def socket_event(name):
+    # 注册 Socket.IO 事件，并记录处理耗时
+    def decorator(handler):
+        socketio.on_event(name, observed(name)(handler))
+        return handler
+    return decorator
 
 ADMIN_PASSWORD = "110110" 
 
 # 配置常量
-MAX_HP = 10
 MAX_PLAYERS = 8
-MAX_ROOMS = 5
 TIME_LIMIT_ROUND = 30
 TIME_LIMIT_PREGAME = 60
 TIME_LIMIT_RULE = 5
@@ -40,25 +169,31 @@ ULTIMATE_PIG_NAMES = [
     "凉山猪", "浦东白猪", "沙子岭猪", "通城猪", "乐平猪", "确山黑猪", "莱芜猪", "深州猪", "汉江黑猪", "滇南小耳猪"
 ]
 
+RANK_MAX_SCORE = 200
+
+def rank_info_for(score, ultimate_title=None):
+    if score < 10:
+        return {"title": "猪仔", "icon": "🍼", "class": "text-gray-500", "is_max": False}
+    elif score < 50:
+        return {"title": "保育猪", "icon": "🐽", "class": "text-blue-500", "is_max": False}
+    elif score < RANK_MAX_SCORE:
+        return {"title": "生长猪", "icon": "🐖", "class": "text-green-500", "is_max": False}
+    else:
+        return {"title": ultimate_title, "icon": "🐗", "class": "text-yellow-500", "is_max": True}
+
 class User(db.Model):
     id = db.Column(db.String(50), primary_key=True) 
     password = db.Column(db.String(50), nullable=False)
     nickname = db.Column(db.String(50), nullable=False, default="Player")
     score = db.Column(db.Integer, default=0)
     ultimate_title = db.Column(db.String(50), nullable=True)
+    token_epoch = db.Column(db.Float, nullable=False, default=0)  # 最近一次修改密码的时间，更早签发的恢复令牌作废
 
     def get_rank_info(self):
-        if self.score < 10:
-            return {"title": "猪仔", "icon": "🍼", "class": "text-gray-500", "is_max": False}
-        elif self.score < 50:
-            return {"title": "保育猪", "icon": "🐽", "class": "text-blue-500", "is_max": False}
-        elif self.score < 200:
-            return {"title": "生长猪", "icon": "🐖", "class": "text-green-500", "is_max": False}
-        else:
-            if not self.ultimate_title:
-                self.ultimate_title = random.choice(ULTIMATE_PIG_NAMES)
-                db.session.commit()
-            return {"title": self.ultimate_title, "icon": "🐗", "class": "text-yellow-500", "is_max": True}
+        if self.score >= RANK_MAX_SCORE and not self.ultimate_title:
+            self.ultimate_title = random.choice(ULTIMATE_PIG_NAMES)
+            db.session.commit()
+        return rank_info_for(self.score, self.ultimate_title)
 
     def to_dict(self):
         return {
@@ -72,127 +207,713 @@ class GameRecord(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=db.func.now())
     players_json = db.Column(db.Text)
-    details_json = db.Column(db.Text)
+    details_json = db.Column(db.Text)  # 旧格式，启动时迁移到 replay 后清空
+    replay = db.Column(db.LargeBinary)  # 紧凑回放 (见 replay.py)
+
+# 写后队列已落库的任务 id，保证重放幂等
+class AppliedJob(db.Model):
+    id = db.Column(db.String(40), primary_key=True)
+
+# 每名玩家每局一行，按 (uid, timestamp) 建索引，个人战绩查询不再扫描全部对局
+class PlayerResult(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    uid = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, db.ForeignKey('game_record.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    game_rank = db.Column(db.Integer)
+    total_players = db.Column(db.Integer)
+    score_change = db.Column(db.Integer, default=0)
+    is_suicide = db.Column(db.Boolean, default=False)
+    rank_json = db.Column(db.Text)
+
+    __table_args__ = (db.Index('ix_player_result_uid_timestamp', 'uid', 'timestamp'),)
+
+    def to_dict(self):
+        return {
+            'id': self.record_id,
+            'time': self.timestamp.strftime("%Y-%m-%d %H:%M"),
+            'score_change': self.score_change,
+            'rank': json.loads(self.rank_json) if self.rank_json else {},
+            'game_rank': self.game_rank if self.game_rank is not None else '-',
+            'total_players': self.total_players if self.total_players is not None else '-',
+            'is_suicide': self.is_suicide,
+        }
+
+def player_results_from_record(record, players_data):
+    return [
+        PlayerResult(
+            uid=p['uid'], record_id=record.id, timestamp=record.timestamp,
+            game_rank=p.get('game_rank'), total_players=p.get('total_players'),
+            score_change=p.get('score_change', 0), is_suicide=p.get('is_suicide', False),
+            rank_json=json.dumps(p.get('rank', {}))
+        )
+        for p in players_data if p.get('uid')
+    ]
+
+def backfill_player_results():
+    # 一次性迁移：从旧 GameRecord.players_json 生成 PlayerResult
+    if PlayerResult.query.first() is not None: return
+    for record in GameRecord.query.order_by(GameRecord.id).yield_per(500):
+        try:
+            players_data = json.loads(record.players_json)
+        except (TypeError, ValueError):
+            continue
+        db.session.add_all(player_results_from_record(record, players_data))
+    db.session.commit()
+
+def migrate_token_epoch():
+    # 一次性迁移：旧库的 user 表补上 token_epoch 列
+    columns = {c["name"] for c in db.inspect(db.engine).get_columns('user')}
+    if 'token_epoch' not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(db.text("ALTER TABLE user ADD COLUMN token_epoch FLOAT NOT NULL DEFAULT 0"))
+
+def migrate_replays(batch_size=200):
+    # 一次性迁移：旧库补上 replay 列，并把 details_json 转成紧凑回放
+    columns = {c["name"] for c in db.inspect(db.engine).get_columns('game_record')}
+    if 'replay' not in columns:
+        with db.engine.begin() as conn:
+            conn.execute(db.text("ALTER TABLE game_record ADD COLUMN replay BLOB"))
+    while True:
+        records = GameRecord.query.filter(GameRecord.replay.is_(None), GameRecord.details_json.isnot(None)) \
+            .order_by(GameRecord.id).limit(batch_size).all()
+        if not records: break
+        for record in records:
+            try:
+                history = json.loads(record.details_json)
+            except ValueError:
+                history = []
+            record.replay = encode_replay(history)
+            record.details_json = None
+        db.session.commit()
+
+def replay_chunks(record_id):
+    # 按块读取回放；SQLite 直接打开 BLOB 增量读取，不把整条记录读入内存
+    if db.engine.dialect.name != 'sqlite':
+        with app.app_context():
+            data = db.session.query(GameRecord.replay).filter_by(id=record_id).scalar()
+        if data: yield data
+        return
+    conn = db.engine.raw_connection()
+    try:
+        try:
+            blob = conn.driver_connection.blobopen('game_record', 'replay', record_id, readonly=True)
+        except sqlite3.OperationalError:  # 记录不存在或没有回放
+            return
+        with blob:
+            while True:
+                chunk = blob.read(CHUNK_SIZE)
+                if not chunk: break
+                yield chunk
+    finally:
+        conn.close()
+
+@event.listens_for(Engine, "before_cursor_execute")
+def count_db_query(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERIES.inc(1, statement.split(None, 1)[0].upper())
+
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+def apply_game_results(jobs):
+    # 写后队列的落库函数：多局结果合并为一次事务，已落库的任务直接跳过
+    with app.app_context():
+        applied = {j.id for j in AppliedJob.query.filter(AppliedJob.id.in_([job["id"] for job in jobs]))}
+        for job in jobs:
+            if job["id"] in applied: continue
+            ranked = job["players"]
+            users = {u.id: u for u in User.query.filter(User.id.in_([p["uid"] for p in ranked]))}
+            record_data = []
+            for p in ranked:
+                user = users.get(p["uid"])
+                if not user: continue
+                user.score += p["score_change"]
+                if user.score >= RANK_MAX_SCORE and not user.ultimate_title:
+                    user.ultimate_title = job["titles"].get(user.id) or random.choice(ULTIMATE_PIG_NAMES)
+                record_data.append(dict(
+                    p, nickname=user.nickname, new_score=user.score,
+                    rank=rank_info_for(user.score, user.ultimate_title)
+                ))
+            record = GameRecord(
+                timestamp=datetime.fromisoformat(job["timestamp"]),
+                players_json=json.dumps(record_data),
+                replay=encode_replay(job["details"])
+            )
+            db.session.add(record)
+            db.session.flush()
+            db.session.add_all(player_results_from_record(record, record_data))
+            db.session.add(AppliedJob(id=job["id"]))
+        db.session.commit()
+
+def on_game_results_applied(jobs):
+    # 结果入队后才从数据库加载的缓存项不含这笔分数，落库后让它们失效 (其它 worker 同样处理)
+    applied = [{"created": job["created"], "uids": [p["uid"] for p in job["players"]]} for job in jobs]
+    invalidate_stale_profiles(applied)
+    publish_cluster("results_applied", jobs=applied)
+
+def invalidate_stale_profiles(applied):
+    for job in applied:
+        for uid in job["uids"]:
+            profile = USER_CACHE.peek(uid)
+            if profile and profile["loaded_at"] >= job["created"]:
+                USER_CACHE.invalidate(uid)
+
+# 每个 worker 各自的日志目录，启动重放互不干扰
+GAME_RESULTS = WriteBehindQueue(
+    os.path.join(app.instance_path, 'pending_results' if WORKER_ID == '0' else f'pending_results_{WORKER_ID}'),
+    apply_game_results, on_game_results_applied, id_prefix=f"{WORKER_ID}-"
+)
 
 with app.app_context():
     db.create_all()
+    migrate_token_epoch()
+    migrate_replays()
+    backfill_player_results()
+    GAME_RESULTS.replay()
+    # 日志已清空，本 worker 的去重记录不再需要
+    AppliedJob.query.filter(AppliedJob.id.like(f"{WORKER_ID}-%")).delete(synchronize_session=False)
+    db.session.commit()
+
+GAME_RESULTS.start()
+atexit.register(GAME_RESULTS.flush)
+
+# 进行中对局的早期回合存档 (见 roundstore.py)，按房间 id 存放
+ROUND_STORE = RoundStore(os.path.join(app.instance_path, 'rounds' if WORKER_ID == '0' else f'rounds_{WORKER_ID}'))
+LIVE_HISTORY_ROUNDS = 1  # 房间实时状态中保留的回合数
+ROUND_HISTORY_PAGE_SIZE = 10
 
 # --- 全局状态 ---
 rooms = {} 
 SID_TO_ROOM = {}
 SID_TO_UID = {}
+SID_CODECS = {}  # sid -> 大帧使用的编码 (见 wire.py)
+UID_ROOM = {}    # uid -> 作为玩家或观战者所在的本进程房间 id，重连与改名时 O(1) 查找
+
+# --- 多进程 ---
+# 房间 id 中带有房主 worker 编号；房间内事件由 room_event 路由到房主进程处理。
+# 房间摘要与 worker 心跳登记在 BROKER 的共享表里，用于房间列表、断线重连查找与新房间分配。
+ROOM_HANDLERS = {}
+ROOM_SUMMARIES = {}  # room_id -> 本进程上次登记的摘要
+# 房间内的事件与超时按房间排队串行处理 (见 actor.py)；本地事件与转发来的事件是同一种消息
+ROOM_ACTORS = RoomActors(on_wait=ROOM_QUEUE_WAIT.observe)
+DIRTY_ROOMS = set()  # 有命令入队、需要重新快照的房间
+
+def post_room(room_id, func, *args):
+    DIRTY_ROOMS.add(room_id)
+    ROOM_ACTORS.post(room_id, func, *args)
+
+def new_room_id():
+    return f"room_{int(time.time()*1000)}_{WORKER_ID}_{random.randint(100,999)}"
+
+def room_owner(room_id):
+    if not room_id: return None
+    parts = room_id.split("_")
+    return parts[2] if len(parts) == 4 else WORKER_ID
+
+def live_workers():
+    now = time.time()
+    return {wid: w for wid, w in BROKER.hgetall('workers').items() if now - w["seen"] < WORKER_HEARTBEAT * 3}
+
+def worker_heartbeat():
+    while True:
+        BROKER.hset('workers', WORKER_ID, {"seen": time.time(), "max_rooms": MAX_ROOMS_PER_WORKER})
+        eventlet.sleep(WORKER_HEARTBEAT)
 
-BASIC_RULES = [
-    "每轮选取 0 至 100 之间的整数。",
-    "目标值为全员平均数的 X 倍 (默认为 0.8)。",
-    "最接近目标者获胜，其余玩家扣除 1 点生命。",
-    "玩家淘汰时，追加永久规则。",
-    "每回合可能触发随机限定规则。"
-]
+def room_summary(room):
+    return {
+        "id": room.id,
+        "name": room.name,
+        "count": len(room.players),
+        "phase": room.phase,
+        "worker": WORKER_ID,
+        "members": list(room.players) + list(room.spectators)
+    }
 
-PERMANENT_RULE_POOL = [
-    {"id": 1, "desc": "【冲突】若数字与他人重复，则判定为失败并扣除 1 点生命。", "type": "perm"},
-    {"id": 2, "desc": "【精准】若赢家误差小于 1，败者将扣除 2 点生命。", "type": "perm"},
-    {"id": 3, "desc": "【极值】若 0 与 100 同时出现，选 100 者直接获胜。", "type": "perm"},
-    {"id": 4, "desc": "【幽灵】已淘汰玩家的最后数字将永远参与均值计算(权重1)。", "type": "perm"},
-    {"id": 5, "desc": "【绝境】HP < 3 的玩家，其数字对均值的权重变为 3 倍。", "type": "perm"},
-    {"id": 6, "desc": "【通缉】HP 最高者若未获胜，额外扣 1 血。", "type": "perm"}
-]
+def publish_room_summary(room):
+    summary = room_summary(room)
+    if ROOM_SUMMARIES.get(room.id) != summary:
+        ROOM_SUMMARIES[room.id] = summary
+        BROKER.hset('rooms', room.id, summary)
+
+def room_summaries():
+    workers = live_workers()
+    workers[WORKER_ID] = True
+    return [s for s in BROKER.hgetall('rooms').values() if s["worker"] in workers]
+
+def pick_room_worker():
+    # 新房间放到空余容量最多的 worker；全部满员时留在本进程，由 create_room 报错
+    counts = {}
+    for s in room_summaries():
+        counts[s["worker"]] = counts.get(s["worker"], 0) + 1
+    best, best_free = WORKER_ID, MAX_ROOMS_PER_WORKER - len(rooms)
+    for wid, w in live_workers().items():
+        free = w["max_rooms"] - counts.get(wid, 0)
+        if free > best_free:
+            best, best_free = wid, free
+    return best
+
+def find_member_room(uid):
+    if uid in UID_ROOM:
+        return UID_ROOM[uid]
+    for s in room_summaries():
+        if uid in s["members"]:
+            return s["id"]
+    return None
 
-ROUND_EVENT_POOL = [
-    {"id": 101, "desc": "【混乱】你选择的数字将与其他人进行交换！", "type": "temp"},
-    {"id": 102, "desc": "【波动】本回合目标倍率发生突变！", "type": "temp"},
-    {"id": 103, "desc": "【安全】选择数字在 40-60 时 +1 HP，且本回合胜者 +1 HP！", "type": "temp"},
-    {"id": 104, "desc": "【黑暗】隐藏全员 HP，且无法看到自己选择的数字！", "type": "temp"},
-    {"id": 105, "desc": "【革命】逻辑反转！目标值变为：100 - (均值 x 倍率)！", "type": "temp"},
-    {"id": 106, "desc": "【赌徒】幸运尾数！命中幸运数字的人 +1 HP！", "type": "temp"}
-]
+def route_session(room_id, uid=None):
+    # 进入房间类事件：先在本进程记下连接所属的房间，后续事件才能直接路由到房主
+    if uid: SID_TO_UID[request.sid] = uid
+    if room_id: SID_TO_ROOM[request.sid] = room_id
+    return room_owner(room_id)
+
+def room_event(name, owner=None):
+    # owner(data) 返回应处理该事件的 worker；默认取连接当前所在房间的房主
+    def decorator(handler):
+        handler = ROOM_HANDLERS[name] = observed(name)(handler)
+        def dispatch(*args):
+            if owner:
+                target = owner(args[0] if args else None)
+            else:
+                target = room_owner(SID_TO_ROOM.get(request.sid))
+            msg = {
+                "op": "event", "event": name, "args": list(args), "sid": request.sid, "origin": WORKER_ID,
+                "uid": SID_TO_UID.get(request.sid), "room_id": SID_TO_ROOM.get(request.sid),
+                "codec": SID_CODECS.get(request.sid, "json")
+            }
+            if target is not None and target != WORKER_ID:
+                BROKER.publish(f"worker:{target}", msg)
+            elif msg["room_id"] in rooms:
+                post_room(msg["room_id"], run_room_event, msg)
+            else:
+                # 不属于任何房间的事件 (建房、大厅里的管理员登录) 没有需要串行的状态
+                return handler(*args)
+        socketio.on_event(name, dispatch)
+        return handler
+    return decorator
+
+def run_room_event(msg):
+    # 在伪造的请求上下文中执行处理函数；转发来的连接的 emit / join_room 经消息队列送达源 worker
+    sid = msg["sid"]
+    forwarded = msg["origin"] != WORKER_ID
+    if forwarded:
+        if msg["uid"]: SID_TO_UID[sid] = msg["uid"]
+        if msg["room_id"]: SID_TO_ROOM[sid] = msg["room_id"]
+        SID_CODECS[sid] = msg["codec"]
+    elif sid not in SID_CODECS:
+        return  # 排队期间连接已断开
+    try:
+        with app.test_request_context('/'):
+            request.sid = sid
+            request.namespace = '/'
+            ROOM_HANDLERS[msg["event"]](*msg["args"])
+    finally:
+        if forwarded:
+            uid, room_id = SID_TO_UID.pop(sid, None), SID_TO_ROOM.pop(sid, None)
+            SID_CODECS.pop(sid, None)
+    if forwarded and (uid, room_id) != (msg["uid"], msg["room_id"]):
+        BROKER.publish(f"worker:{msg['origin']}", {"op": "session", "sid": sid, "uid": uid, "room_id": room_id})
+
+def on_worker_message(msg):
+    sid = msg["sid"]
+    if msg["op"] == "session":
+        # 房主处理完转发的事件后回传连接所属房间的变化
+        if msg["uid"]: SID_TO_UID[sid] = msg["uid"]
+        if msg["room_id"]: SID_TO_ROOM[sid] = msg["room_id"]
+        else: SID_TO_ROOM.pop(sid, None)
+    elif msg["op"] == "event":
+        if msg["room_id"] in rooms:
+            post_room(msg["room_id"], run_room_event, msg)
+        else:
+            run_room_event(msg)
+    elif msg["op"] == "disconnect":
+        if msg["room_id"] in rooms:
+            post_room(msg["room_id"], member_disconnected, msg["room_id"], sid, msg["uid"])
+
+def publish_cluster(op, **payload):
+    BROKER.publish('cluster', dict(payload, op=op, origin=WORKER_ID))
+
+def on_cluster_message(msg):
+    # 其它 worker 发起的全局变更：同步本进程的缓存、排行榜与房间内昵称
+    if msg["origin"] == WORKER_ID: return
+    op = msg["op"]
+    if op == "user":
+        if msg["invalidate"]:
+            USER_CACHE.invalidate(msg["uid"])
+            revoke_resume_tokens(msg["uid"], msg["revoked"])
+        apply_user_change(msg["uid"], msg["score_delta"], announce=False, **msg["fields"])
+    elif op == "user_added":
+        LEADERBOARD.add(msg["uid"], msg["nickname"])
+        broadcast_leaderboard(msg["uid"], announce=False)
+    elif op == "rename":
+        rename_in_local_rooms(msg["uid"], msg["nickname"])
+    elif op == "results_applied":
+        invalidate_stale_profiles(msg["jobs"])
+
+def start_cluster():
+    BROKER.subscribe(f"worker:{WORKER_ID}", on_worker_message)
+    BROKER.subscribe('cluster', on_cluster_message)
+    BROKER.start()
+    eventlet.spawn(worker_heartbeat)
+
+# --- 用户资料缓存 ---
+# 热路径只读缓存；昵称 / 积分 / 称号 / 密码的修改同时写数据库与缓存。
+USER_CACHE = LRUCache(maxsize=int(os.environ.get('USER_CACHE_SIZE', 4096)))
+
+def profile_from_user(user):
+    return {
+        "uid": user.id, "password": user.password, "nickname": user.nickname,
+        "score": user.score or 0, "ultimate_title": user.ultimate_title,
+        "loaded_at": time.time()
+    }
 
-timer_thread = None
+def get_user_profile(uid):
+    if not uid: return None
+    profile = USER_CACHE.get(uid)
+    if profile is None:
+        with app.app_context():
+            user = db.session.get(User, uid)
+            if user:
+                profile = USER_CACHE.put(uid, profile_from_user(user))
+    return profile
+
+def update_user(uid, score_delta=0, **fields):
+    # 积分用相对更新，不会覆盖写后队列中尚未落库的分数；改密码时一并记下令牌作废时间
+    if "password" in fields:
+        fields["token_epoch"] = time.time()
+    values = dict(fields)
+    if score_delta:
+        values[User.score] = User.score + score_delta
+    if not values: return
+    with app.app_context():
+        User.query.filter_by(id=uid).update(values)
+        db.session.commit()
+    if "password" in fields:
+        revoke_resume_tokens(uid, fields["token_epoch"])
+    apply_user_change(uid, score_delta, **fields)
+    publish_user_change(uid, score_delta, **fields)
+
+def apply_user_change(uid, score_delta=0, announce=True, **fields):
+    # 同步本进程的缓存与排行榜；数据库已由发起修改的 worker 写入
+    profile = USER_CACHE.peek(uid)
+    if profile:
+        profile.update(fields)
+        profile["score"] += score_delta
+    if LEADERBOARD.update(uid, score_delta, **fields):
+        broadcast_leaderboard(uid, announce)
+
+def publish_user_change(uid, score_delta=0, **fields):
+    # 密码不经总线传播，其它 worker 直接丢弃缓存
+    public = {k: v for k, v in fields.items() if k in ("nickname", "ultimate_title")}
+    publish_cluster("user", uid=uid, score_delta=score_delta, fields=public, invalidate="password" in fields,
+                    revoked=fields.get("token_epoch"))
+
+def profile_rank_info(profile):
+    if profile["score"] >= RANK_MAX_SCORE and not profile["ultimate_title"]:
+        update_user(profile["uid"], ultimate_title=random.choice(ULTIMATE_PIG_NAMES))
+    return rank_info_for(profile["score"], profile["ultimate_title"])
+
+def profile_to_dict(profile):
+    return {
+        'uid': profile["uid"],
+        'nickname': profile["nickname"],
+        'score': profile["score"],
+        'rank_info': profile_rank_info(profile)
+    }
 
-# --- 辅助函数 ---
-def init_room_state(room_id, room_name):
+# --- 排行榜 ---
+# 启动时从 User 表重建有序索引，之后随积分 / 昵称 / 称号变化增量维护，不再查询数据库。
+LEADERBOARD_SIZE = 20
+LEADERBOARD = Leaderboard()
+with app.app_context():
+    LEADERBOARD.load(db.session.query(User.id, User.nickname, User.score, User.ultimate_title))
+
+def leaderboard_view(entry, rank):
     return {
-        "id": room_id,
-        "name": room_name,
-        "phase": "LOBBY",
-        "round": 0,
-        "timer": 0,
-        "players": {},
-        "spectators": [], # Store objects: {uid, name, likes_sent}
-        "rules": [],
-        "new_rule": None,
-        "round_event": None,
-        "multiplier": 0.8,
-        "dead_guesses": [],
-        "blind_mode": False,
-        "logs": [],
-        "last_result": {},
-        "full_history": [],
-        "config": {"max_likes": 10},
-        "kick_votes": {},
-        "pending_events": {"perm": [], "temp": None},
-        "available_perm_rules": list(PERMANENT_RULE_POOL),
-        "elimination_stack": [],
-        "basic_rules": BASIC_RULES,
-        "announcement_queue": []
+        "rank": rank,
+        "uid": entry["uid"],
+        "nickname": entry["nickname"],
+        "score": entry["score"],
+        "rank_info": rank_info_for(entry["score"], entry["ultimate_title"])
     }
 
+def leaderboard_top():
+    return [leaderboard_view(e, i + 1) for i, e in enumerate(LEADERBOARD.top(LEADERBOARD_SIZE))]
+
+LEADERBOARD_PUSHED = leaderboard_top()  # 上次推送给订阅者的前 N 名
+
+def broadcast_leaderboard(uid=None, announce=True):
+    # 只有前 N 名的可见内容变化时才推送；榜外玩家的变化直接跳过。
+    # 其它 worker 同步同一变更时 announce=False，只更新本地记录，避免重复推送
+    global LEADERBOARD_PUSHED
+    if uid is not None:
+        rank = LEADERBOARD.rank(uid)
+        if (rank is None or rank > LEADERBOARD_SIZE) and all(e["uid"] != uid for e in LEADERBOARD_PUSHED):
+            return
+    top = leaderboard_top()
+    if top != LEADERBOARD_PUSHED:
+        LEADERBOARD_PUSHED = top
+        if announce:
+            socketio.emit('leaderboard_update', {'top': top}, to='leaderboard')
+
+# --- 辅助函数 ---
 def get_room_by_sid(sid):
     room_id = SID_TO_ROOM.get(sid)
     if room_id and room_id in rooms:
         return rooms[room_id]
     return None
 
+def add_member(room, member):
+    # member 为 Player 或 Spectator；同一 uid 只登记最近进入的房间
+    if isinstance(member, Spectator):
+        room.spectators[member.uid] = member
+    else:
+        room.players[member.uid] = member
+    UID_ROOM[member.uid] = room.id
+
+def remove_member(room, uid):
+    room.players.pop(uid, None)
+    room.spectators.pop(uid, None)
+    # 离开的人不再是踢人投票的对象，已投出的票也作废
+    room.kick_votes.pop(uid, None)
+    for votes in room.kick_votes.values():
+        if uid in votes: votes.remove(uid)
+    cancel_grace(room.id, uid)
+    if UID_ROOM.get(uid) == room.id:
+        del UID_ROOM[uid]
+
+def delete_room(room_id):
+    room = rooms.pop(room_id, None)
+    if room:
+        for uid in list(room.players) + list(room.spectators):
+            if UID_ROOM.get(uid) == room_id:
+                del UID_ROOM[uid]
+    SYNC_SNAPSHOTS.pop(room_id, None)
+    VIEW_CACHE.pop(room_id, None)
+    ROOM_MEMBERS.pop(room_id, None)
+    ROUND_STORE.drop(room_id)
+    ROOM_EVENTS.discard(room_id)
+    cancel_phase_timer(room_id)
+    for key in [key for key in GRACE_TIMERS if key[0] == room_id]:
+        GRACE_TIMERS.pop(key)[1].cancel()
+    LEFT_PLAYERS.pop(room_id, None)
+    ROOM_IDLE.pop(room_id, None)
+    ROOM_SUMMARIES.pop(room_id, None)
+    BROKER.hdel('rooms', room_id)
+
+# --- 状态同步 ---
+# 每个房间维护单调递增的 rev；首次进入发送完整快照 (state_update)，
+# 之后只广播相对上一版本的补丁 (state_patch)，客户端发现缺版本时请求 request_sync。
+# 同一房间按受众 (views.py) 分别维护快照：连接加入 "<room_id>/<受众>" 频道，只收到自己受众的视图；
+# 完整视图编码一次后缓存，直到该受众的视图再次变化。
+SYNC_SNAPSHOTS = {}  # room_id -> {受众: 上次广播时的视图快照}
+VIEW_CACHE = {}      # room_id -> {(受众, 编码): 已编码的完整视图}
+ROOM_MEMBERS = {}    # room_id -> {sid: [uid, 受众, 编码]}，仅在房主进程
+ADMIN_SIDS = set()
+
+def diff_state(old, new, path, ops):
+    for key, value in new.items():
+        if key not in old:
+            ops.append(["set", path + [key], value])
+            continue
+        old_value = old[key]
+        if old_value == value:
+            continue
+        if isinstance(value, dict) and isinstance(old_value, dict):
+            diff_state(old_value, value, path + [key], ops)
+        elif isinstance(value, list) and isinstance(old_value, list) \
+                and len(value) > len(old_value) and value[:len(old_value)] == old_value:
+            ops.append(["push", path + [key], value[len(old_value):]])
+        else:
+            ops.append(["set", path + [key], value])
+    for key in old:
+        if key not in new:
+            ops.append(["del", path + [key]])
+
+def apply_state_ops(state, ops):
+    for op in ops:
+        path = op[1]
+        node = state
+        for key in path[:-1]:
+            node = node[key]
+        if op[0] == "set":
+            node[path[-1]] = deepcopy(op[2])
+        elif op[0] == "push":
+            node[path[-1]].extend(deepcopy(op[2]))
+        elif op[0] == "del":
+            del node[path[-1]]
+
+def audience_channel(room_id, audience):
+    return f"{room_id}/{audience}"
+
+def room_view(room_id, audience, codec="json"):
+    # 受众的完整视图 (已编码)；调用前房间的变更须已广播
+    cache = VIEW_CACHE.setdefault(room_id, {})
+    key = (audience, codec)
+    if key not in cache:
+        snapshots = SYNC_SNAPSHOTS.setdefault(room_id, {})
+        if audience not in snapshots:
+            snapshots[audience] = deepcopy(project_room(rooms[room_id], audience))
+        cache[key] = wire.encode_for(snapshots[audience], codec)
+    return cache[key]
+
+def join_audience(room, sid, uid):
+    if uid:
+        # 断线的成员回来了
+        cancel_grace(room.id, uid)
+        LEFT_PLAYERS.get(room.id, set()).discard(uid)
+    audience = audience_of(room, uid, sid in ADMIN_SIDS)
+    members = ROOM_MEMBERS.setdefault(room.id, {})
+    old = members.get(sid)
+    if old and old[1] != audience:
+        socketio.server.leave_room(sid, audience_channel(room.id, old[1]), namespace='/')
+    if not old or old[1] != audience:
+        socketio.server.enter_room(sid, audience_channel(room.id, audience), namespace='/')
+    members[sid] = [uid, audience, SID_CODECS.get(sid, "json")]
+    return audience
+
+def leave_audience(room_id, sid):
+    member = ROOM_MEMBERS.get(room_id, {}).pop(sid, None)
+    if member:
+        socketio.server.leave_room(sid, audience_channel(room_id, member[1]), namespace='/')
+
 def broadcast_room_state(room_id):
+    room = rooms.get(room_id)
+    if not room: return
+    publish_room_summary(room)
+
+    # 只为当前有成员的受众计算投影
+    snapshots = SYNC_SNAPSHOTS.setdefault(room_id, {})
+    members = ROOM_MEMBERS.get(room_id, {})
+    patches = {}
+    for audience in {m[1] for m in members.values()}:
+        snapshot = snapshots.get(audience)
+        if snapshot is None: continue
+        view = project_room(room, audience)
+        view["rev"] = snapshot["rev"]
+        ops = []
+        diff_state(snapshot, view, [], ops)
+        if ops: patches[audience] = ops
+
+    if patches:
+        # 未变化的受众快照停在旧版本，补丁带上 base 让客户端据此衔接
+        room.rev += 1
+        for audience, ops in patches.items():
+            snapshot = snapshots[audience]
+            socketio.emit('state_patch', {
+                "room_id": room_id, "base": snapshot["rev"], "rev": room.rev, "ops": ops
+            }, room=audience_channel(room_id, audience))
+            apply_state_ops(snapshot, ops)
+            snapshot["rev"] = room.rev
+            cache = VIEW_CACHE.get(room_id, {})
+            for key in [k for k in cache if k[0] == audience]:
+                del cache[key]
+
+    # 身份变化 (淘汰、被踢、管理员登录) 的连接换到新受众并重发完整视图
+    for sid, (uid, audience, codec) in list(members.items()):
+        new_audience = audience_of(room, uid, sid in ADMIN_SIDS)
+        if new_audience != audience:
+            join_audience(room, sid, uid)
+            socketio.emit('state_update', room_view(room_id, new_audience, codec), to=sid)
+
+def send_room_snapshot(room_id):
+    # 先把未广播的变更推给房间内其他人，保证快照的 rev 与补丁序列衔接
+    broadcast_room_state(room_id)
     if room_id in rooms:
-        socketio.emit('state_update', rooms[room_id], room=room_id)
+        audience = join_audience(rooms[room_id], request.sid, SID_TO_UID.get(request.sid))
+        emit('state_update', room_view(room_id, audience, SID_CODECS.get(request.sid, "json")))
+        emit('timer_update', {"timer": phase_time_left(room_id)})
+
+# --- 轻量事件 ---
+# 点赞、准备 / 提交 / 确认标记与表情按房间合并，每个窗口发送一帧 room_events (见 roomevents.py)。
+# 发送时把同样的值写入各受众快照，之后的 state_patch 不再重复携带这些字段。
+ROOM_EVENT_WINDOW = 0.1
+EMOTE_LIMIT = RateLimiter(rate=1, burst=3)   # 每名发送者每秒 1 个，最多连发 3 个
+LIKE_LIMIT = RateLimiter(rate=2, burst=5)
+READY_LIMIT = RateLimiter(rate=1, burst=2)
+
+def flush_room_events(room_id, batch):
+    room = rooms.get(room_id)
+    if not room: return
+    started = time.perf_counter()
+    players = {}
+    for uid, changed in batch.players.items():
+        p = room.players.get(uid)
+        if p: players[uid] = {f: getattr(p, f) for f in changed}
+    spectators = {}
+    for uid in batch.spectators:
+        s = room.spectators.get(uid)
+        if s: spectators[uid] = {"likes_sent": s.likes_sent}
+    if players or spectators:
+        for snapshot in SYNC_SNAPSHOTS.get(room_id, {}).values():
+            for uid, changes in players.items():
+                if uid in snapshot["players"]: snapshot["players"][uid].update(changes)
+            for entry in snapshot["spectators"]:
+                if entry["uid"] in spectators: entry.update(spectators[entry["uid"]])
+        VIEW_CACHE.pop(room_id, None)
+    socketio.emit('room_events', {
+        "room_id": room_id, "players": players, "spectators": spectators,
+        "likes": batch.likes, "emotes": batch.emotes
+    }, room=room_id)
+    SLOW_EVENTS.record('room_events_flush', room_id, time.perf_counter() - started)
+
+ROOM_EVENTS = RoomEventBus(ROOM_EVENT_WINDOW,
+                           lambda room_id, batch: post_room(room_id, flush_room_events, room_id, batch))
+
+# --- 大厅 ---
+# 只有停留在房间列表页的连接订阅 'lobby'；进入房间即退订。
+# 一次事件里多处调用 broadcast_room_list 会在短窗口内合并，且只推送有变化的房间。
+# 大厅订阅者经消息队列收到每个 worker 的推送，所以各 worker 只推送自己房间的增量。
+ROOM_LIST_COALESCE = 0.3
+ROOM_LIST_SENT = {}      # room_id -> 上次推送给订阅者的条目 (仅本 worker 的房间)
+ROOM_LIST_FLUSH = None   # 已排程的合并推送
+
+def room_list_entries():
+    # 房间列表汇总所有 worker 登记的摘要；房间 id 以创建时间开头，排序即创建顺序
+    for room in rooms.values():
+        publish_room_summary(room)
+    entries = {}
+    for s in sorted(room_summaries(), key=lambda s: s["id"]):
+        entries[s["id"]] = {
+            "id": s["id"],
+            "name": s["name"],
+            "count": s["count"],
+            "phase": s["phase"]
+        }
+    return entries
 
 def broadcast_room_list():
-    room_list = []
-    for rid, r in rooms.items():
-        room_list.append({
-            "id": rid,
-            "name": r["name"],
-            "count": len(r["players"]),
-            "phase": r["phase"]
-        })
-    socketio.emit('room_list_update', room_list)
+    global ROOM_LIST_FLUSH
+    if ROOM_LIST_FLUSH is None:
+        ROOM_LIST_FLUSH = eventlet.spawn_after(ROOM_LIST_COALESCE, flush_room_list)
+
+def flush_room_list():
+    global ROOM_LIST_FLUSH, ROOM_LIST_SENT
+    ROOM_LIST_FLUSH = None
+    started = time.perf_counter()
+    entries = {rid: e for rid, e in room_list_entries().items() if room_owner(rid) == WORKER_ID}
+    upsert = [e for rid, e in entries.items() if ROOM_LIST_SENT.get(rid) != e]
+    remove = [rid for rid in ROOM_LIST_SENT if rid not in entries]
+    ROOM_LIST_SENT = entries
+    if upsert or remove:
+        socketio.emit('room_list_patch', {'upsert': upsert, 'remove': remove}, to='lobby')
+    SLOW_EVENTS.record('room_list_flush', None, time.perf_counter() - started)
 
 # --- 核心逻辑 ---
 
-def apply_round_event(room, event):
-    event_copy = deepcopy(event)
-    room["round_event"] = event_copy
-    if event_copy["id"] == 102:
-        new_mult = round(random.randint(1, 20) * 0.1, 1)
-        room["multiplier"] = new_mult
-        event_copy["desc"] = f"【波动】本回合目标倍率变更为 x{new_mult} !"
-    elif event_copy["id"] == 104:
-        room["blind_mode"] = True
-    elif event_copy["id"] == 106:
-        lucky_digit = random.randint(0, 9)
-        event_copy["lucky_digit"] = lucky_digit 
-        event_copy["desc"] = f"【赌徒】幸运尾数 {lucky_digit}！选择以 {lucky_digit} 结尾数字的人，回合后 +1 HP！"
-
-def trigger_room_rule(room, new_rule, log_append="", author_name=None):
-    rule_copy = deepcopy(new_rule)
-    if author_name:
-        rule_copy["desc"] += f" (💀 {author_name})"
-    room["rules"].append(rule_copy)
-    room["announcement_queue"].append(rule_copy) 
-    room["new_rule"] = rule_copy
-    if log_append: log_append += f" | {rule_copy['desc']}"
-
 def process_announcement_queue(room_id):
     room = rooms.get(room_id)
     if not room: return
 
-    if len(room["announcement_queue"]) > 0:
-        next_rule = room["announcement_queue"].pop(0)
-        room["new_rule"] = next_rule
-        room["phase"] = "RULE_ANNOUNCEMENT"
-        room["timer"] = TIME_LIMIT_RULE
+    if len(room.announcement_queue) > 0:
+        next_rule = room.announcement_queue.pop(0)
+        room.new_rule = next_rule
+        room.phase = "RULE_ANNOUNCEMENT"
+        set_phase_timer(room, TIME_LIMIT_RULE)
     else:
         start_new_round_logic(room)
     
@@ -203,297 +924,144 @@ def start_new_round(room_id):
     if not room: return
 
     # 1. 检查管理员预设规则
-    if room["pending_events"]["perm"]:
-        for pid in room["pending_events"]["perm"]:
-            rule_obj = next((r for r in PERMANENT_RULE_POOL if r["id"] == pid), None)
-            if rule_obj:
-                if rule_obj in room["available_perm_rules"]:
-                    room["available_perm_rules"].remove(rule_obj)
-                trigger_room_rule(room, rule_obj)
-        room["pending_events"]["perm"] = []
+    apply_pending_perm_rules(room)
 
     # 2. 检查公告队列
-    if room["announcement_queue"]:
+    if room.announcement_queue:
         process_announcement_queue(room_id)
     else:
         start_new_round_logic(room)
         broadcast_room_state(room_id)
 
 def start_new_round_logic(room):
-    room["phase"] = "INPUT"
-    room["round"] += 1
-    room["timer"] = TIME_LIMIT_ROUND
-    room["multiplier"] = 0.8
-    room["round_event"] = None
-    room["blind_mode"] = False
-    
-    for p in room["players"].values():
-        p["submitted"] = False
-        p["guess"] = None
-
-    alive_count = sum(1 for p in room["players"].values() if p["alive"])
+    begin_round(room)
+    set_phase_timer(room, TIME_LIMIT_ROUND)
+
+def archive_rounds(room):
+    # 超出实时窗口的回合移入存档，房间状态与每次下发的视图不再随回合数增长
+    overflow = len(room.full_history) - LIVE_HISTORY_ROUNDS
+    if overflow > 0:
+        for entry in room.full_history[:overflow]:
+            ROUND_STORE.append(room.id, entry)
+        del room.full_history[:overflow]
+
+@timed(POINTS_DURATION)
+def calculate_points_and_save_room(room, winner_uid):
+    ranked_uids = [winner_uid] + list(reversed(room.elimination_stack))
+    ranked_uids = [u for u in ranked_uids if u]
+    total_players = len(ranked_uids)
+    points_map = {}
     
-    pending_temp_id = room["pending_events"]["temp"]
-    if pending_temp_id:
-        event = next((r for r in ROUND_EVENT_POOL if r["id"] == pending_temp_id), None)
-        if event: apply_round_event(room, event)
-        room["pending_events"]["temp"] = None
+    if 3 <= total_players <= 4:
+        for i, uid in enumerate(ranked_uids): points_map[uid] = 2 if i == 0 else 1
+    elif 5 <= total_players <= 6:
+        for i, uid in enumerate(ranked_uids): points_map[uid] = 3 if i==0 else (2 if i==1 else 1)
+    elif 7 <= total_players <= 8:
+        for i, uid in enumerate(ranked_uids): 
+            if i==0: points_map[uid]=4
+            elif i==1: points_map[uid]=3
+            elif i in [2,3]: points_map[uid]=2
+            else: points_map[uid]=1
     else:
-        if alive_count == 2 and random.random() < 0.7:
-            chaos_event = next(e for e in ROUND_EVENT_POOL if e["id"] == 101)
-            apply_round_event(room, chaos_event)
-        elif random.random() < 0.4:
-            other_events = [e for e in ROUND_EVENT_POOL if e["id"] != 101]
-            if other_events:
-                event = random.choice(other_events)
-                apply_round_event(room, event)
-
-def calculate_points_and_save_room(room, winner_uid):
-    with app.app_context():
-        ranked_uids = [winner_uid] + list(reversed(room["elimination_stack"]))
-        ranked_uids = [u for u in ranked_uids if u]
-        total_players = len(ranked_uids)
-        points_map = {}
+         for i, uid in enumerate(ranked_uids): points_map[uid] = 1 if i == 0 else 0
+
+    # 只在内存中结算分数，落库交给写后队列
+    ranked = []
+    titles = {}
+    for i, uid in enumerate(ranked_uids):
+        p = room.players.get(uid)
+        change = points_map.get(uid, 0)
         
-        if 3 <= total_players <= 4:
-            for i, uid in enumerate(ranked_uids): points_map[uid] = 2 if i == 0 else 1
-        elif 5 <= total_players <= 6:
-            for i, uid in enumerate(ranked_uids): points_map[uid] = 3 if i==0 else (2 if i==1 else 1)
-        elif 7 <= total_players <= 8:
-            for i, uid in enumerate(ranked_uids): 
-                if i==0: points_map[uid]=4
-                elif i==1: points_map[uid]=3
-                elif i in [2,3]: points_map[uid]=2
-                else: points_map[uid]=1
-        else:
-             for i, uid in enumerate(ranked_uids): points_map[uid] = 1 if i == 0 else 0
-
-        record_data = []
-        for i, uid in enumerate(ranked_uids):
-            player_data = room["players"].get(uid, {})
-            change = points_map.get(uid, 0)
-            
-            is_suicide = player_data.get("suicided", False)
-            if is_suicide:
-                hp_at_death = player_data.get("hp_at_death", 0)
-                if hp_at_death > 1:
-                    change = 0 
-            
-            user = db.session.get(User, uid)
-            if user:
-                user.score += change
-                if uid in room["players"]:
-                    room["players"][uid]["points_change"] = change
-                    room["players"][uid]["rank_info"] = user.get_rank_info()
-                    # FIX: 必须同步 score 回到内存 room 对象，否则前端进度条不更新
-                    room["players"][uid]["score"] = user.score
-                
-                record_data.append({
-                    "uid": uid,
-                    "nickname": user.nickname,
-                    "score_change": change,
-                    "new_score": user.score,
-                    "rank": user.get_rank_info(),
-                    "game_rank": i + 1, 
-                    "total_players": total_players,
-                    "is_suicide": is_suicide
-                })
-        db.session.commit()
+        is_suicide = p.suicided if p else False
+        if is_suicide:
+            if p.hp_at_death > 1:
+                change = 0 
         
-        new_record = GameRecord(
-            players_json=json.dumps(record_data),
-            details_json=json.dumps(room["full_history"])
-        )
-        db.session.add(new_record)
-        db.session.commit()
+        # 缓存中的资料比房间里的快照新；写后队列落库前先更新缓存
+        profile = USER_CACHE.peek(uid)
+        if profile:
+            profile["score"] += change
+            if profile["score"] >= RANK_MAX_SCORE and not profile["ultimate_title"]:
+                profile["ultimate_title"] = titles[uid] = random.choice(ULTIMATE_PIG_NAMES)
+        if p:
+            if profile:
+                new_score, title = profile["score"], profile["ultimate_title"]
+            else:
+                rank_info = p.rank_info or {}
+                title = rank_info.get("title") if rank_info.get("is_max") else None
+                new_score = p.score + change
+                if new_score >= RANK_MAX_SCORE and not title:
+                    title = titles[uid] = random.choice(ULTIMATE_PIG_NAMES)
+            p.points_change = change
+            p.rank_info = rank_info_for(new_score, title)
+            # FIX: 必须同步 score 回到内存 room 对象，否则前端进度条不更新
+            p.score = new_score
+
+        board_fields = {"ultimate_title": titles[uid]} if uid in titles else {}
+        LEADERBOARD.update(uid, change, **board_fields)
+        publish_user_change(uid, change, **board_fields)
+
+        ranked.append({
+            "uid": uid,
+            "score_change": change,
+            "game_rank": i + 1, 
+            "total_players": total_players,
+            "is_suicide": is_suicide
+        })
+
+    broadcast_leaderboard()
+    GAME_RESULTS.submit({
+        "created": time.time(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "players": ranked,
+        "titles": titles,
+        "details": ROUND_STORE.read(room.id) + room.full_history
+    })
 
+@timed(ROUND_DURATION)
 def calculate_round(room_id):
+    # 提交齐与输入超时都会走到这里，只有输入阶段结算，同一回合不会结算两次
     room = rooms.get(room_id)
-    if not room: return
+    if not room or room.phase != "INPUT": return
     
-    players = room["players"]
-    alive = [p for p in players.values() if p["alive"]]
+    players = room.players
+    alive = [p for p in players.values() if p.alive]
     
     if not alive: 
-        room["phase"] = "END"
+        room.phase = "END"
+        set_phase_timer(room, TIME_LIMIT_GAMEOVER)
         broadcast_room_state(room_id)
         return
 
-    guesses = []
-    for p in alive:
-        val = p["guess"]
-        if val is None: val = random.randint(0, 100)
-        guesses.append({"player": p, "val": val, "org_val": val, "source": p["name"]}) 
-    
-    log_msg = f"R{room['round']}"
-    
-    if room["round_event"] and room["round_event"]["id"] == 101 and len(guesses) > 1:
-        indices = list(range(len(guesses)))
-        is_fixed = True
-        while is_fixed:
-            random.shuffle(indices)
-            is_fixed = False
-            for i, idx in enumerate(indices):
-                if i == idx: is_fixed = True
-        original_data = [(g["val"], g["player"]["name"]) for g in guesses]
-        for i, g in enumerate(guesses):
-            g["val"] = original_data[indices[i]][0]
-            g["source"] = original_data[indices[i]][1]
-        log_msg += " | ⚡交换"
-
-    active_rule_ids = set([r["id"] for r in room["rules"]])
-    
-    is_final_duel = len(alive) <= 2
-    if is_final_duel: active_rule_ids.add(3)
-
-    total_val = 0
-    total_w = 0
-    values = []
-    for g in guesses:
-        values.append(g['val'])
-        w = 3 if (5 in active_rule_ids and g['player']['hp'] < 3) else 1
-        total_val += g['val'] * w
-        total_w += w
-    if 4 in active_rule_ids:
-        for ghost_val in room["dead_guesses"]:
-            total_val += ghost_val
-            total_w += 1
-            
-    avg = total_val / total_w if total_w else 0
-    target = avg * room["multiplier"]
-    if room["round_event"] and room["round_event"]["id"] == 105:
-        target = 100 - target
-        log_msg += f": 革命! {target:.2f}"
-    else:
-        log_msg += f": 均值 {avg:.2f} -> 目标 {target:.2f}"
+    finished, winner_uid = resolve_room_round(room)
+    archive_rounds(room)
+    room.phase = "RESULT"
+    set_phase_timer(room, TIME_LIMIT_RESULT)
 
-    winners = []
-    base_damage = 1
-    
-    rule3_triggered = False
-    if 3 in active_rule_ids and 0 in values and 100 in values:
-        winners = [g["player"] for g in guesses if g["val"] == 100]
-        rule3_triggered = True
-        log_msg += " | 极值(100胜)"
-
-    if not rule3_triggered:
-        candidates = guesses[:]
-        if 1 in active_rule_ids:
-            counts = {x: values.count(x) for x in values}
-            if any(c > 1 for c in counts.values()): log_msg += " | 冲突"
-            candidates = [g for g in candidates if counts[g['val']] == 1]
-        
-        if not candidates: winners = []
-        else:
-            candidates.sort(key=lambda x: abs(x['val'] - target))
-            min_diff = abs(candidates[0]['val'] - target)
-            winners = [x['player'] for x in candidates if abs(x['val'] - target) == min_diff]
-            if 2 in active_rule_ids and min_diff < 1: 
-                base_damage = 2
-                log_msg += " | 精准"
-
-    max_hp_val = max(p['hp'] for p in alive) if 6 in active_rule_ids and alive else -999
-
-    round_details = []
-    for p in alive:
-        pg = next(g for g in guesses if g['player'] == p)
-        is_winner = p in winners
-        actual_dmg = 0
-        
-        if is_winner:
-            if room["round_event"] and room["round_event"]["id"] == 103:
-                p["hp"] = min(MAX_HP, p["hp"] + 1)
-        else:
-            actual_dmg = base_damage
-            if room["round_event"] and room["round_event"]["id"] == 103 and 40 <= pg["val"] <= 60:
-                actual_dmg = 0
-            if 6 in active_rule_ids and p['hp'] == max_hp_val:
-                actual_dmg += 1
-            p["hp"] -= actual_dmg
-        
-        if room["round_event"] and room["round_event"]["id"] == 106:
-            lucky = room["round_event"].get("lucky_digit")
-            if lucky is not None and pg["val"] % 10 == lucky:
-                p["hp"] = min(MAX_HP, p["hp"] + 1)
-
-        p["last_dmg"] = actual_dmg
-        p["is_winner"] = is_winner
-        round_details.append({
-            "uid": p["uid"], "name": p["name"], "val": pg["val"],
-            "org_val": pg["org_val"], "source": pg["source"], 
-            "hp": p["hp"], "dmg": actual_dmg, "win": is_winner
-        })
-
-    active_rules_desc = []
-    for rid in active_rule_ids:
-        rdef = next((r for r in PERMANENT_RULE_POOL if r["id"] == rid), None)
-        if rdef:
-            desc = rdef["desc"]
-            if rid == 3 and is_final_duel: desc = "【极值(决战强制)】0 与 100 同时出现，选 100 者直接获胜。"
-            room_rule = next((r for r in room["rules"] if r["id"] == rid), None)
-            if room_rule: desc = room_rule["desc"]
-            active_rules_desc.append(desc)
-    
-    room["full_history"].append({
-        "round_num": room["round"], "target": round(target, 2), "avg": round(avg, 2),
-        "event_desc": room["round_event"]["desc"] if room["round_event"] else None,
-        "active_rules": active_rules_desc, "player_data": round_details
-    })
-
-    newly_dead = [p for p in players.values() if p["hp"] <= 0 and p["alive"]]
-    current_alive_count = sum(1 for p in players.values() if p["hp"] > 0)
-    
-    for p in newly_dead:
-        p["alive"] = False
-        dead_val = next((d['val'] for d in round_details if d['name'] == p['name']), 0)
-        room["dead_guesses"].append(dead_val)
-        if p["uid"] not in room["elimination_stack"]:
-            room["elimination_stack"].append(p["uid"])
-
-    # 规则触发
-    if newly_dead:
-        if current_alive_count == 2:
-            rule_3 = next((r for r in room["available_perm_rules"] if r["id"] == 3), None)
-            if rule_3:
-                room["available_perm_rules"].remove(rule_3)
-                trigger_room_rule(room, rule_3, author_name="System")
-        
-        if room["available_perm_rules"] and not (current_alive_count==2 and rule_3):
-             idx = random.randint(0, len(room["available_perm_rules"]) - 1)
-             new_rule = room["available_perm_rules"].pop(idx)
-             trigger_room_rule(room, new_rule)
-
-    room["last_result"] = {
-        "avg": round(avg, 2), "target": round(target, 2), "details": round_details, "log": log_msg
-    }
-    room["logs"].insert(0, log_msg)
-    room["phase"] = "RESULT"
-    room["timer"] = TIME_LIMIT_RESULT
-
-    if current_alive_count <= 1:
-        winner_uid = None
-        if current_alive_count == 1:
-            winner = next((p for p in players.values() if p["alive"]), None)
-            if winner: winner_uid = winner["uid"]
+    if finished:
         calculate_points_and_save_room(room, winner_uid)
-        room["phase"] = "END"
-        room["timer"] = TIME_LIMIT_GAMEOVER
+        room.phase = "END"
+        set_phase_timer(room, TIME_LIMIT_GAMEOVER)
         broadcast_room_list()
     
     broadcast_room_state(room_id)
+    if finished:
+        # 分数已入写后队列，立即快照，避免重启后从结束前的状态重打最后一回合、重复计分
+        SNAPSHOT_READY[room_id] = room_snapshot(room)
+        SNAPSHOT_WAKE.put(None)
 
 def handle_timeout(room_id):
     room = rooms.get(room_id)
     if not room: return
-    if room["phase"] == "PRE_GAME": start_new_round(room_id)
-    elif room["phase"] == "RULE_ANNOUNCEMENT": process_announcement_queue(room_id)
-    elif room["phase"] == "INPUT": calculate_round(room_id)
-    elif room["phase"] == "RESULT":
-        if len(room["announcement_queue"]) > 0:
+    if room.phase == "PRE_GAME": start_new_round(room_id)
+    elif room.phase == "RULE_ANNOUNCEMENT": process_announcement_queue(room_id)
+    elif room.phase == "INPUT": calculate_round(room_id)
+    elif room.phase == "RESULT":
+        if len(room.announcement_queue) > 0:
              process_announcement_queue(room_id)
         else:
              start_new_round(room_id)
-    elif room["phase"] == "END": perform_reset(room_id)
+    elif room.phase == "END": perform_reset(room_id)
 
 def check_all_ready(room_id):
     broadcast_room_state(room_id)
@@ -503,19 +1071,15 @@ def start_pre_game(room_id):
     room = rooms.get(room_id)
     if not room: return
     
-    room["elimination_stack"] = []
-    for p in room["players"].values():
-        p["confirmed"] = False
-        p["points_change"] = 0
-    
-    room["phase"] = "PRE_GAME"
-    room["round"] = 0
-    room["timer"] = TIME_LIMIT_PREGAME
+    room.elimination_stack = []
+    ROUND_STORE.drop(room_id)
+    for p in room.players.values():
+        p.confirmed = False
+        p.points_change = 0
     
-    global timer_thread
-    if not timer_thread:
-        timer_thread = threading.Thread(target=background_timer, daemon=True)
-        timer_thread.start()
+    room.phase = "PRE_GAME"
+    room.round = 0
+    set_phase_timer(room, TIME_LIMIT_PREGAME)
         
     broadcast_room_state(room_id)
     broadcast_room_list() 
@@ -523,57 +1087,280 @@ def start_pre_game(room_id):
 def check_all_submitted(room_id):
     room = rooms.get(room_id)
     if not room: return
-    alive = [p for p in room["players"].values() if p["alive"]]
+    alive = [p for p in room.players.values() if p.alive]
     if not alive: return
-    if all(p["submitted"] for p in alive):
+    if all(p.submitted for p in alive):
         calculate_round(room_id)
 
 def check_all_confirmed(room_id):
+    # 规则确认只在开局前；倒计时已经开局后迟到的确认不再开新回合
     room = rooms.get(room_id)
-    if not room: return
-    alive = [p for p in room["players"].values() if p["alive"]]
+    if not room or room.phase != "PRE_GAME": return
+    alive = [p for p in room.players.values() if p.alive]
     if not alive: return
-    if all(p.get("confirmed", False) for p in alive):
+    if all(p.confirmed for p in alive):
         start_new_round(room_id)
 
 def perform_reset(room_id):
     room = rooms.get(room_id)
     if not room: return
-    current_config = room["config"]
-    current_spectators = room["spectators"]
-    for p in room["players"].values():
-        p.update({
-            "hp": MAX_HP, "alive": True, "guess": None, "submitted": False,
-            "confirmed": False, "ready": False, "last_dmg": 0, "is_winner": False,
-            "likes": 0, "likes_sent": 0, "points_change": 0,
-            "suicided": False, "hp_at_death": 0
-        })
-    room.update({
-        "phase": "LOBBY", "round": 0, "rules": [], "logs": [],
-        "new_rule": None, "round_event": None, "multiplier": 0.8,
-        "dead_guesses": [], "blind_mode": False, "full_history": [],
-        "kick_votes": {}, "pending_events": {"perm": [], "temp": None},
-        "available_perm_rules": list(PERMANENT_RULE_POOL),
-        "elimination_stack": [], "config": current_config,
-        "basic_rules": BASIC_RULES,
-        "spectators": current_spectators,
-        "announcement_queue": []
+    reset_room_state(room)
+    ROUND_STORE.drop(room_id)
+    cancel_phase_timer(room_id)
+    # 对局中断线且没有回来的玩家随回到大厅离开房间
+    online = connected_uids(room_id)
+    for uid in LEFT_PLAYERS.pop(room_id, ()):
+        if uid not in online: remove_member(room, uid)
+    if not room.players:
+        delete_room(room_id)
+    else:
+        broadcast_room_state(room_id)
+    broadcast_room_list()
+
+# --- 阶段计时 ---
+# 每个房间一个按单调时钟截止的 hub 定时器，阶段切换时发送一次剩余时间，客户端本地倒计时。
+# 到期时只向房间队列投递超时命令；命令带着计时器编号，排队期间阶段已切换 (计时器被替换或取消) 的超时直接丢弃。
+ROOM_TIMERS = {}  # room_id -> (deadline, GreenThread, 编号)
+TIMER_SEQ = itertools.count(1)
+
+def set_phase_timer(room, seconds):
+    room_id = room.id
+    cancel_phase_timer(room_id)
+    room.timer = seconds
+    seq = next(TIMER_SEQ)
+    ROOM_TIMERS[room_id] = (time.monotonic() + seconds,
+                            eventlet.spawn_after(seconds, post_room, room_id, on_phase_timeout, room_id, seq),
+                            seq)
+    socketio.emit('timer_update', {"timer": seconds}, room=room_id)
+
+def cancel_phase_timer(room_id):
+    entry = ROOM_TIMERS.pop(room_id, None)
+    if entry: entry[1].cancel()
+
+def phase_time_left(room_id):
+    entry = ROOM_TIMERS.get(room_id)
+    return max(0, entry[0] - time.monotonic()) if entry else 0
+
+def on_phase_timeout(room_id, seq):
+    entry = ROOM_TIMERS.get(room_id)
+    if not entry or entry[2] != seq: return
+    del ROOM_TIMERS[room_id]
+    TIMER_LAG.observe(max(0, time.monotonic() - entry[0]))
+    started = time.perf_counter()
+    handle_timeout(room_id)
+    elapsed = time.perf_counter() - started
+    TIMER_DURATION.observe(elapsed)
+    SLOW_EVENTS.record('phase_timeout', room_id, elapsed)
+
+# --- 房间快照 ---
+# 进行中的房间定期增量写入快照 (见 snapshots.py)，重启后恢复，客户端经 identify / reconnect_room 回到房间。
+# 快照命令经房间队列执行，总在两条命令之间读取房间，不会读到处理了一半的状态；编码好的行在下一轮写入。
+SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', 1))
+RESTORE_MIN_TIMER = 5  # 恢复后阶段计时至少保留的秒数，留给客户端重连
+ROOM_SNAPSHOTS = SnapshotLog(os.path.join(app.instance_path, 'rooms.jsonl' if WORKER_ID == '0' else f'rooms_{WORKER_ID}.jsonl'))
+SNAPSHOT_READY = {}  # room_id -> 已编码待写入的行，None 表示房间已删除
+SNAPSHOT_WAKE = LightQueue()
+
+def room_snapshot(room):
+    record = room.to_record()
+    record["archived"] = ROUND_STORE.count(room.id)
+    record["timer_left"] = phase_time_left(room.id) if room.id in ROOM_TIMERS else None
+    record["saved_at"] = time.time()
+    return ROOM_SNAPSHOTS.encode(record)
+
+def capture_snapshot(room_id):
+    room = rooms.get(room_id)
+    SNAPSHOT_READY[room_id] = room_snapshot(room) if room else None
+
+def snapshot_loop():
+    global SNAPSHOT_READY
+    while True:
+        try:
+            SNAPSHOT_WAKE.get(timeout=SNAPSHOT_INTERVAL)
+        except Empty:
+            pass
+        ready, SNAPSHOT_READY = SNAPSHOT_READY, {}
+        try:
+            ROOM_SNAPSHOTS.write(ready)
+        except OSError:
+            LOG.exception("room snapshot write failed")
+        for room_id in DIRTY_ROOMS:
+            if room_id in rooms:
+                ROOM_ACTORS.post(room_id, capture_snapshot, room_id)
+            else:
+                SNAPSHOT_READY[room_id] = None
+        DIRTY_ROOMS.clear()
+
+def flush_snapshots():
+    # 关停时同步写入所有未写的变化
+    for room_id in DIRTY_ROOMS:
+        capture_snapshot(room_id)
+    DIRTY_ROOMS.clear()
+    ROOM_SNAPSHOTS.write(SNAPSHOT_READY, block=True)
+    SNAPSHOT_READY.clear()
+
+def restore_rooms():
+    # 启动时恢复快照中的房间；停机期间照常计时，但至少留出 RESTORE_MIN_TIMER 秒
+    started = time.perf_counter()
+    records = ROOM_SNAPSHOTS.load()
+    ROUND_STORE.recover({room_id: record.get("archived", 0) for room_id, record in records.items()})
+    for record in records.values():
+        room = Room.from_record(record)
+        compile_room_rules(room)
+        rooms[room.id] = room
+        for uid in list(room.players) + list(room.spectators):
+            UID_ROOM[uid] = room.id
+            start_grace(room.id, uid)  # 重连宽限从恢复时算起
+        if record.get("timer_left") is not None:
+            left = record["timer_left"] - max(0, time.time() - record["saved_at"])
+            set_phase_timer(room, max(RESTORE_MIN_TIMER, math.ceil(left)))
+        publish_room_summary(room)
+    if records:
+        LOG.info("restored %d rooms in %.1fms", len(records), (time.perf_counter() - started) * 1000)
+
+# --- 会话恢复 ---
+# 登录成功时签发带过期时间的恢复令牌；断线重连时客户端发送 resume，服务器只校验签名与时间，
+# 资料取自缓存或排行榜，房间经 UID_ROOM 找回：不查数据库、不扫描房间，大量连接同时重连时开销不随人数增长。
+RESUME_TOKEN_TTL = int(os.environ.get('RESUME_TOKEN_TTL', 12 * 3600))
+# 公开的默认密钥谁都能签出任意用户的令牌，这时不签发也不接受令牌，客户端退回密码登录
+if app.config['SECRET_KEY'] == DEFAULT_SECRET_KEY:
+    LOG.warning("SECRET_KEY is the public default; resume tokens are disabled")
+    RESUME_TOKENS = None
+else:
+    RESUME_TOKENS = URLSafeTimedSerializer(app.config['SECRET_KEY'], salt='resume')
+# 令牌里带着签发时该用户的作废时间 (签名时间只精确到秒，同一秒内改密码也要区分新旧令牌)。
+# 作废时间存在 User.token_epoch，启动时把改过密码的用户载入内存，校验时不查数据库
+with app.app_context():
+    TOKENS_REVOKED = dict(db.session.query(User.id, User.token_epoch).filter(User.token_epoch > 0))
+
+def issue_resume_token(uid):
+    if RESUME_TOKENS is None: return None
+    return RESUME_TOKENS.dumps([uid, TOKENS_REVOKED.get(uid, 0)])
+
+def verify_resume_token(token):
+    # 有效时返回 uid
+    if RESUME_TOKENS is None: return None
+    try:
+        uid, epoch = RESUME_TOKENS.loads(token, max_age=RESUME_TOKEN_TTL)
+    except (BadData, TypeError, ValueError):
+        return None
+    if not isinstance(uid, str) or epoch < TOKENS_REVOKED.get(uid, 0):
+        return None
+    return uid
+
+def revoke_resume_tokens(uid, at):
+    # 其它 worker 沿用发起修改的 worker 写入数据库的时间，之后各处签发的令牌一致
+    TOKENS_REVOKED[uid] = at
+
+def route_resume(data):
+    # 房间在本进程时直接用 UID_ROOM；否则按客户端记得的房间 id 找房主，缺省时才查共享表
+    uid = verify_resume_token(data.get('token'))
+    if not uid: return None
+    room_id = UID_ROOM.get(uid) or data.get('room_id') or find_member_room(uid)
+    return route_session(room_id, uid)
+
+def reattach(uid):
+    # 把当前连接接回 uid 所在的房间，发送完整视图与剩余时间；不在房间里时返回 False
+    room = rooms.get(UID_ROOM.get(uid))
+    if not room: return False
+    is_spectator = uid not in room.players
+    SID_TO_ROOM[request.sid] = room.id
+    join_room(room.id)
+    leave_room('lobby')
+    broadcast_room_state(room.id)
+    audience = join_audience(room, request.sid, uid)
+    # 输入阶段的视图不含数字，自己已提交的数字单独下发
+    guess = room.players[uid].guess if not is_spectator else None
+    emit('reconnect_room', {
+        'room': room_view(room.id, audience, SID_CODECS.get(request.sid, "json")),
+        'is_spectator': is_spectator, 'guess': guess
     })
-    broadcast_room_state(room_id)
+    emit('timer_update', {"timer": phase_time_left(room.id)})
+    return True
+
+# --- 连接生命周期与回收 ---
+# 断开的连接立即从各登记表移除；房间成员表在房主进程，经房间队列清理。
+# 最后一个连接断开的成员有 RECONNECT_GRACE 秒的宽限：观战者与大厅里的玩家到期后离开房间，
+# 对局中的玩家留到本局结束、房间重置回大厅时再移除。没有任何在线连接超过 ROOM_IDLE_TTL 的房间整体回收。
+RECONNECT_GRACE = int(os.environ.get('RECONNECT_GRACE', 60))
+ROOM_IDLE_TTL = int(os.environ.get('ROOM_IDLE_TTL', 600))
+ROOM_REAP_INTERVAL = 30
+GRACE_TIMERS = {}   # (room_id, uid) -> (deadline, GreenThread)
+LEFT_PLAYERS = {}   # room_id -> 宽限已过、等待本局结束后移除的玩家
+ROOM_IDLE = {}      # room_id -> 开始无人在线的时间 (单调时钟)
+
+def connected_uids(room_id):
+    return {member[0] for member in ROOM_MEMBERS.get(room_id, {}).values()}
+
+def start_grace(room_id, uid):
+    cancel_grace(room_id, uid)
+    GRACE_TIMERS[(room_id, uid)] = (time.monotonic() + RECONNECT_GRACE,
+                                    eventlet.spawn_after(RECONNECT_GRACE, post_room, room_id, grace_expired, room_id, uid))
+
+def cancel_grace(room_id, uid):
+    entry = GRACE_TIMERS.pop((room_id, uid), None)
+    if entry: entry[1].cancel()
+
+def member_disconnected(room_id, sid, uid):
+    leave_audience(room_id, sid)
+    ADMIN_SIDS.discard(sid)  # 转发来的管理员连接登记在房主进程
+    room = rooms.get(room_id)
+    if room and uid and room.has_member(uid) and uid not in connected_uids(room_id):
+        start_grace(room_id, uid)
+
+def grace_expired(room_id, uid):
+    # 排队期间重新开始的宽限 (截止时间未到) 不算到期
+    entry = GRACE_TIMERS.get((room_id, uid))
+    if not entry or entry[0] > time.monotonic(): return
+    del GRACE_TIMERS[(room_id, uid)]
+    room = rooms.get(room_id)
+    if not room or uid in connected_uids(room_id): return
+    if uid in room.players and room.phase != "LOBBY":
+        LEFT_PLAYERS.setdefault(room_id, set()).add(uid)
+        return
+    remove_member(room, uid)
+    if not room.players and room.phase == "LOBBY":
+        delete_room(room_id)
+    else:
+        broadcast_room_state(room_id)
     broadcast_room_list()
 
-def background_timer():
+def reap_idle_rooms():
     while True:
-        eventlet.sleep(1)
-        for room_id in list(rooms.keys()):
-            room = rooms.get(room_id)
-            if not room: continue
-            if room["phase"] in ["PRE_GAME", "INPUT", "RULE_ANNOUNCEMENT", "END", "RESULT"]:
-                if room["timer"] > 0:
-                    room["timer"] -= 1
-                    socketio.emit('timer_update', {"timer": room["timer"]}, room=room_id)
-                else:
-                    handle_timeout(room_id)
+        eventlet.sleep(ROOM_REAP_INTERVAL)
+        now = time.monotonic()
+        for room_id in list(rooms):
+            if ROOM_MEMBERS.get(room_id):
+                ROOM_IDLE.pop(room_id, None)
+            elif now - ROOM_IDLE.setdefault(room_id, now) >= ROOM_IDLE_TTL:
+                post_room(room_id, reap_room, room_id)
+
+def reap_room(room_id):
+    if room_id in rooms and not ROOM_MEMBERS.get(room_id):
+        delete_room(room_id)
+        broadcast_room_list()
+
+def session_table_sizes():
+    return {
+        "sid_to_room": len(SID_TO_ROOM), "sid_to_uid": len(SID_TO_UID), "sid_codecs": len(SID_CODECS),
+        "admin_sids": len(ADMIN_SIDS), "uid_room": len(UID_ROOM),
+        "room_members": sum(len(members) for members in ROOM_MEMBERS.values()),
+        "grace_timers": len(GRACE_TIMERS), "left_players": sum(len(uids) for uids in LEFT_PLAYERS.values()),
+        "idle_rooms": len(ROOM_IDLE), "room_actors": len(ROOM_ACTORS.actors),
+        "rate_limit_keys": sum(len(l.buckets) for l in (EMOTE_LIMIT, LIKE_LIMIT, READY_LIMIT)),
+    }
+
+def room_memory(room):
+    # 房间状态及其同步快照、视图缓存的近似字节数；多个房间共享的结算流水线不计入
+    return {
+        "id": room.id, "name": room.name, "phase": room.phase,
+        "players": len(room.players), "spectators": len(room.spectators),
+        "connections": len(ROOM_MEMBERS.get(room.id, {})),
+        "state_bytes": deep_sizeof(room, skip=(room.pipeline,)),
+        "sync_bytes": deep_sizeof(SYNC_SNAPSHOTS.get(room.id)),
+        "view_cache_bytes": deep_sizeof(VIEW_CACHE.get(room.id)),
+        "archived_rounds": ROUND_STORE.count(room.id),
+    }
 
 # --- Events ---
 
@@ -581,114 +1368,149 @@ def background_timer():
 def index():
     return render_template('index.html')
 
-@socketio.on('login')
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@socket_event('connect')
+def on_connect(auth=None):
+    # 客户端在连接参数里声明支持的编码；服务器缺少 msgpack 时退回 JSON
+    SID_CODECS[request.sid] = wire.negotiate(request.args.get('codec'))
+
+@socket_event('disconnect')
+def on_disconnect():
+    sid = request.sid
+    SID_CODECS.pop(sid, None)
+    ADMIN_SIDS.discard(sid)
+    uid, room_id = SID_TO_UID.pop(sid, None), SID_TO_ROOM.pop(sid, None)
+    if not room_id: return
+    owner = room_owner(room_id)
+    if owner != WORKER_ID:
+        BROKER.publish(f"worker:{owner}", {"op": "disconnect", "sid": sid, "uid": uid, "room_id": room_id})
+    elif room_id in rooms:
+        post_room(room_id, member_disconnected, room_id, sid, uid)
+
+@socket_event('login')
 def on_login(data):
     uid = data.get('uid')
     password = data.get('password')
     nickname = data.get('nickname', uid) 
     if not uid or not password: return
-    with app.app_context():
-        user = db.session.get(User, uid)
-        if user:
-            if user.password == password:
-                emit('login_result', {'success': True, 'is_new': False, 'user': user.to_dict()})
-            else:
-                emit('login_result', {'success': False, 'msg': '密码错误'})
+    profile = get_user_profile(uid)
+    if profile:
+        if profile["password"] == password:
+            emit('login_result', {'success': True, 'is_new': False, 'user': profile_to_dict(profile),
+                                  'resume_token': issue_resume_token(uid)})
         else:
-            new_user = User(id=uid, password=password, nickname=nickname)
+            emit('login_result', {'success': False, 'msg': '密码错误'})
+    else:
+        with app.app_context():
+            new_user = User(id=uid, password=password, nickname=nickname, score=0)
             db.session.add(new_user)
             db.session.commit()
-            emit('login_result', {'success': True, 'is_new': True, 'user': new_user.to_dict()})
+            profile = USER_CACHE.put(uid, profile_from_user(new_user))
+        LEADERBOARD.add(uid, profile["nickname"])
+        broadcast_leaderboard(uid)
+        publish_cluster("user_added", uid=uid, nickname=profile["nickname"])
+        emit('login_result', {'success': True, 'is_new': True, 'user': profile_to_dict(profile),
+                              'resume_token': issue_resume_token(uid)})
+
+def rename_in_rooms(uid, new_nick):
+    rename_in_local_rooms(uid, new_nick)
+    publish_cluster("rename", uid=uid, nickname=new_nick)
+
+def rename_in_local_rooms(uid, new_nick):
+    room_id = UID_ROOM.get(uid)
+    if room_id in rooms:
+        post_room(room_id, rename_member, room_id, uid, new_nick)
+
+def rename_member(room_id, uid, new_nick):
+    room = rooms.get(room_id)
+    member = room and (room.players.get(uid) or room.spectators.get(uid))
+    if not member: return
+    member.name = new_nick
+    broadcast_room_state(room.id)
 
-@socketio.on('set_nickname')
+@socket_event('set_nickname')
 def on_set_nickname(data):
     uid = data.get('uid')
     new_nick = data.get('nickname')
-    with app.app_context():
-        user = db.session.get(User, uid)
-        if user:
-            user.nickname = new_nick
-            db.session.commit()
-            emit('nickname_updated', {'user': user.to_dict()})
-            
-            for room in rooms.values():
-                if uid in room["players"]:
-                    room["players"][uid]["name"] = new_nick
-                    broadcast_room_state(room["id"])
-                    break
-                # Update spectator name as well
-                for spec in room["spectators"]:
-                    if spec["uid"] == uid:
-                        spec["name"] = new_nick
-                        broadcast_room_state(room["id"])
-                        break
-
-@socketio.on('change_nickname')
+    profile = get_user_profile(uid)
+    if profile:
+        update_user(uid, nickname=new_nick)
+        emit('nickname_updated', {'user': profile_to_dict(profile)})
+        rename_in_rooms(uid, new_nick)
+
+@socket_event('change_nickname')
 def on_change_nickname(data):
     uid = data.get('uid')
     new_nick = data.get('new_nick')
-    with app.app_context():
-        user = db.session.get(User, uid)
-        if user and user.score >= 1:
-            user.score -= 1
-            user.nickname = new_nick
-            db.session.commit()
-            emit('reroll_success', {'user': user.to_dict()})
-            
-            for room in rooms.values():
-                if uid in room["players"]:
-                    room["players"][uid]["name"] = new_nick
-                    broadcast_room_state(room["id"])
-                    break
-                # Update spectator name
-                for spec in room["spectators"]:
-                    if spec["uid"] == uid:
-                        spec["name"] = new_nick
-                        broadcast_room_state(room["id"])
-                        break
-        else:
-            emit('error_msg', {'msg': '积分不足'})
+    profile = get_user_profile(uid)
+    if profile and profile["score"] >= 1:
+        update_user(uid, score_delta=-1, nickname=new_nick)
+        emit('reroll_success', {'user': profile_to_dict(profile)})
+        rename_in_rooms(uid, new_nick)
+    else:
+        emit('error_msg', {'msg': '积分不足'})
 
-@socketio.on('change_password')
+@socket_event('change_password')
 def on_change_password(data):
     uid = data.get('uid')
     new_pwd = data.get('new_password')
-    with app.app_context():
-        user = db.session.get(User, uid)
-        if user:
-            user.password = new_pwd
-            db.session.commit()
-            emit('password_changed', {'success': True})
+    if get_user_profile(uid):
+        update_user(uid, password=new_pwd)
+        # 旧令牌随密码作废，当前连接换发新令牌
+        emit('password_changed', {'success': True, 'resume_token': issue_resume_token(uid)})
 
-@socketio.on('get_room_list')
+@socket_event('get_room_list')
 def on_get_room_list():
-    broadcast_room_list()
+    # 订阅大厅：先发完整列表，之后只收合并后的增量
+    join_room('lobby')
+    emit('room_list_update', list(room_list_entries().values()))
+
+@socket_event('leave_lobby')
+def on_leave_lobby():
+    leave_room('lobby')
 
-@socketio.on('create_room')
+@room_event('create_room', owner=lambda data: pick_room_worker())
 def on_create_room(data):
-    if len(rooms) >= MAX_ROOMS:
+    if len(rooms) >= MAX_ROOMS_PER_WORKER:
         emit('error_msg', {'msg': '房间数量已达上限'})
         return
     room_name = data.get('name', 'Room')
-    room_id = f"room_{int(time.time()*1000)}_{random.randint(100,999)}"
+    room_id = new_room_id()
     rooms[room_id] = init_room_state(room_id, room_name)
-    global timer_thread
-    if not timer_thread:
-        timer_thread = threading.Thread(target=background_timer, daemon=True)
-        timer_thread.start()
+    DIRTY_ROOMS.add(room_id)
     broadcast_room_list()
     emit('room_created', {'room_id': room_id})
 
-@socketio.on('join_room')
+def reject_join(msg=None):
+    # route_session 为了路由预先记下了房间；加入被拒时撤销，连接仍留在大厅
+    SID_TO_ROOM.pop(request.sid, None)
+    if msg: emit('error_msg', {'msg': msg})
+
+@room_event('join_room', owner=lambda data: route_session(data.get('room_id'), data.get('uid')))
 def on_join_room_req(data):
     room_id = data.get('room_id')
     uid = data.get('uid')
     is_spectator = data.get('is_spectator', False)
     
-    if room_id not in rooms: return
+    if room_id not in rooms:
+        reject_join()
+        return
     room = rooms[room_id]
-    
+
+    if not is_spectator and uid not in room.players:
+        if len(room.players) >= MAX_PLAYERS: 
+            reject_join('房间已满')
+            return
+        if room.phase != "LOBBY": 
+            reject_join('游戏进行中')
+            return
+
+    # 检查都通过后才切换订阅、记下连接所属的房间
     join_room(room_id)
+    leave_room('lobby')
     SID_TO_ROOM[request.sid] = room_id
     SID_TO_UID[request.sid] = uid
     
@@ -696,243 +1518,242 @@ def on_join_room_req(data):
     display_name = uid
     rank_info = {"title": "Unknown", "icon": "❓", "class": "text-gray-500", "is_max": False}
     current_score = 0
-    with app.app_context():
-        user = db.session.get(User, uid)
-        if user: 
-            rank_info = user.get_rank_info()
-            display_name = user.nickname
-            current_score = user.score
+    profile = get_user_profile(uid)
+    if profile: 
+        rank_info = profile_rank_info(profile)
+        display_name = profile["nickname"]
+        current_score = profile["score"]
 
     if is_spectator:
-        # FIX: 观战者存储为对象，包含名字
-        if not any(s['uid'] == uid for s in room["spectators"]):
-             room["spectators"].append({'uid': uid, 'name': display_name, 'likes_sent': 0})
+        if uid not in room.spectators:
+            add_member(room, new_spectator(uid, display_name))
         emit('joined_room_success', {'room_id': room_id, 'is_spectator': True})
-        broadcast_room_state(room_id)
+        send_room_snapshot(room_id)
         return
 
-    if uid in room["players"]:
-        pass # Reconnect
-    else:
-        if len(room["players"]) >= MAX_PLAYERS: 
-            emit('error_msg', {'msg': '房间已满'})
-            return
-        if room["phase"] != "LOBBY": 
-            emit('error_msg', {'msg': '游戏进行中'})
-            return
-
-    if uid not in room["players"]:
-        room["players"][uid] = {
-            "uid": uid, "name": display_name, "hp": MAX_HP, "alive": True,
-            "guess": None, "submitted": False, "confirmed": False, "ready": False,
-            "last_dmg": 0, "is_winner": False, "likes": 0, "likes_sent": 0,
-            "rank_info": rank_info, "points_change": 0,
-            "suicided": False, "hp_at_death": 0,
-            "score": current_score # FIX: 增加 score 字段到房间数据
-        }
+    if uid not in room.players:
+        add_member(room, new_player(uid, display_name, rank_info, current_score))
     
     emit('joined_room_success', {'room_id': room_id, 'is_spectator': False})
-    broadcast_room_state(room_id)
+    send_room_snapshot(room_id)
     broadcast_room_list()
 
-@socketio.on('identify')
+@room_event('identify', owner=lambda data: route_session(find_member_room(data.get('uid')), data.get('uid')))
 def on_identify(data):
     uid = data.get('uid')
     if uid:
         SID_TO_UID[request.sid] = uid
-        found_room = None
-        is_spectator = False
-        for room in rooms.values():
-            if uid in room["players"]:
-                found_room = room
-                is_spectator = False
-                break
-            # 查找对象列表
-            if any(s['uid'] == uid for s in room["spectators"]):
-                found_room = room
-                is_spectator = True
-                break
-        
-        if found_room:
-            SID_TO_ROOM[request.sid] = found_room["id"]
-            join_room(found_room["id"])
-            emit('reconnect_room', {'room': found_room, 'is_spectator': is_spectator})
+        reattach(uid)
+
+@room_event('resume', owner=route_resume)
+def on_resume(data):
+    uid = verify_resume_token(data.get('token'))
+    profile = uid and (USER_CACHE.peek(uid) or LEADERBOARD.get(uid))
+    if not profile:
+        emit('resume_result', {'success': False})
+        return
+    SID_TO_UID[request.sid] = uid
+    # 令牌随每次恢复续期；先发结果再发房间视图，客户端据 in_room 决定是否回到大厅
+    in_room = UID_ROOM.get(uid) in rooms
+    emit('resume_result', {'success': True, 'user': profile_to_dict(profile), 'resume_token': issue_resume_token(uid),
+                           'in_room': in_room})
+    if in_room:
+        reattach(uid)
+
+@room_event('request_sync')
+def on_request_sync():
+    room = get_room_by_sid(request.sid)
+    if room:
+        send_room_snapshot(room.id)
 
-@socketio.on('leave_room_req')
+@room_event('leave_room_req')
 def on_leave_room_req():
     room = get_room_by_sid(request.sid)
     uid = SID_TO_UID.get(request.sid)
     if room and uid:
-        leave_room(room["id"])
+        leave_room(room.id)
+        leave_audience(room.id, request.sid)
         if request.sid in SID_TO_ROOM: del SID_TO_ROOM[request.sid]
         
-        if uid in room["players"]: del room["players"][uid]
-        # FIX: 从对象列表中删除
-        room["spectators"] = [s for s in room["spectators"] if s['uid'] != uid]
+        remove_member(room, uid)
             
-        if len(room["players"]) == 0 and room["phase"] == "LOBBY":
-             del rooms[room["id"]]
+        if len(room.players) == 0 and room.phase == "LOBBY":
+             delete_room(room.id)
         
-        broadcast_room_state(room["id"])
+        broadcast_room_state(room.id)
         broadcast_room_list()
         emit('left_room_success')
 
-@socketio.on('delete_room')
+@room_event('delete_room', owner=lambda data: room_owner(data.get('room_id')))
 def on_delete_room(data):
     room_id = data.get('room_id')
     if room_id in rooms:
-        if len(rooms[room_id]["players"]) == 0:
-            del rooms[room_id]
+        if len(rooms[room_id].players) == 0:
+            delete_room(room_id)
             broadcast_room_list()
         else:
             emit('error_msg', {'msg': '无法删除有人的房间'})
 
-@socketio.on('reroll_title')
+@socket_event('reroll_title')
 def on_reroll_title(data):
     uid = data.get('uid')
-    with app.app_context():
-        user = db.session.get(User, uid)
-        if user and user.score >= 200 and user.score >= 10:
-            user.score -= 10
-            user.ultimate_title = random.choice(ULTIMATE_PIG_NAMES)
-            db.session.commit()
-            emit('reroll_success', {'user': user.to_dict()})
-        else:
-            emit('error_msg', {'msg': '积分不足'})
+    profile = get_user_profile(uid)
+    if profile and profile["score"] >= RANK_MAX_SCORE and profile["score"] >= 10:
+        update_user(uid, score_delta=-10, ultimate_title=random.choice(ULTIMATE_PIG_NAMES))
+        emit('reroll_success', {'user': profile_to_dict(profile)})
+    else:
+        emit('error_msg', {'msg': '积分不足'})
 
-@socketio.on('toggle_ready')
+@room_event('toggle_ready')
 def on_toggle_ready():
     room = get_room_by_sid(request.sid)
     uid = SID_TO_UID.get(request.sid)
-    if room and uid in room["players"] and room["phase"] == "LOBBY":
-        room["players"][uid]["ready"] = not room["players"][uid]["ready"]
-        broadcast_room_state(room["id"])
+    if room and uid in room.players and room.phase == "LOBBY":
+        if not READY_LIMIT.allow(uid): return
+        room.players[uid].ready = not room.players[uid].ready
+        ROOM_EVENTS.flag(room.id, uid, "ready")
 
-@socketio.on('vote_kick')
+@room_event('vote_kick')
 def on_vote_kick(data):
     room = get_room_by_sid(request.sid)
     sender_uid = SID_TO_UID.get(request.sid)
     target_uid = data.get('target_uid')
-    if room and sender_uid in room["players"] and target_uid and room["phase"] == "LOBBY":
-        if target_uid not in room["players"]: return
-        if target_uid not in room["kick_votes"]: room["kick_votes"][target_uid] = []
-        votes = room["kick_votes"][target_uid]
+    if room and sender_uid in room.players and target_uid and room.phase == "LOBBY":
+        if target_uid not in room.players: return
+        if target_uid not in room.kick_votes: room.kick_votes[target_uid] = []
+        votes = room.kick_votes[target_uid]
         if sender_uid in votes: votes.remove(sender_uid)
         else: votes.append(sender_uid)
         
-        threshold = math.floor(len(room["players"]) / 2) + 1
+        threshold = math.floor(len(room.players) / 2) + 1
         if len(votes) >= threshold:
-            del room["players"][target_uid]
+            remove_member(room, target_uid)
         
-        broadcast_room_state(room["id"])
+        broadcast_room_state(room.id)
         broadcast_room_list()
 
-@socketio.on('request_start_game')
+@room_event('request_start_game')
 def on_req_start():
     room = get_room_by_sid(request.sid)
     uid = SID_TO_UID.get(request.sid)
-    if room and uid in room["players"] and room["phase"] == "LOBBY":
-        if len(room["players"]) >= 3 and all(p["ready"] for p in room["players"].values()):
-            start_pre_game(room["id"])
+    if room and uid in room.players and room.phase == "LOBBY":
+        if len(room.players) >= 3 and all(p.ready for p in room.players.values()):
+            start_pre_game(room.id)
 
-@socketio.on('confirm_rule')
+@room_event('confirm_rule')
 def on_confirm():
     room = get_room_by_sid(request.sid)
     uid = SID_TO_UID.get(request.sid)
-    if room and uid in room["players"]:
-        room["players"][uid]["confirmed"] = True
-        broadcast_room_state(room["id"])
-        check_all_confirmed(room["id"])
-
-@socketio.on('submit_guess')
+    if room and uid in room.players:
+        player = room.players[uid]
+        if player.confirmed: return
+        player.confirmed = True
+        ROOM_EVENTS.flag(room.id, uid, "confirmed")
+        check_all_confirmed(room.id)
+
+@room_event('submit_guess')
 def on_submit(data):
     room = get_room_by_sid(request.sid)
     uid = SID_TO_UID.get(request.sid)
-    if room and uid in room["players"]:
-        player = room["players"][uid]
-        if not player["alive"]: return
+    if room and uid in room.players:
+        player = room.players[uid]
+        if not player.alive: return
         
         try:
             val = int(data.get('val'))
             if 0 <= val <= 100:
-                player["guess"] = val
-                player["submitted"] = True
-                broadcast_room_state(room["id"])
-                check_all_submitted(room["id"])
+                player.guess = val
+                if not player.submitted:
+                    player.submitted = True
+                    ROOM_EVENTS.flag(room.id, uid, "submitted")
+                check_all_submitted(room.id)
         except: pass
 
-@socketio.on('suicide')
+@room_event('suicide')
 def on_suicide(data):
     room = get_room_by_sid(request.sid)
     uid = SID_TO_UID.get(request.sid)
-    if room and uid in room["players"]:
-        player = room["players"][uid]
-        if not player["alive"]: return
+    if room and uid in room.players:
+        player = room.players[uid]
+        if not player.alive: return
         
-        alive_count = sum(1 for p in room["players"].values() if p["alive"])
+        alive_count = sum(1 for p in room.players.values() if p.alive)
         if alive_count <= 2: return 
 
-        player["suicided"] = True
-        player["hp_at_death"] = player["hp"]
-        player["hp"] = 0
-        player["alive"] = False
-        room["elimination_stack"].append(uid)
+        player.suicided = True
+        player.hp_at_death = player.hp
+        player.hp = 0
+        player.alive = False
+        room.elimination_stack.append(uid)
         
         selected_rule_id = int(data.get('rule_id'))
-        rule_to_add = next((r for r in room["available_perm_rules"] if r["id"] == selected_rule_id), None)
+        rule_to_add = next((r for r in room.available_perm_rules if r["id"] == selected_rule_id), None)
         
         if rule_to_add:
-            room["available_perm_rules"].remove(rule_to_add)
-            trigger_room_rule(room, rule_to_add, author_name=player['name'])
-            process_announcement_queue(room["id"])
+            room.available_perm_rules.remove(rule_to_add)
+            trigger_room_rule(room, rule_to_add, author_name=player.name)
+            process_announcement_queue(room.id)
         else:
-            start_new_round(room["id"])
+            start_new_round(room.id)
 
-@socketio.on('send_emote')
+@room_event('get_round_history')
+def on_get_round_history(data=None):
+    # 向前翻阅本局已存档的回合；游标为上一页最早回合的序号，缺省从最近的存档开始
+    room = get_room_by_sid(request.sid)
+    if not room: return
+    cursor = (data or {}).get('cursor')
+    end = ROUND_STORE.count(room.id) if cursor is None else max(0, min(int(cursor), ROUND_STORE.count(room.id)))
+    start = max(0, end - ROUND_HISTORY_PAGE_SIZE)
+    emit('round_history', {
+        'room_id': room.id, 'rounds': ROUND_STORE.read(room.id, start, end),
+        'cursor': cursor, 'next_cursor': start or None
+    })
+
+@room_event('send_emote')
 def on_emote(data):
     room = get_room_by_sid(request.sid)
-    if room:
-        uid = data.get('uid')
-        emote = data.get('emote')
-        socketio.emit('player_emote', {'uid': uid, 'emote': emote[:4]}, room=room["id"])
+    uid = SID_TO_UID.get(request.sid)
+    emote = data.get('emote')
+    if room and room.has_member(uid) and isinstance(emote, str) and emote:
+        if EMOTE_LIMIT.allow(uid):
+            ROOM_EVENTS.emote(room.id, uid, emote[:4])
 
-@socketio.on('send_like')
+@room_event('send_like')
 def on_like(data):
     room = get_room_by_sid(request.sid)
     sender_uid = SID_TO_UID.get(request.sid)
     target_uid = data.get('target_uid')
     if room and sender_uid and target_uid:
-        sender = None
-        # FIX: 检查玩家 OR 观战者
-        if sender_uid in room["players"]:
-            sender = room["players"][sender_uid]
-        else:
-            sender = next((s for s in room["spectators"] if s['uid'] == sender_uid), None)
-            
+        # 玩家与观战者都可以点赞
+        sender = room.players.get(sender_uid) or room.spectators.get(sender_uid)
         if sender:
-             target = room["players"].get(target_uid)
+             target = room.players.get(target_uid)
              # 简单的点赞逻辑，观战者也可以点赞，限制次数
-             if target and sender["likes_sent"] < room["config"]["max_likes"]:
-                sender["likes_sent"] += 1
-                target["likes"] += 1
-                broadcast_room_state(room["id"])
-                socketio.emit('trigger_like_effect', {'target_uid': target_uid}, room=room["id"])
+             if target and sender.likes_sent < room.config["max_likes"] and LIKE_LIMIT.allow(sender_uid):
+                sender.likes_sent += 1
+                target.likes += 1
+                ROOM_EVENTS.like(room.id, sender_uid, target_uid, sender_uid in room.players)
 
-@socketio.on('admin_login')
+@room_event('admin_login')
 def on_admin_login(data):
-    print(f"DEBUG: Admin Login Attempt: {data.get('password')}")
     if data.get('password') == ADMIN_PASSWORD:
+        LOG.info("admin login: uid=%s sid=%s", SID_TO_UID.get(request.sid), request.sid)
+        ADMIN_SIDS.add(request.sid)
         emit('admin_auth_success', {'perm_pool': PERMANENT_RULE_POOL, 'temp_pool': ROUND_EVENT_POOL, 'config': {}})
+        # 已在房间里的管理员切换到完整视图
+        room = get_room_by_sid(request.sid)
+        if room: broadcast_room_state(room.id)
     else:
+        LOG.warning("admin login failed: uid=%s sid=%s", SID_TO_UID.get(request.sid), request.sid)
         emit('admin_auth_fail')
 
-@socketio.on('reset_game')
+@room_event('reset_game')
 def on_reset_game():
     room = get_room_by_sid(request.sid)
-    if room and room["phase"] == "END":
-        perform_reset(room["id"])
+    if room and room.phase == "END":
+        perform_reset(room.id)
 
-@socketio.on('admin_command')
+@room_event('admin_command')
 def on_admin(data):
     if data.get('password') != ADMIN_PASSWORD: return
     room = get_room_by_sid(request.sid)
@@ -941,52 +1762,133 @@ def on_admin(data):
         return
     
     cmd = data.get('cmd')
-    if cmd == 'reset': perform_reset(room["id"])
+    if cmd == 'reset': perform_reset(room.id)
     elif cmd == 'add_perm_rule':
          rule_id = data.get('rule_id')
-         rule_to_add = next((r for r in PERMANENT_RULE_POOL if r["id"] == rule_id), None)
+         rule_to_add = PERM_RULE_BY_ID.get(rule_id)
          if rule_to_add:
-             if room["phase"] in ["LOBBY", "PRE_GAME"]:
-                 if rule_to_add in room["available_perm_rules"]:
-                     room["available_perm_rules"].remove(rule_to_add)
+             if room.phase in ["LOBBY", "PRE_GAME"]:
+                 if rule_to_add in room.available_perm_rules:
+                     room.available_perm_rules.remove(rule_to_add)
                  trigger_room_rule(room, rule_to_add) 
                  
-                 if room["phase"] != "LOBBY":
-                     process_announcement_queue(room["id"])
+                 if room.phase != "LOBBY":
+                     process_announcement_queue(room.id)
                  else:
-                     broadcast_room_state(room["id"])
+                     broadcast_room_state(room.id)
              else:
-                 if rule_id not in room["pending_events"]["perm"]:
-                     room["pending_events"]["perm"].append(rule_id)
+                 if rule_id not in room.pending_events["perm"]:
+                     room.pending_events["perm"].append(rule_id)
 
     elif cmd == 'add_temp_rule':
-        room["pending_events"]["temp"] = data.get('rule_id')
+        room.pending_events["temp"] = data.get('rule_id')
+    elif cmd == 'cache_stats':
+        emit('admin_stats', {'user_cache': USER_CACHE.stats()})
+    elif cmd == 'memory':
+        # 房主进程上各房间的内存占用与会话登记表大小
+        emit('admin_memory', {'worker': WORKER_ID, 'rooms': [room_memory(r) for r in rooms.values()],
+                              'tables': session_table_sizes()})
+    elif cmd == 'slow_events':
+        emit('admin_slow_events', {'budget_ms': SLOW_EVENTS.budget * 1000, 'events': list(SLOW_EVENTS.recent)})
+    elif cmd == 'profile':
+        # 采样房主进程的 hub，返回折叠栈文本 (flamegraph.pl / speedscope)；另起协程等待，不占住房间队列
+        seconds = min(max(float(data.get('seconds') or 10), 1), PROFILE_MAX_SECONDS)
+        eventlet.spawn_n(send_hub_profile, request.sid, seconds)
     elif cmd == 'update_config':
-        room["config"]["max_likes"] = int(data.get("max_likes", 10))
-        broadcast_room_state(room["id"])
+        room.config["max_likes"] = int(data.get("max_likes", 10))
+        broadcast_room_state(room.id)
 
-@socketio.on('get_history')
+def send_hub_profile(sid, seconds):
+    result = profile_hub(seconds)
+    if result is None:
+        socketio.emit('error_msg', {'msg': '已有采样在进行中'}, to=sid)
+        return
+    collapsed, samples = result
+    socketio.emit('admin_profile', {'worker': WORKER_ID, 'seconds': seconds, 'samples': samples, 'collapsed': collapsed},
+                  to=sid)
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+def parse_history_limit(value):
+    try:
+        limit = int(value or HISTORY_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return HISTORY_PAGE_SIZE
+    return max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+def parse_history_cursor(cursor):
+    # 游标为上一页最后一条的 [timestamp, id]；格式不对返回 None，按第一页处理
+    if not isinstance(cursor, (list, tuple)) or len(cursor) != 2:
+        return None
+    ts, last_id = cursor
+    if not isinstance(ts, str) or not isinstance(last_id, int) or isinstance(last_id, bool):
+        return None
+    try:
+        return datetime.fromisoformat(ts), last_id
+    except ValueError:
+        return None
+
+@socket_event('get_leaderboard')
+def on_get_leaderboard(data=None):
+    # 返回前 N 名与自己的名次，并订阅之后前 N 名的变化
+    uid = (data or {}).get('uid')
+    join_room('leaderboard')
+    entry = LEADERBOARD.get(uid)
+    me = leaderboard_view(entry, LEADERBOARD.rank(uid)) if entry else None
+    emit('leaderboard_data', {'top': leaderboard_top(), 'me': me, 'total': len(LEADERBOARD)})
+
+@socket_event('leave_leaderboard')
+def on_leave_leaderboard():
+    leave_room('leaderboard')
+
+@socket_event('get_history')
 def on_get_history(data):
     uid = data.get('uid')
+    limit = parse_history_limit(data.get('limit'))
+    cursor = data.get('cursor')
+    parsed = parse_history_cursor(cursor)
+    if parsed is None:
+        cursor = None
     with app.app_context():
-        records = GameRecord.query.order_by(GameRecord.timestamp.desc()).all()
-        user_history = []
-        for r in records:
-            try:
-                players_data = json.loads(r.players_json)
-                player_rec = next((p for p in players_data if p['uid'] == uid), None)
-                if player_rec:
-                    user_history.append({
-                        'id': r.id,
-                        'time': r.timestamp.strftime("%Y-%m-%d %H:%M"),
-                        'score_change': player_rec['score_change'],
-                        'rank': player_rec['rank'],
-                        'game_rank': player_rec.get('game_rank', '-'),
-                        'total_players': player_rec.get('total_players', '-'),
-                        'is_suicide': player_rec.get('is_suicide', False),
-                    })
-            except: continue
-        emit('history_data', user_history)
+        query = PlayerResult.query.filter(PlayerResult.uid == uid)
+        if parsed:
+            # 行值比较让 SQLite 直接在 (uid, timestamp, rowid) 索引上定位起点；
+            # 拆成 OR 的写法只能用上 uid 前缀，深翻页要逐行过滤
+            query = query.filter(db.tuple_(PlayerResult.timestamp, PlayerResult.id) < parsed)
+        rows = query.order_by(PlayerResult.timestamp.desc(), PlayerResult.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = [rows[-1].timestamp.isoformat(), rows[-1].id]
+        payload = {'items': [r.to_dict() for r in rows], 'cursor': cursor, 'next_cursor': next_cursor}
+        emit('history_data', wire.encode_for(payload, SID_CODECS.get(request.sid, "json")))
+
+@socket_event('get_replay')
+def on_get_replay(data):
+    # 逐回合推送一局的回放：replay_start -> replay_round * N -> replay_end
+    try:
+        record_id = int(data.get('record_id'))
+    except (TypeError, ValueError):
+        return
+    rounds = iter_replay(replay_chunks(record_id))
+    header = next(rounds, None)
+    if header is None:
+        emit('error_msg', {'msg': '回放不存在'})
+        return
+    emit('replay_start', {'record_id': record_id, 'total_rounds': header["rounds"], 'players': header["players"]})
+    for entry in rounds:
+        emit('replay_round', {'record_id': record_id, 'round': entry})
+        eventlet.sleep(0)
+    emit('replay_end', {'record_id': record_id})
+
+restore_rooms()
+eventlet.spawn(snapshot_loop)
+eventlet.spawn(reap_idle_rooms)
+atexit.register(flush_snapshots)
+# 快照记下的存档回合数包含尚在队列里的追加，关停时先写完这些追加 (atexit 后注册的先执行)
+atexit.register(ROUND_STORE.close)
+start_cluster()
 
 if __name__ == '__main__':
-    socketio.run(app, debug=True, host='0.0.0.0', port=5002)
\ No newline at end of file
+    socketio.run(app, debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 5002)))
\ No newline at end of file
@@ -0,0 +1,426 @@
+# 服务器热路径的微基准：逐事件执行的函数各自计时，结果可保存为基线并与之比较。
+#
+#   python bench.py                                   # 文本报告
+#   python bench.py --save baseline.json              # 保存基线 (JSON)
+#   python bench.py --compare baseline.json           # 与基线比较，中位数变慢超过阈值时退出码为 1
+#   python bench.py --filter 'calculate_round.*event=104' --iterations 0.2 --json
+#
+# --filter 为作用于基准名的正则；正则里不出现的基准组 (如 calculate_round) 连同准备工作一起跳过。
+# 基线与比较应在同一台空闲机器上运行，噪声较大时调高 --threshold 或 --iterations。
+# 覆盖：
+#   calculate_round                 永久规则的全部组合 x 每种限定事件 (含无事件)
+#   init_room_state / perform_reset
+#   broadcast_room_state            不同已进行回合数下的增量广播与完整视图编码
+#   calculate_points_and_save_room  结算与写后日志；apply_game_results 单独计时 (内存 SQLite)
+#   on_get_history                  1k / 10k / 100k 局战绩下的首页与深翻页
+#
+# 导入 app 前把数据库指向内存 SQLite、instance 目录指向临时目录，不触碰线上数据。
+# 每次迭代的准备工作 (复制房间模板等) 不计入耗时，计时期间关闭 GC。
+import argparse
+import atexit
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from copy import deepcopy
+from datetime import datetime, timedelta
+
+if 'INSTANCE_PATH' not in os.environ:
+    os.environ['INSTANCE_PATH'] = tempfile.mkdtemp(prefix='balance-bench-')
+    # 先于 app 的 atexit 注册，因此在写后队列 flush 之后才删除
+    atexit.register(shutil.rmtree, os.environ['INSTANCE_PATH'], True)
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import app as server  # noqa: E402  (须在设置环境变量之后导入)
+import game  # noqa: E402
+
+ROOM_ID = "room_bench"
+PLAYERS = 6
+RANK = {"title": "战斗猪", "icon": "🐗", "class": "text-red-500", "is_max": False}
+AUDIENCES = ("alive", "dead", "spec", "admin")
+
+
+class Suite:
+    def __init__(self, pattern, scale):
+        self.pattern = re.compile(pattern) if pattern else None
+        self.scale = scale
+        self.results = {}
+
+    def wants(self, group):
+        # 整组基准的准备工作较重，过滤条件既不匹配组名也不包含组名时跳过整组
+        return self.pattern is None or bool(self.pattern.search(group)) or group in self.pattern.pattern
+
+    def run(self, name, func, setup=None, iterations=200):
+        if self.pattern and not self.pattern.search(name):
+            return
+        iterations = max(3, int(iterations * self.scale))
+        for _ in range(max(1, iterations // 10)):  # 预热，不计入结果
+            func(*(setup() if setup else ()))
+        samples = []
+        gc.collect()
+        gc.disable()
+        try:
+            for _ in range(iterations):
+                args = setup() if setup else ()
+                started = time.perf_counter()
+                func(*args)
+                samples.append(time.perf_counter() - started)
+        finally:
+            gc.enable()
+        self.results[name] = {
+            "iterations": iterations,
+            "median_us": round(statistics.median(samples) * 1e6, 2),
+            "mean_us": round(statistics.fmean(samples) * 1e6, 2),
+            "min_us": round(min(samples) * 1e6, 2),
+            "stdev_us": round(statistics.pstdev(samples) * 1e6, 2),
+        }
+
+
+# --- 房间构造 ---
+
+def make_room(players=PLAYERS, seed=1):
+    random.seed(seed)
+    room = game.init_room_state(ROOM_ID, "bench")
+    for i in range(players):
+        uid = f"bench{i}"
+        room.players[uid] = game.new_player(uid, f"玩家{i}", dict(RANK), 100)
+    room.phase = "INPUT"
+    room.round = 1
+    return room
+
+
+def set_guesses(room, rng):
+    for p in room.players.values():
+        if p.alive:
+            p.guess = rng.randint(0, 100)
+            p.submitted = True
+
+
+def play_rounds(rounds, seed=1):
+    # 与线上相同的回合流程 (含超出实时窗口的回合归档)；临时调高生命上限撑满回合数
+    max_hp = game.MAX_HP
+    game.MAX_HP = rounds + 5
+    try:
+        room = make_room(PLAYERS, seed)
+        room.round = 0
+        rng = random.Random(seed)
+        server.ROUND_STORE.drop(ROOM_ID)
+        while room.round < rounds:
+            room.announcement_queue.clear()
+            game.apply_pending_perm_rules(room)
+            game.begin_round(room)
+            set_guesses(room, rng)
+            finished, _ = game.resolve_room_round(room)
+            server.archive_rounds(room)
+            if finished:
+                break
+        room.phase = "RESULT"
+        return room
+    finally:
+        game.MAX_HP = max_hp
+
+
+def install(room):
+    server.rooms[room.id] = room
+    return room
+
+
+# --- 基准 ---
+
+def bench_calculate_round(suite):
+    rule_ids = [r["id"] for r in game.PERMANENT_RULE_POOL]
+    events = [None] + [e["id"] for e in game.ROUND_EVENT_POOL]
+    rng = random.Random(7)
+    for size in range(len(rule_ids) + 1):
+        for combo in itertools.combinations(rule_ids, size):
+            for event_id in events:
+                name = f"calculate_round[rules={'+'.join(map(str, combo)) or '-'},event={event_id or '-'}]"
+                template = make_room()
+                template.rules = [deepcopy(game.PERM_RULE_BY_ID[rid]) for rid in combo]
+                game.compile_room_rules(template)
+                if event_id:
+                    game.apply_round_event(template, game.ROUND_EVENT_BY_ID[event_id])
+
+                def setup(template=template):
+                    room = install(deepcopy(template))
+                    set_guesses(room, rng)
+                    server.ROUND_STORE.drop(ROOM_ID)
+                    return (ROOM_ID,)
+
+                suite.run(name, server.calculate_round, setup, iterations=30)
+    server.cancel_phase_timer(ROOM_ID)
+
+
+def bench_room_lifecycle(suite):
+    suite.run("init_room_state", game.init_room_state, lambda: (ROOM_ID, "bench"), iterations=2000)
+    if not suite.wants("perform_reset"):
+        return
+    finished = play_rounds(200)
+    finished.phase = "END"
+
+    def setup():
+        install(deepcopy(finished))
+        return (ROOM_ID,)
+
+    suite.run("perform_reset", server.perform_reset, setup, iterations=300)
+
+
+def register_audiences(room):
+    # 每种受众一个虚拟成员 (uid 与受众一致，广播不会给它们换受众)：广播为其计算投影与补丁，编码一次后发往空房间
+    players = list(room.players.values())
+    players[-1].alive = False
+    server.ADMIN_SIDS.add("bench-admin")
+    server.ROOM_MEMBERS[room.id] = {
+        "bench-alive": [players[0].uid, "alive", "json"],
+        "bench-dead": [players[-1].uid, "dead", "json"],
+        "bench-spec": ["bench-spec", "spec", "json"],
+        "bench-admin": ["bench-admin", "admin", "json"],
+    }
+
+
+def bench_broadcast(suite, client):
+    # 广播在没有任何连接时不会编码，测试客户端保证 '/' 命名空间存在
+    for rounds in (1, 10, 50):
+        template = play_rounds(rounds)
+        server.SYNC_SNAPSHOTS.pop(ROOM_ID, None)
+        server.VIEW_CACHE.pop(ROOM_ID, None)
+        install(template)
+        register_audiences(template)
+        alive = [p for p in template.players.values() if p.alive]
+        for audience in AUDIENCES:
+            server.room_view(ROOM_ID, audience)
+
+        state = {"i": 0}
+
+        def submit_toggle():
+            # 每次只翻转一名玩家的提交状态，对应线上最常见的一次增量广播
+            p = alive[state["i"] % len(alive)]
+            state["i"] += 1
+            p.submitted = not p.submitted
+            return (ROOM_ID,)
+
+        suite.run(f"broadcast_room_state[rounds={rounds},change=submit]", server.broadcast_room_state,
+                  submit_toggle, iterations=1000)
+        suite.run(f"broadcast_room_state[rounds={rounds},change=none]", server.broadcast_room_state,
+                  lambda: (ROOM_ID,), iterations=1000)
+
+        codecs = ["json"] + (["msgpack"] if server.wire.msgpack is not None else [])
+        for audience, codec in itertools.product(("alive", "admin"), codecs):
+            def full_view(audience=audience):
+                server.VIEW_CACHE.pop(ROOM_ID, None)
+                server.SYNC_SNAPSHOTS[ROOM_ID].pop(audience, None)
+                return (ROOM_ID, audience, codec)
+
+            suite.run(f"room_view[rounds={rounds},audience={audience},codec={codec}]", server.room_view,
+                      full_view, iterations=500)
+    server.ROUND_STORE.drop(ROOM_ID)
+    server.ROOM_MEMBERS.pop(ROOM_ID, None)
+    server.ADMIN_SIDS.discard("bench-admin")
+    server.SYNC_SNAPSHOTS.pop(ROOM_ID, None)
+    server.VIEW_CACHE.pop(ROOM_ID, None)
+
+
+def discard_queued_results():
+    # 写后队列的后台写线程不参与计时，由基准自己同步落库
+    while not server.GAME_RESULTS.queue.empty():
+        server.GAME_RESULTS.queue.get_nowait()
+
+
+def bench_points(suite):
+    with server.app.app_context():
+        for i in range(8):
+            uid = f"bench{i}"
+            if server.db.session.get(server.User, uid) is None:
+                server.db.session.add(server.User(id=uid, password="x", nickname=f"玩家{i}", score=100))
+        server.db.session.commit()
+
+    for players in (4, 8):
+        game_max = game.MAX_HP
+        game.MAX_HP = 3
+        try:
+            room = make_room(players)
+            rng = random.Random(players)
+            while True:
+                room.announcement_queue.clear()
+                game.begin_round(room)
+                set_guesses(room, rng)
+                finished, winner = game.resolve_room_round(room)
+                for p in room.players.values():
+                    if not p.alive and p.uid not in room.elimination_stack:
+                        room.elimination_stack.append(p.uid)
+                if finished:
+                    break
+        finally:
+            game.MAX_HP = game_max
+
+        def setup(template=room, winner=winner):
+            return (deepcopy(template), winner)
+
+        suite.run(f"calculate_points_and_save_room[players={players}]", server.calculate_points_and_save_room,
+                  setup, iterations=200)
+        discard_queued_results()
+        server.GAME_RESULTS.flush()
+
+        for batch in (1, server.GAME_RESULTS.batch_size):
+            def submit(template=room, winner=winner, batch=batch):
+                for _ in range(batch):
+                    server.calculate_points_and_save_room(deepcopy(template), winner)
+                discard_queued_results()
+                return ()
+
+            suite.run(f"apply_game_results[players={players},batch={batch}]", server.GAME_RESULTS.flush, submit,
+                      iterations=100 if batch == 1 else 10)
+
+
+def seed_history(uid, games, start):
+    # 目标玩家参与每一局，另有三名同局玩家的记录充当其它用户的数据
+    rows = []
+    with server.app.app_context():
+        for i in range(games):
+            ts = start + timedelta(minutes=i)
+            rank = json.dumps(RANK)
+            for j, who in enumerate((uid, f"{uid}-a{i % 50}", f"{uid}-b{i % 50}", f"{uid}-c{i % 50}")):
+                rows.append({
+                    "uid": who, "record_id": i + 1, "timestamp": ts, "game_rank": j + 1, "total_players": 4,
+                    "score_change": 2 - j, "is_suicide": False, "rank_json": rank,
+                })
+            if len(rows) >= 20000:
+                server.db.session.execute(server.db.insert(server.PlayerResult), rows)
+                rows = []
+        if rows:
+            server.db.session.execute(server.db.insert(server.PlayerResult), rows)
+        server.db.session.commit()
+
+
+def bench_history(suite, client, sizes):
+    if not suite.wants("on_get_history"):
+        return
+    start = datetime(2025, 1, 1)
+    for games in sizes:
+        name = f"on_get_history[games={games}"
+        uid = f"hist{games}"
+        seed_history(uid, games, start)
+        middle = start + timedelta(minutes=games // 2)
+
+        def request(payload):
+            client.emit('get_history', payload)
+            client.get_received()
+
+        suite.run(f"{name},page=first]", request, lambda: ({"uid": uid, "limit": 20},), iterations=300)
+        suite.run(f"{name},page=middle]", request,
+                  lambda: ({"uid": uid, "limit": 20, "cursor": [middle.isoformat(), games]},), iterations=300)
+
+
+# --- 报告与基线比较 ---
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    # 以中位数比较；返回 [(名字, 基线 µs, 当前 µs, 变化比例)]
+    rows = []
+    for name, r in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        change = r["median_us"] / base["median_us"] - 1 if base["median_us"] else 0.0
+        rows.append((name, base["median_us"], r["median_us"], change))
+    regressions = [row for row in rows if row[3] > threshold]
+    improvements = [row for row in rows if row[3] < -threshold]
+    return rows, regressions, improvements
+
+
+def print_results(results):
+    width = max(len(n) for n in results) if results else 10
+    print(f"{'benchmark':<{width}}  {'median µs':>10}  {'mean µs':>10}  {'min µs':>10}  {'n':>5}")
+    for name, r in results.items():
+        print(f"{name:<{width}}  {r['median_us']:>10}  {r['mean_us']:>10}  {r['min_us']:>10}  {r['iterations']:>5}")
+
+
+def print_comparison(rows, regressions, improvements, threshold, missing):
+    changed = sorted(regressions + improvements, key=lambda row: -abs(row[3]))
+    if changed:
+        width = max(len(row[0]) for row in changed)
+        print(f"{'benchmark':<{width}}  {'baseline µs':>11}  {'now µs':>10}  {'change':>8}")
+        for name, base, now, change in changed:
+            print(f"{name:<{width}}  {base:>11}  {now:>10}  {change:>+8.1%}")
+        print()
+    print(f"{len(rows)} compared, {len(regressions)} slower and {len(improvements)} faster than "
+          f"baseline by more than {threshold:.0%}, {len(rows) - len(changed)} unchanged")
+    if missing:
+        print(f"{len(missing)} benchmarks not in baseline")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for per-event server functions")
+    parser.add_argument("--filter", help="只运行名字匹配该正则的基准")
+    parser.add_argument("--iterations", type=float, default=1.0, help="迭代次数倍率")
+    parser.add_argument("--history-sizes", default="1000,10000,100000", help="on_get_history 的已存对局数")
+    parser.add_argument("--save", metavar="PATH", help="把结果写入 JSON 文件 (可作为基线)")
+    parser.add_argument("--compare", metavar="PATH", help="与基线 JSON 比较")
+    parser.add_argument("--threshold", type=float, default=0.10, help="中位数变化超过该比例视为变化 (默认 0.10)")
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是文本报告")
+    args = parser.parse_args(argv)
+
+    suite = Suite(args.filter, args.iterations)
+    client = server.socketio.test_client(server.app)
+    try:
+        if suite.wants("calculate_round"):
+            bench_calculate_round(suite)
+        bench_room_lifecycle(suite)
+        if suite.wants("broadcast_room_state") or suite.wants("room_view"):
+            bench_broadcast(suite, client)
+        if suite.wants("calculate_points_and_save_room") or suite.wants("apply_game_results"):
+            bench_points(suite)
+        bench_history(suite, client, [int(s) for s in args.history_sizes.split(",") if s])
+    finally:
+        client.disconnect()
+
+    report = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "results": suite.results,
+    }
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows, regressions, improvements = compare(suite.results, baseline["results"], args.threshold)
+        missing = [n for n in suite.results if n not in baseline["results"]]
+        report["baseline"] = {"revision": baseline.get("revision"), "created": baseline.get("created")}
+        report["comparison"] = {name: {"baseline_us": base, "median_us": now, "change": round(change, 4)}
+                                for name, base, now, change in rows}
+        report["regressions"] = [row[0] for row in regressions]
+        if not args.json:
+            print(f"baseline {baseline.get('revision')} ({baseline.get('created')}) -> {report['revision']}")
+            print_comparison(rows, regressions, improvements, args.threshold, missing)
+    elif not args.json:
+        print_results(suite.results)
+
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# 线路编码基准：比较当前 JSON 与 MessagePack (+zlib) 对典型大帧的编码耗时与字节数。
+#
+#   python bench_wire.py
+#   python bench_wire.py --players 8 --rounds 20 --iterations 2000 --json
+#
+# 房间状态由 game.py 按真实规则跑出；为了让 8 人局撑满指定回合数，基准期间临时调高生命上限。
+import argparse
+import json
+import random
+import time
+import zlib
+
+import game
+import wire
+from views import project_room
+
+
+def build_room(players, rounds, seed):
+    random.seed(seed)
+    game.MAX_HP = rounds + 5
+    room = game.init_room_state("room_bench", "bench")
+    for i in range(players):
+        uid = f"player{i}"
+        room.players[uid] = game.new_player(
+            uid, f"玩家{i}", {"title": "战斗猪", "icon": "🐗", "class": "text-red-500", "is_max": False}, 120
+        )
+    while room.round < rounds:
+        room.announcement_queue.clear()
+        game.apply_pending_perm_rules(room)
+        game.begin_round(room)
+        for p in room.players.values():
+            if p.alive:
+                p.guess = random.randint(0, 100)
+                p.submitted = True
+        finished, _ = game.resolve_room_round(room)
+        if finished:
+            break
+    room.phase = "RESULT"
+    return room
+
+
+def build_history(count):
+    return {
+        "items": [{
+            "id": 1000 + i, "time": "2026-10-01 20:%02d" % (i % 60), "score_change": i % 4,
+            "rank": {"title": "战斗猪", "icon": "🐗", "class": "text-red-500", "is_max": False},
+            "game_rank": i % 8 + 1, "total_players": 8, "is_suicide": i % 9 == 0,
+        } for i in range(count)],
+        "cursor": None,
+        "next_cursor": ["2026-10-01T20:00:00", 1000],
+    }
+
+
+def json_frame(obj):
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+def json_zlib_frame(obj):
+    return zlib.compress(json_frame(obj), 6)
+
+
+def msgpack_frame(obj):
+    return wire.msgpack.packb(obj)
+
+
+CODECS = {
+    "json": json_frame,
+    "json+zlib": json_zlib_frame,
+    "msgpack": msgpack_frame,
+    "msgpack+zlib": wire.pack,  # 线上使用的编码：超过阈值才压缩
+}
+
+
+def measure(encode, obj, iterations):
+    size = len(encode(obj))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        encode(obj)
+    elapsed = time.perf_counter() - started
+    return {"bytes": size, "encode_us": round(elapsed / iterations * 1e6, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Socket.IO wire codec benchmark")
+    parser.add_argument("--players", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--history", type=int, default=20, help="history_data 每页条数")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是文本报告")
+    args = parser.parse_args(argv)
+
+    if wire.msgpack is None:
+        raise SystemExit("msgpack is not installed")
+
+    room = build_room(args.players, args.rounds, args.seed)
+    frames = {
+        "state_update": project_room(room, "alive"),
+        "reconnect_room": {"room": project_room(room, "admin"), "is_spectator": False, "guess": None},
+        "history_data": build_history(args.history),
+    }
+    results = {
+        name: {codec: measure(encode, obj, args.iterations) for codec, encode in CODECS.items()}
+        for name, obj in frames.items()
+    }
+
+    if args.json:
+        print(json.dumps({"players": args.players, "rounds": room.round, "results": results}, indent=2))
+        return
+    print(f"{args.players} players, {room.round} rounds, {args.iterations} iterations")
+    for name, by_codec in results.items():
+        base = by_codec["json"]
+        print(f"\n{name}")
+        print("codec          bytes     ratio   encode µs")
+        for codec, r in by_codec.items():
+            print(f"{codec:<13}  {r['bytes']:<8}  {r['bytes'] / base['bytes']:<6.2f}  {r['encode_us']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+# 多进程部署：每个房间固定归属创建它的 worker 进程，其它 worker 收到该房间的事件时经消息总线转发给房主进程；
+# Socket.IO 的广播通过同一个消息队列扇出到所有 worker。
+#
+#   WORKER_ID=0 PORT=5002 MESSAGE_QUEUE=redis://127.0.0.1:6379/0 python app.py
+#   WORKER_ID=1 PORT=5003 MESSAGE_QUEUE=redis://127.0.0.1:6379/0 python app.py
+#
+# 每个核心跑一个进程，前面用粘性会话 (如 nginx ip_hash) 把同一连接固定到一个 worker。
+# 未配置 MESSAGE_QUEUE 时使用进程内的 LocalBroker，行为等同单进程部署。
+# MESSAGE_QUEUE=local://<名字> 时同一进程里以不同 WORKER_ID 加载的多份 app 共用一条进程内总线
+# (消息、共享表与 Socket.IO 广播)，不需要 Redis 就能走跨 worker 转发的路径，用于测试。
+import json
+import time
+import traceback
+from collections import defaultdict
+
+import eventlet
+from socketio import Manager
+
+try:
+    import redis
+except ImportError:  # 只有多进程部署才需要 redis
+    redis = None
+
+
+class LocalBus:
+    # 同一进程内多个 LocalBroker 共用的频道、共享表与各 worker 的 Socket.IO 客户端管理器
+    def __init__(self):
+        self.handlers = defaultdict(list)
+        self.tables = defaultdict(dict)
+        self.socketio_managers = []
+
+
+LOCAL_BUSES = {}  # MESSAGE_QUEUE=local://<名字> -> LocalBus
+
+
+class LocalSocketIOManager(Manager):
+    # 同一条 LocalBus 上各 worker 的 Socket.IO 客户端管理器：本进程处理后直接交给其它 worker 的管理器，
+    # 效果与经 Redis 扇出相同 (不支持跨 worker 的 ack 回调)
+    def __init__(self, bus):
+        super().__init__()
+        bus.socketio_managers.append(self)
+        self.bus = bus
+
+    def peers(self):
+        return [m for m in self.bus.socketio_managers if m is not self and m.server is not None]
+
+    def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        room = to or room
+        super().emit(event, data, namespace, room=room, skip_sid=skip_sid, callback=callback)
+        for peer in self.peers():
+            Manager.emit(peer, event, data, namespace, room=room, skip_sid=skip_sid)
+
+    def enter_room(self, sid, namespace, room, eio_sid=None):
+        if self.is_connected(sid, namespace):
+            return super().enter_room(sid, namespace, room, eio_sid=eio_sid)
+        for peer in self.peers():
+            if peer.is_connected(sid, namespace):
+                Manager.enter_room(peer, sid, namespace, room)
+
+    def leave_room(self, sid, namespace, room):
+        if self.is_connected(sid, namespace):
+            return super().leave_room(sid, namespace, room)
+        for peer in self.peers():
+            if peer.is_connected(sid, namespace):
+                Manager.leave_room(peer, sid, namespace, room)
+
+    def close_room(self, room, namespace):
+        super().close_room(room, namespace)
+        for peer in self.peers():
+            Manager.close_room(peer, room, namespace)
+
+
+class LocalBroker:
+    def __init__(self, bus=None):
+        self.shared = bus is not None
+        self.bus = bus or LocalBus()
+
+    def socketio_options(self):
+        # 共用总线时各 worker 的广播经 LocalSocketIOManager 互相送达
+        return {"client_manager": LocalSocketIOManager(self.bus)} if self.shared else {}
+
+    def publish(self, channel, message):
+        # 经过一次 JSON 编解码再异步投递，与 Redis 的语义保持一致
+        payload = json.dumps(message)
+        for handler in self.bus.handlers.get(channel, ()):
+            eventlet.spawn_n(handler, json.loads(payload))
+
+    def subscribe(self, channel, handler):
+        self.bus.handlers[channel].append(handler)
+
+    def start(self):
+        pass
+
+    def hset(self, table, key, value):
+        self.bus.tables[table][key] = json.loads(json.dumps(value))
+
+    def hdel(self, table, key):
+        self.bus.tables[table].pop(key, None)
+
+    def hgetall(self, table):
+        return dict(self.bus.tables.get(table, {}))
+
+
+class RedisBroker:
+    def __init__(self, url, prefix="balance:"):
+        if redis is None:
+            raise RuntimeError("MESSAGE_QUEUE requires the redis package")
+        self.message_queue = url
+        self.prefix = prefix
+        self.redis = redis.Redis.from_url(url)
+        self._handlers = {}
+        self._listener = None
+
+    def socketio_options(self):
+        # 传给 SocketIO(...)：广播经 Redis 扇出到所有 worker
+        return {"message_queue": self.message_queue}
+
+    def publish(self, channel, message):
+        self.redis.publish(self.prefix + channel, json.dumps(message))
+
+    def subscribe(self, channel, handler):
+        # 需在 start() 之前订阅完毕
+        self._handlers[self.prefix + channel] = handler
+
+    def start(self):
+        if self._listener is None:
+            self._listener = eventlet.spawn(self._listen)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(*self._handlers)
+                for msg in pubsub.listen():
+                    handler = self._handlers.get(msg["channel"].decode())
+                    if handler:
+                        eventlet.spawn_n(handler, json.loads(msg["data"]))
+            except Exception:
+                traceback.print_exc()
+                time.sleep(1)
+
+    def hset(self, table, key, value):
+        self.redis.hset(self.prefix + table, key, json.dumps(value))
+
+    def hdel(self, table, key):
+        self.redis.hdel(self.prefix + table, key)
+
+    def hgetall(self, table):
+        return {k.decode(): json.loads(v) for k, v in self.redis.hgetall(self.prefix + table).items()}
+
+
+def make_broker(url=None):
+    if not url:
+        return LocalBroker()
+    if url.startswith("local://"):
+        return LocalBroker(LOCAL_BUSES.setdefault(url, LocalBus()))
+    return RedisBroker(url)
+
+
+def check_worker_id(worker_id):
+    # 房间 id 形如 room_<毫秒>_<worker>_<随机数>，room_owner 按 "_" 切分取出 worker
+    if not worker_id or "_" in worker_id:
+        raise ValueError(f"WORKER_ID must be non-empty and must not contain '_': {worker_id!r}")
+    return worker_id
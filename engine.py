@@ -0,0 +1,283 @@
+# 回合结算引擎：纯函数，不依赖 Flask / Socket.IO，可供服务器、测试与离线工具复用
+# 规则与事件的效果由 rules.py 的注册表声明，这里只负责按流水线执行生效的钩子。
+# numpy 是可选依赖 (不在 requirements.txt 中)：只有离线批量接口 resolve_rounds 用它，
+# 没装时逐回合调用 resolve_round；服务器的 calculate_round 始终走纯 Python 的 resolve_round。
+import functools
+import random
+from typing import NamedTuple, Optional, Tuple, FrozenSet
+
+from rules import RULES, DUEL_RULE
+
+try:
+    import numpy as np
+except ImportError:  # 批量模式在没有 numpy 时退化为逐回合计算
+    np = None
+
+EVENT_SWAP = 101
+EVENT_SAFE = 103
+EVENT_REVOLUTION = 105
+EVENT_LUCKY = 106
+
+
+class RoundInput(NamedTuple):
+    guesses: Tuple[int, ...]            # 存活玩家的原始数字，顺序即玩家顺序
+    hps: Tuple[int, ...]
+    rule_ids: FrozenSet[int] = frozenset()
+    event_id: Optional[int] = None
+    multiplier: float = 0.8
+    ghost_values: Tuple[int, ...] = ()
+    lucky_digit: Optional[int] = None
+    swap: Optional[Tuple[int, ...]] = None  # 事件 101：第 i 名玩家拿到 guesses[swap[i]]
+    max_hp: int = 10
+
+
+class RoundResult(NamedTuple):
+    avg: float
+    target: float
+    values: Tuple[int, ...]             # 交换后的数字
+    sources: Tuple[int, ...]            # values[i] 原本属于哪名玩家
+    won: Tuple[bool, ...]
+    damage: Tuple[int, ...]
+    hp_after: Tuple[int, ...]
+    hp_delta: Tuple[int, ...]
+    rule_ids: FrozenSet[int]            # 实际生效的规则 (含决战强制的规则 3)
+    extreme: bool = False
+    conflict: bool = False
+    precise: bool = False
+
+    @property
+    def winners(self):
+        return tuple(i for i, w in enumerate(self.won) if w)
+
+    @property
+    def swapped(self):
+        return any(i != s for i, s in enumerate(self.sources))
+
+
+def derangement(n, rng=random):
+    # 事件 101 的全员交换：任何人都拿不回自己的数字
+    indices = list(range(n))
+    is_fixed = True
+    while is_fixed:
+        rng.shuffle(indices)
+        is_fixed = any(i == idx for i, idx in enumerate(indices))
+    return tuple(indices)
+
+
+def effective_rule_ids(rule_ids, alive_count):
+    if alive_count <= 2:
+        return frozenset(rule_ids) | {DUEL_RULE}
+    return frozenset(rule_ids)
+
+
+class Pipeline:
+    # 一组生效规则 (含本回合事件) 编译后的钩子序列；不可变，相同组合的房间共享同一实例
+    __slots__ = ("rule_ids", "event_id", "swap", "weight", "samples", "target", "candidates", "judge", "damage",
+                 "post")
+
+    def __init__(self, rule_ids, event_id):
+        self.rule_ids = rule_ids
+        self.event_id = event_id
+        active = [RULES[rid] for rid in sorted(rule_ids) if rid in RULES]
+        if event_id in RULES:
+            active.append(RULES[event_id])
+        active.sort(key=lambda r: r.order)  # 稳定排序：order 相同时保持 id 顺序
+        self.swap = any(r.swap for r in active)
+        for hook in ("weight", "samples", "target", "candidates", "judge", "damage", "post"):
+            setattr(self, hook, tuple(getattr(r, hook) for r in active if getattr(r, hook)))
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return compile_pipeline, (self.rule_ids, self.event_id)
+
+    def for_alive(self, alive_count):
+        # 决战 (剩两人) 时强制加入规则 3
+        if alive_count <= 2 and DUEL_RULE not in self.rule_ids:
+            return compile_pipeline(self.rule_ids | {DUEL_RULE}, self.event_id)
+        return self
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_pipeline(rule_ids, event_id=None):
+    # rule_ids 为 frozenset；只在房间的规则或事件变化时调用 (见 game.compile_room_rules)
+    return Pipeline(frozenset(rule_ids), event_id)
+
+
+class RoundContext:
+    # 钩子读写的本回合中间状态；未被钩子改写的字段沿用类属性上的默认值
+    min_diff = None
+    won = ()
+    decided = False  # 胜者已由规则直接决定，不再按目标值比较
+    base_damage = 1
+    top_hp = None
+    extreme = conflict = precise = False
+
+    def __init__(self, inp, values):
+        self.n = len(values)
+        self.values = values
+        self.hps = inp.hps
+        self.ghost_values = inp.ghost_values
+        self.lucky_digit = inp.lucky_digit
+        self.max_hp = inp.max_hp
+
+
+def resolve_round(inp, pipeline=None):
+    # pipeline 缺省时按 inp.rule_ids / inp.event_id 编译 (有缓存)；房间调用时传入预编译的流水线
+    n = len(inp.guesses)
+    if pipeline is None:
+        pipeline = compile_pipeline(frozenset(inp.rule_ids), inp.event_id)
+    pipeline = pipeline.for_alive(n)
+    sources = inp.swap if inp.swap is not None and n > 1 else tuple(range(n))
+    values = tuple(inp.guesses[s] for s in sources)
+    hps = inp.hps
+    ctx = RoundContext(inp, values)
+
+    if pipeline.weight:
+        total_val = total_w = 0
+        for i, val in enumerate(values):
+            w = 1
+            for hook in pipeline.weight:
+                w = hook(ctx, i, w)
+            total_val += val * w
+            total_w += w
+    else:
+        total_val, total_w = sum(values), n
+    for hook in pipeline.samples:
+        extra_val, extra_w = hook(ctx)
+        total_val += extra_val
+        total_w += extra_w
+
+    avg = total_val / total_w if total_w else 0
+    target = avg * inp.multiplier
+    for hook in pipeline.target:
+        target = hook(ctx, target)
+
+    candidates = range(n)
+    for hook in pipeline.candidates:
+        candidates = hook(ctx, candidates)
+        if ctx.decided:
+            break
+    if candidates:
+        diffs = [abs(values[i] - target) for i in candidates]
+        ctx.min_diff = min(diffs)
+        winner_set = {i for i, d in zip(candidates, diffs) if d == ctx.min_diff}
+    else:
+        winner_set = set()
+    won = ctx.won = tuple(i in winner_set for i in range(n))
+    for hook in pipeline.judge:
+        hook(ctx)
+
+    base_damage = ctx.base_damage
+    if pipeline.damage or pipeline.post:
+        damage = []
+        hp_after = []
+        for i, (hp, is_winner) in enumerate(zip(hps, won)):
+            dmg = 0
+            if not is_winner:
+                dmg = base_damage
+                for hook in pipeline.damage:
+                    dmg = hook(ctx, i, dmg)
+                hp -= dmg
+            for hook in pipeline.post:
+                hp = hook(ctx, i, hp)
+            damage.append(dmg)
+            hp_after.append(hp)
+    else:
+        damage = [0 if is_winner else base_damage for is_winner in won]
+        hp_after = [hp - dmg for hp, dmg in zip(hps, damage)]
+
+    return RoundResult(
+        avg=avg, target=target, values=values, sources=tuple(sources), won=won,
+        damage=tuple(damage), hp_after=tuple(hp_after),
+        hp_delta=tuple(a - b for a, b in zip(hp_after, hps)), rule_ids=pipeline.rule_ids,
+        extreme=ctx.extreme, conflict=ctx.conflict, precise=ctx.precise,
+    )
+
+
+# 批量模式的矩阵实现覆盖以下规则与事件；出现其它注册规则的回合逐个按流水线结算
+VECTORIZED_RULES = frozenset({1, 2, 3, 4, 5, 6})
+VECTORIZED_EVENTS = frozenset({None, 101, 102, 103, 104, 105, 106})
+
+
+def resolve_rounds(inputs):
+    # 批量结算大量相互独立的回合；有 numpy 时按 (回合, 玩家) 矩阵整体计算
+    inputs = list(inputs)
+    if np is None or not inputs:
+        return [resolve_round(inp) for inp in inputs]
+    if any(not inp.rule_ids <= VECTORIZED_RULES or inp.event_id not in VECTORIZED_EVENTS for inp in inputs):
+        vector = [i for i, inp in enumerate(inputs)
+                  if inp.rule_ids <= VECTORIZED_RULES and inp.event_id in VECTORIZED_EVENTS]
+        results = [None] * len(inputs)
+        for i, result in zip(vector, resolve_rounds([inputs[i] for i in vector])):
+            results[i] = result
+        return [r if r is not None else resolve_round(inp) for r, inp in zip(results, inputs)]
+
+    rounds = len(inputs)
+    width = max(len(inp.guesses) for inp in inputs) or 1
+    sizes = [len(inp.guesses) for inp in inputs]
+    effective = [effective_rule_ids(inp.rule_ids, n) for inp, n in zip(inputs, sizes)]
+    pad = [(0,) * (width - n) for n in sizes]
+    identity = tuple(range(width))
+
+    mask = np.arange(width)[None, :] < np.array(sizes)[:, None]
+    raw = np.array([inp.guesses + p for inp, p in zip(inputs, pad)], dtype=np.int64)
+    hps = np.array([inp.hps + p for inp, p in zip(inputs, pad)], dtype=np.int64)
+    perm = np.array([
+        inp.swap + identity[n:] if inp.swap is not None and n > 1 else identity
+        for inp, n in zip(inputs, sizes)
+    ], dtype=np.int64)
+    rule_flags = np.array([[rid in rules for rid in range(7)] for rules in effective], dtype=bool)
+    event = np.array([inp.event_id or 0 for inp in inputs], dtype=np.int64)
+    mult = np.array([inp.multiplier for inp in inputs], dtype=float)
+    ghost_sum = np.array([sum(inp.ghost_values) for inp in inputs], dtype=np.int64)
+    ghost_cnt = np.array([len(inp.ghost_values) for inp in inputs], dtype=np.int64)
+    lucky = np.array([-1 if inp.lucky_digit is None else inp.lucky_digit for inp in inputs], dtype=np.int64)
+    max_hp = np.array([inp.max_hp for inp in inputs], dtype=np.int64)
+
+    vals = np.take_along_axis(raw, perm, axis=1)
+    r1, r2, r3, r4, r5, r6 = (rule_flags[:, i] for i in range(1, 7))
+
+    w = np.where(r5[:, None] & (hps < 3), 3, 1) * mask
+    total_val = (vals * w).sum(axis=1) + np.where(r4, ghost_sum, 0)
+    total_w = w.sum(axis=1) + np.where(r4, ghost_cnt, 0)
+    avg = np.divide(total_val, total_w, out=np.zeros(rounds), where=total_w > 0)
+    target = avg * mult
+    target = np.where(event == EVENT_REVOLUTION, 100 - target, target)
+
+    extreme = r3 & (mask & (vals == 0)).any(axis=1) & (mask & (vals == 100)).any(axis=1)
+
+    same = (vals[:, :, None] == vals[:, None, :]) & mask[:, None, :]
+    counts = same.sum(axis=2)
+    conflict = ~extreme & r1 & (mask & (counts > 1)).any(axis=1)
+    candidates = mask & (~r1[:, None] | (counts == 1))
+    diff = np.abs(vals - target[:, None])
+    min_diff = np.where(candidates, diff, np.inf).min(axis=1)
+    has_candidate = candidates.any(axis=1)
+    won = np.where(extreme[:, None], mask & (vals == 100), candidates & (diff == min_diff[:, None]))
+    precise = ~extreme & r2 & has_candidate & (min_diff < 1)
+    base_damage = np.where(precise, 2, 1)
+
+    max_hp_val = np.where(mask, hps, np.iinfo(np.int64).min).max(axis=1)
+    safe = (event == EVENT_SAFE)[:, None]
+    dmg = np.where(won | ~mask, 0, base_damage[:, None])
+    dmg = np.where(safe & ~won & (vals >= 40) & (vals <= 60), 0, dmg)
+    dmg = dmg + (r6[:, None] & ~won & mask & (hps == max_hp_val[:, None]))
+    hp_after = np.where(won & safe, np.minimum(max_hp[:, None], hps + 1), hps - dmg)
+    lucky_hit = ((event == EVENT_LUCKY) & (lucky >= 0))[:, None] & (vals % 10 == lucky[:, None])
+    hp_after = np.where(lucky_hit, np.minimum(max_hp[:, None], hp_after + 1), hp_after)
+
+    avg_l, target_l = avg.tolist(), target.tolist()
+    vals_l, perm_l, won_l = vals.tolist(), perm.tolist(), won.tolist()
+    dmg_l, hp_after_l, delta_l = dmg.tolist(), hp_after.tolist(), (hp_after - hps).tolist()
+    extreme_l, conflict_l, precise_l = extreme.tolist(), conflict.tolist(), precise.tolist()
+    return [
+        RoundResult(
+            avg=avg_l[r], target=target_l[r],
+            values=tuple(vals_l[r][:n]), sources=tuple(perm_l[r][:n]), won=tuple(won_l[r][:n]),
+            damage=tuple(dmg_l[r][:n]), hp_after=tuple(hp_after_l[r][:n]), hp_delta=tuple(delta_l[r][:n]),
+            rule_ids=effective[r], extreme=extreme_l[r], conflict=conflict_l[r], precise=precise_l[r],
+        )
+        for r, n in enumerate(sizes)
+    ]
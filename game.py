@@ -0,0 +1,247 @@
+# 房间内的游戏规则：只读写房间对象 (state.Room)，不涉及网络、计时与数据库。
+# 服务器 (app.py) 与离线模拟器 (simulate.py) 共用这里的逻辑。
+import random
+from copy import deepcopy
+
+from engine import RoundInput, resolve_round, derangement, compile_pipeline, EVENT_SWAP, EVENT_REVOLUTION
+from rules import RULES, rules_of_type
+from state import Room, Player, Spectator, new_logs
+
+MAX_HP = 10
+
+# 平衡参数 (模拟器可覆盖)
+BASE_MULTIPLIER = 0.8
+DUEL_SWAP_CHANCE = 0.7   # 剩两人时触发【混乱】的概率
+EVENT_CHANCE = 0.4       # 其余情况下触发随机限定事件的概率
+
+BASIC_RULES = [
+    "每轮选取 0 至 100 之间的整数。",
+    "目标值为全员平均数的 X 倍 (默认为 0.8)。",
+    "最接近目标者获胜，其余玩家扣除 1 点生命。",
+    "玩家淘汰时，追加永久规则。",
+    "每回合可能触发随机限定规则。"
+]
+
+# 规则与事件的定义与结算效果见 rules.py；这里是下发给前端 / 管理面板的格式
+PERMANENT_RULE_POOL = [r.to_dict() for r in rules_of_type("perm")]
+ROUND_EVENT_POOL = [r.to_dict() for r in rules_of_type("temp")]
+
+PERM_RULE_BY_ID = {r["id"]: r for r in PERMANENT_RULE_POOL}
+ROUND_EVENT_BY_ID = {e["id"]: e for e in ROUND_EVENT_POOL}
+
+
+def init_room_state(room_id, room_name):
+    room = Room(
+        id=room_id, name=room_name, multiplier=BASE_MULTIPLIER,
+        basic_rules=BASIC_RULES, available_perm_rules=list(PERMANENT_RULE_POOL)
+    )
+    compile_room_rules(room)
+    return room
+
+def compile_room_rules(room):
+    # 房间的永久规则变化后重新编译结算流水线与规则描述，每回合结算直接使用
+    rule_ids = frozenset(r["id"] for r in room.rules)
+    room.pipeline = compile_pipeline(rule_ids, room.round_event["id"] if room.round_event else None)
+    room_desc = {r["id"]: r["desc"] for r in room.rules}
+
+    def descs(pipeline, duel):
+        result = []
+        for rid in sorted(pipeline.rule_ids):
+            rule = RULES.get(rid)
+            if rule is None or rule.type != "perm": continue
+            desc = rule.duel_desc if duel and rule.duel_desc else rule.desc
+            result.append(room_desc.get(rid, desc))
+        return tuple(result)
+
+    room.rule_descs = (descs(room.pipeline, False), descs(room.pipeline.for_alive(2), True))
+
+def set_round_event(room, event):
+    # 本回合事件变化只换流水线，规则描述不受影响
+    room.round_event = event
+    room.pipeline = compile_pipeline(room.pipeline.rule_ids, event["id"] if event else None)
+
+def new_player(uid, name, rank_info=None, score=0):
+    return Player(uid=uid, name=name, hp=MAX_HP, rank_info=rank_info, score=score)
+
+def new_spectator(uid, name):
+    return Spectator(uid=uid, name=name)
+
+def reset_room_state(room):
+    # 回到大厅：保留玩家、观战者与房间设置，清空本局数据
+    for p in room.players.values():
+        p.hp = MAX_HP
+        p.alive = True
+        p.guess = None
+        p.submitted = p.confirmed = p.ready = p.is_winner = p.suicided = False
+        p.last_dmg = p.likes = p.likes_sent = p.points_change = p.hp_at_death = 0
+    room.phase = "LOBBY"
+    room.round = 0
+    room.rules = []
+    room.logs = new_logs()
+    room.new_rule = None
+    room.round_event = None
+    room.multiplier = BASE_MULTIPLIER
+    room.dead_guesses = []
+    room.blind_mode = False
+    room.full_history = []
+    room.kick_votes = {}
+    room.pending_events = {"perm": [], "temp": None}
+    room.available_perm_rules = list(PERMANENT_RULE_POOL)
+    room.elimination_stack = []
+    room.basic_rules = BASIC_RULES
+    room.announcement_queue = []
+    compile_room_rules(room)
+
+def apply_round_event(room, event):
+    event_copy = deepcopy(event)
+    rule = RULES.get(event_copy["id"])
+    if rule and rule.apply:
+        rule.apply(room, event_copy)
+    set_round_event(room, event_copy)
+
+def trigger_room_rule(room, new_rule, log_append="", author_name=None):
+    rule_copy = deepcopy(new_rule)
+    if author_name:
+        rule_copy["desc"] += f" (💀 {author_name})"
+    room.rules.append(rule_copy)
+    compile_room_rules(room)
+    room.announcement_queue.append(rule_copy)
+    room.new_rule = rule_copy
+    if log_append: log_append += f" | {rule_copy['desc']}"
+
+def apply_pending_perm_rules(room):
+    # 管理员预设的永久规则在下一回合开始前生效
+    if room.pending_events["perm"]:
+        for pid in room.pending_events["perm"]:
+            rule_obj = PERM_RULE_BY_ID.get(pid)
+            if rule_obj:
+                if rule_obj in room.available_perm_rules:
+                    room.available_perm_rules.remove(rule_obj)
+                trigger_room_rule(room, rule_obj)
+        room.pending_events["perm"] = []
+
+def begin_round(room):
+    room.phase = "INPUT"
+    room.round += 1
+    room.multiplier = BASE_MULTIPLIER
+    if room.round_event is not None:
+        set_round_event(room, None)
+    room.blind_mode = False
+
+    for p in room.players.values():
+        p.submitted = False
+        p.guess = None
+
+    alive_count = sum(1 for p in room.players.values() if p.alive)
+
+    pending_temp_id = room.pending_events["temp"]
+    if pending_temp_id:
+        event = ROUND_EVENT_BY_ID.get(pending_temp_id)
+        if event: apply_round_event(room, event)
+        room.pending_events["temp"] = None
+    else:
+        # 决斗换数也只从当前事件池里取 (simulate.py --disable-event 会从池中移除事件)
+        swap_event = next((e for e in ROUND_EVENT_POOL if e["id"] == EVENT_SWAP), None)
+        if alive_count == 2 and swap_event is not None and random.random() < DUEL_SWAP_CHANCE:
+            apply_round_event(room, swap_event)
+        elif random.random() < EVENT_CHANCE:
+            other_events = [e for e in ROUND_EVENT_POOL if e["id"] != EVENT_SWAP]
+            if other_events:
+                event = random.choice(other_events)
+                apply_round_event(room, event)
+
+def resolve_room_round(room):
+    # 结算当前回合并写回房间；返回 (是否终局, 胜者 uid)。调用方保证至少一名存活玩家。
+    players = room.players
+    alive = [p for p in players.values() if p.alive]
+
+    values = []
+    for p in alive:
+        val = p.guess
+        if val is None: val = random.randint(0, 100)
+        values.append(val)
+
+    if room.pipeline is None:
+        compile_room_rules(room)
+    pipeline = room.pipeline
+    event = room.round_event
+    event_id = event["id"] if event else None
+    swap = derangement(len(alive)) if pipeline.swap and len(alive) > 1 else None
+    result = resolve_round(RoundInput(
+        guesses=tuple(values),
+        hps=tuple(p.hp for p in alive),
+        rule_ids=pipeline.rule_ids,
+        event_id=event_id,
+        multiplier=room.multiplier,
+        ghost_values=tuple(room.dead_guesses),
+        lucky_digit=event.get("lucky_digit") if event else None,
+        swap=swap,
+        max_hp=MAX_HP
+    ), pipeline)
+    avg, target = result.avg, result.target
+
+    log_msg = f"R{room.round}"
+    if swap: log_msg += " | ⚡交换"
+    if event_id == EVENT_REVOLUTION:
+        log_msg += f": 革命! {target:.2f}"
+    else:
+        log_msg += f": 均值 {avg:.2f} -> 目标 {target:.2f}"
+    if result.extreme: log_msg += " | 极值(100胜)"
+    if result.conflict: log_msg += " | 冲突"
+    if result.precise: log_msg += " | 精准"
+
+    round_details = []
+    for i, p in enumerate(alive):
+        p.hp = result.hp_after[i]
+        p.last_dmg = result.damage[i]
+        p.is_winner = result.won[i]
+        round_details.append({
+            "uid": p.uid, "name": p.name, "val": result.values[i],
+            "org_val": values[i], "source": alive[result.sources[i]].name,
+            "hp": p.hp, "dmg": result.damage[i], "win": result.won[i]
+        })
+
+    active_rules_desc = list(room.rule_descs[1 if len(alive) <= 2 else 0])
+
+    room.full_history.append({
+        "round_num": room.round, "target": round(target, 2), "avg": round(avg, 2),
+        "event_desc": event["desc"] if event else None,
+        "active_rules": active_rules_desc, "player_data": round_details
+    })
+
+    newly_dead = [p for p in players.values() if p.hp <= 0 and p.alive]
+    current_alive_count = sum(1 for p in players.values() if p.hp > 0)
+
+    dead_vals = {d["uid"]: d["val"] for d in round_details}
+    for p in newly_dead:
+        p.alive = False
+        room.dead_guesses.append(dead_vals.get(p.uid, 0))
+        if p.uid not in room.elimination_stack:
+            room.elimination_stack.append(p.uid)
+
+    # 规则触发
+    if newly_dead:
+        rule_3 = None
+        if current_alive_count == 2:
+            rule_3 = next((r for r in room.available_perm_rules if r["id"] == 3), None)
+            if rule_3:
+                room.available_perm_rules.remove(rule_3)
+                trigger_room_rule(room, rule_3, author_name="System")
+
+        if room.available_perm_rules and not rule_3:
+             idx = random.randint(0, len(room.available_perm_rules) - 1)
+             new_rule = room.available_perm_rules.pop(idx)
+             trigger_room_rule(room, new_rule)
+
+    room.last_result = {
+        "avg": round(avg, 2), "target": round(target, 2), "details": round_details, "log": log_msg
+    }
+    room.logs.appendleft(log_msg)
+
+    if current_alive_count <= 1:
+        winner_uid = None
+        if current_alive_count == 1:
+            winner = next((p for p in players.values() if p.alive), None)
+            if winner: winner_uid = winner.uid
+        return True, winner_uid
+    return False, None
@@ -0,0 +1,59 @@
+# 全局排行榜：内存中按 (-积分, uid) 有序的索引，积分变化时增量调整，查名次为二分查找。
+from bisect import bisect_left, insort
+
+
+class Leaderboard:
+    def __init__(self):
+        self._keys = []      # 有序的 (-score, uid)
+        self._entries = {}   # uid -> {"uid", "nickname", "score", "ultimate_title"}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, rows):
+        # rows: 可迭代的 (uid, nickname, score, title)，启动时从 User 表整体重建
+        self._entries = {
+            uid: {"uid": uid, "nickname": nickname, "score": score or 0, "ultimate_title": title}
+            for uid, nickname, score, title in rows
+        }
+        self._keys = sorted((-e["score"], uid) for uid, e in self._entries.items())
+
+    def add(self, uid, nickname, score=0, title=None):
+        if uid in self._entries:
+            self._remove_key(uid)
+        self._entries[uid] = {"uid": uid, "nickname": nickname, "score": score, "ultimate_title": title}
+        insort(self._keys, (-score, uid))
+
+    def update(self, uid, score_delta=0, **fields):
+        # 返回是否有排行榜关心的字段发生变化；其它字段 (如密码) 忽略
+        entry = self._entries.get(uid)
+        if entry is None: return False
+        changed = False
+        for key in ("nickname", "ultimate_title"):
+            if key in fields and fields[key] != entry[key]:
+                entry[key] = fields[key]
+                changed = True
+        if score_delta:
+            self._remove_key(uid)
+            entry["score"] += score_delta
+            insort(self._keys, (-entry["score"], uid))
+            changed = True
+        return changed
+
+    def _remove_key(self, uid):
+        key = (-self._entries[uid]["score"], uid)
+        idx = bisect_left(self._keys, key)
+        if idx < len(self._keys) and self._keys[idx] == key:
+            del self._keys[idx]
+
+    def rank(self, uid):
+        # 名次从 1 开始；同分按 uid 排序，保证名次稳定
+        entry = self._entries.get(uid)
+        if entry is None: return None
+        return bisect_left(self._keys, (-entry["score"], uid)) + 1
+
+    def get(self, uid):
+        return self._entries.get(uid)
+
+    def top(self, n):
+        return [self._entries[uid] for _, uid in self._keys[:n]]
@@ -0,0 +1,450 @@
+# Socket.IO 压测：在本地用临时 SQLite 与 instance 目录启动 wsgi.py，按并发阶梯模拟满员房间。
+# 每个房间由一名房主、若干玩家与观战者组成，完整走 登录 -> 建房/进房 -> 准备 -> 确认规则 -> 提交数字 -> 重开 的流程，
+# 同时刷表情与点赞，并按概率在对局中断线重连。每个阶梯结束时报告：
+#   submit_guess 到本连接收到自己 "已提交" 状态帧的延迟 p50 / p99
+#   丢帧 (补丁 base 与本地版本不衔接，需要 request_sync 的次数)
+#   服务器进程的 CPU 与 RSS (读取 /proc，仅 Linux)
+#
+#   pip install "python-socketio[client]"
+#   python loadtest.py --steps 2,5,10 --players 6 --spectators 2 --step-seconds 60
+#   python loadtest.py --steps 20 --think 0.2,1 --spam 0.5 --reconnect 0.05 --codec msgpack --json
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from copy import deepcopy
+
+import wire
+
+try:
+    import socketio
+except ImportError:  # 服务器本身不需要客户端依赖
+    socketio = None
+
+EMOTES = ["😆", "😭", "❓", "😱"]
+
+
+def apply_state_ops(state, ops):
+    # 与 app.apply_state_ops 相同；这里不导入 app，避免在压测进程里启动服务器逻辑
+    for op in ops:
+        path = op[1]
+        node = state
+        for key in path[:-1]:
+            node = node[key]
+        if op[0] == "set":
+            node[path[-1]] = deepcopy(op[2])
+        elif op[0] == "push":
+            node[path[-1]].extend(deepcopy(op[2]))
+        elif op[0] == "del":
+            del node[path[-1]]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+# --- 服务器进程 ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(workdir, port, max_rooms):
+    env = dict(os.environ, PORT=str(port), HOST="127.0.0.1", MAX_ROOMS_PER_WORKER=str(max_rooms),
+               INSTANCE_PATH=workdir, DATABASE_URL="sqlite:///" + os.path.join(workdir, "game.db"))
+    env.pop("MESSAGE_QUEUE", None)
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    proc = subprocess.Popen([sys.executable, "wsgi.py"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited, see {log.name}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return proc
+        except OSError:
+            eventlet.sleep(0.2)
+    proc.kill()
+    raise SystemExit("server did not start within 30s")
+
+
+class ProcStats:
+    # 读取 /proc/<pid>：CPU 为两次采样间的占用率，RSS 取阶梯内最大值
+    def __init__(self, pid):
+        self.pid = pid
+        self.ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+    def cpu_seconds(self):
+        try:
+            with open(f"/proc/{self.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / self.ticks
+        except (OSError, IndexError, ValueError):
+            return None
+
+    def rss_bytes(self):
+        try:
+            with open(f"/proc/{self.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            return None
+        return None
+
+
+# --- 合成客户端 ---
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.frames = 0
+        self.dropped = 0
+        self.submits = 0
+        self.games = 0
+        self.reconnects = 0
+        self.errors = 0
+
+
+class Bot:
+    def __init__(self, run, uid, room_slot, role):
+        self.run = run
+        self.uid = uid
+        self.room_slot = room_slot
+        self.role = role  # owner / player / spectator
+        self.client = None
+        self.state = None
+        self.phase = None
+        self.submit_at = None
+        self.submitted_at = None
+        self.sent = {}  # 动作 -> 上次发送时间，避免在同一状态下重复发送
+        self.reconnect_done = None
+        self.resume_token = None
+
+    # 连接与事件
+
+    def connect(self, resume=None):
+        client = socketio.Client(reconnection=False)
+        client.on("login_result", self.on_login_result)
+        client.on("resume_result", self.on_login_result)
+        client.on("room_created", self.on_room_created)
+        client.on("state_update", self.on_state_update)
+        client.on("state_patch", self.on_state_patch)
+        client.on("room_events", self.on_room_events)
+        client.on("reconnect_room", self.on_reconnect_room)
+        client.on("error_msg", self.on_error)
+        self.logged_in = eventlet.Event()
+        url = self.run.url + ("?codec=msgpack" if self.run.codec == "msgpack" else "")
+        client.connect(url, transports=["websocket"])
+        self.client = client
+        if resume:
+            client.emit("resume", resume)
+        else:
+            client.emit("login", {"uid": self.uid, "password": "loadtest", "nickname": self.uid})
+        self.logged_in.wait()
+
+    def on_login_result(self, data):
+        if data.get("success"):
+            self.resume_token = data.get("resume_token")
+        else:
+            self.run.stats.errors += 1
+        self.logged_in.send(True)
+
+    def on_room_created(self, data):
+        self.run.room_ids[self.room_slot].send(data["room_id"])
+
+    def on_error(self, data):
+        self.run.stats.errors += 1
+        print(f"{self.uid}: {data.get('msg')}", file=sys.stderr)
+
+    def decode(self, frame):
+        return wire.unpack(frame) if isinstance(frame, (bytes, bytearray)) else frame
+
+    def on_state_update(self, frame):
+        self.run.stats.frames += 1
+        self.set_state(self.decode(frame))
+
+    def on_reconnect_room(self, data):
+        self.run.stats.frames += 1
+        self.set_state(self.decode(data["room"]))
+        if self.reconnect_done:
+            self.reconnect_done.send(True)
+
+    def on_state_patch(self, data):
+        self.run.stats.frames += 1
+        state = self.state
+        if state is None or state.get("id") != data["room_id"] or data["rev"] <= state["rev"]:
+            return
+        if data["base"] != state["rev"]:
+            self.run.stats.dropped += 1
+            self.client.emit("request_sync")
+            return
+        apply_state_ops(state, data["ops"])
+        state["rev"] = data["rev"]
+        self.observe()
+
+    def on_room_events(self, data):
+        # 准备 / 提交 / 确认与点赞合并在轻量帧里，按当前值覆盖
+        self.run.stats.frames += 1
+        state = self.state
+        if state is None or state.get("id") != data["room_id"]:
+            return
+        for uid, changes in data["players"].items():
+            if uid in state["players"]:
+                state["players"][uid].update(changes)
+        self.observe()
+
+    def set_state(self, state):
+        self.state = state
+        self.observe()
+
+    def me(self):
+        return (self.state or {}).get("players", {}).get(self.uid)
+
+    def observe(self):
+        # 收到状态后：记录提交延迟与阶段切换
+        me = self.me()
+        if self.submitted_at is not None and me and me["submitted"]:
+            self.run.stats.latencies.append(time.perf_counter() - self.submitted_at)
+            self.submitted_at = None
+        phase = self.state.get("phase")
+        if phase != self.phase:
+            if phase == "END" and self.role == "owner":
+                self.run.stats.games += 1
+            self.phase = phase
+            self.sent.clear()
+            self.submit_at = None
+
+    # 行为
+
+    def once(self, action, event, data=None, every=1.0):
+        now = time.monotonic()
+        if now - self.sent.get(action, -every) >= every:
+            self.sent[action] = now
+            if data is None:
+                self.client.emit(event)
+            else:
+                self.client.emit(event, data)
+
+    def act(self):
+        state, me, args = self.state, self.me(), self.run.args
+        if state is None:
+            return
+        phase = state["phase"]
+        if args.spam and random.random() < args.spam * args.tick:
+            if random.random() < 0.5:
+                self.client.emit("send_emote", {"uid": self.uid, "emote": random.choice(EMOTES)})
+            elif state["players"]:
+                self.client.emit("send_like", {"target_uid": random.choice(list(state["players"]))})
+        if self.role == "spectator" or me is None:
+            return
+        if phase == "LOBBY":
+            if not me["ready"]:
+                self.once("ready", "toggle_ready")
+            elif self.role == "owner":
+                players = state["players"].values()
+                if len(state["players"]) >= 3 and all(p["ready"] for p in players):
+                    self.once("start", "request_start_game", every=2.0)
+        elif phase in ("PRE_GAME", "RULE_ANNOUNCEMENT"):
+            if not me["confirmed"]:
+                self.once("confirm", "confirm_rule")
+        elif phase == "INPUT" and me["alive"] and not me["submitted"]:
+            if self.submit_at is None:
+                self.submit_at = time.monotonic() + random.uniform(*args.think)
+                if random.random() < args.reconnect:
+                    self.reconnect()
+                    return
+            elif time.monotonic() >= self.submit_at and self.submitted_at is None:
+                self.submitted_at = time.perf_counter()
+                self.run.stats.submits += 1
+                self.client.emit("submit_guess", {"val": random.randint(0, 100)})
+        elif phase == "END":
+            self.once("reset", "reset_game", every=5.0)
+
+    def reconnect(self):
+        # 模拟断线：丢弃连接与本地状态，用恢复令牌重新接回房间；服务器不签发令牌时重新登录后 identify
+        room_id = self.state.get("id") if self.state else None
+        self.client.disconnect()
+        self.state = None
+        self.submit_at = None
+        self.submitted_at = None
+        self.run.stats.reconnects += 1
+        self.reconnect_done = eventlet.Event()
+        if self.resume_token:
+            self.connect(resume={"token": self.resume_token, "room_id": room_id})
+        else:
+            self.connect()
+            self.client.emit("identify", {"uid": self.uid})
+        with eventlet.Timeout(10, False):
+            self.reconnect_done.wait()
+        self.reconnect_done = None
+
+    def main(self, stop_at):
+        try:
+            self.connect()
+            if self.role == "owner":
+                self.client.emit("create_room", {"name": f"loadtest {self.room_slot}"})
+            room_id = self.run.room_ids[self.room_slot].wait()
+            self.client.emit("join_room", {"room_id": room_id, "uid": self.uid,
+                                           "is_spectator": self.role == "spectator"})
+            while time.monotonic() < stop_at:
+                self.act()
+                eventlet.sleep(self.run.args.tick)
+        except Exception as e:
+            self.run.stats.errors += 1
+            print(f"{self.uid}: {e!r}", file=sys.stderr)
+        finally:
+            if self.client:
+                self.client.emit("leave_room_req")
+                self.client.disconnect()
+
+
+class StepRun:
+    def __init__(self, args, url, step, rooms):
+        self.args = args
+        self.url = url
+        self.codec = args.codec
+        self.stats = Stats()
+        self.room_ids = [eventlet.Event() for _ in range(rooms)]
+        tag = f"{step}{random.randint(1000, 9999)}"
+        self.bots = []
+        for slot in range(rooms):
+            for i in range(args.players):
+                self.bots.append(Bot(self, f"lt{tag}r{slot}p{i}", slot, "owner" if i == 0 else "player"))
+            for i in range(args.spectators):
+                self.bots.append(Bot(self, f"lt{tag}r{slot}s{i}", slot, "spectator"))
+
+    def execute(self, seconds):
+        stop_at = time.monotonic() + seconds
+        pool = eventlet.GreenPool(len(self.bots))
+        for bot in self.bots:
+            pool.spawn_n(bot.main, stop_at)
+            eventlet.sleep(self.args.ramp / max(1, len(self.bots)))
+        pool.waitall()
+
+
+def run_step(args, url, proc_stats, step, rooms):
+    run = StepRun(args, url, step, rooms)
+    cpu0, wall0 = proc_stats.cpu_seconds() if proc_stats else None, time.monotonic()
+    rss = []
+    sampler = eventlet.spawn(sample_rss, proc_stats, rss) if proc_stats else None
+    run.execute(args.step_seconds)
+    if sampler:
+        sampler.kill()
+    cpu1, wall1 = proc_stats.cpu_seconds() if proc_stats else None, time.monotonic()
+    s = run.stats
+    return {
+        "rooms": rooms,
+        "clients": len(run.bots),
+        "games": s.games,
+        "submits": s.submits,
+        "latency_p50_ms": ms(percentile(s.latencies, 0.5)),
+        "latency_p99_ms": ms(percentile(s.latencies, 0.99)),
+        "frames": s.frames,
+        "dropped_frames": s.dropped,
+        "reconnects": s.reconnects,
+        "errors": s.errors,
+        "server_cpu_pct": round((cpu1 - cpu0) / (wall1 - wall0) * 100, 1) if cpu0 is not None and cpu1 is not None else None,
+        "server_rss_mb": round(max(rss) / 2**20, 1) if rss else None,
+    }
+
+
+def sample_rss(proc_stats, out):
+    while True:
+        value = proc_stats.rss_bytes()
+        if value:
+            out.append(value)
+        eventlet.sleep(1)
+
+
+def ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def parse_range(text):
+    low, _, high = text.partition(",")
+    return float(low), float(high or low)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Socket.IO load test with synthetic full rooms")
+    parser.add_argument("--steps", default="1,2,5", help="每个阶梯的并发房间数，逗号分隔")
+    parser.add_argument("--players", type=int, default=6, help="每房间玩家数 (3-8)")
+    parser.add_argument("--spectators", type=int, default=1, help="每房间观战者数")
+    parser.add_argument("--step-seconds", type=float, default=60)
+    parser.add_argument("--think", type=parse_range, default=(0.5, 3.0), help="提交前的思考时间范围 (秒)，如 0.5,3")
+    parser.add_argument("--spam", type=float, default=0.2, help="每个客户端每秒发送表情 / 点赞的次数")
+    parser.add_argument("--reconnect", type=float, default=0.02, help="每回合断线重连的概率")
+    parser.add_argument("--codec", choices=["json", "msgpack"], default="json")
+    parser.add_argument("--ramp", type=float, default=2.0, help="每个阶梯内客户端逐个接入的总时长 (秒)")
+    parser.add_argument("--tick", type=float, default=0.1, help="客户端行为循环间隔 (秒)")
+    parser.add_argument("--url", help="压测已运行的服务器而不是启动本地实例")
+    parser.add_argument("--server-pid", type=int, help="配合 --url 读取该进程的 CPU / RSS")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是文本报告")
+    args = parser.parse_args(argv)
+
+    if socketio is None:
+        raise SystemExit('loadtest requires the Socket.IO client: pip install "python-socketio[client]"')
+    if not 3 <= args.players <= 8:
+        raise SystemExit("--players must be between 3 and 8")
+    if args.codec == "msgpack" and wire.msgpack is None:
+        raise SystemExit("msgpack is not installed")
+    random.seed(args.seed)
+    steps = [int(x) for x in args.steps.split(",")]
+
+    workdir = proc = None
+    if args.url:
+        url, pid = args.url, args.server_pid
+    else:
+        workdir = tempfile.mkdtemp(prefix="balance-loadtest-")
+        port = free_port()
+        # 对局中途离开的房间不会立即删除，容量按所有阶梯之和预留
+        proc = start_server(workdir, port, sum(steps))
+        url, pid = f"http://127.0.0.1:{port}", proc.pid
+    proc_stats = ProcStats(pid) if pid and os.path.exists(f"/proc/{pid}") else None
+
+    results = []
+    try:
+        for step, rooms in enumerate(steps):
+            result = run_step(args, url, proc_stats, step, rooms)
+            results.append(result)
+            if not args.json:
+                print_step(result)
+            eventlet.sleep(1)  # 让服务器删除空房间
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(10)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps({"players": args.players, "spectators": args.spectators, "codec": args.codec,
+                          "step_seconds": args.step_seconds, "steps": results}, indent=2))
+
+
+def print_step(r):
+    print(f"rooms={r['rooms']} clients={r['clients']} games={r['games']} submits={r['submits']} "
+          f"p50={r['latency_p50_ms']}ms p99={r['latency_p99_ms']}ms frames={r['frames']} "
+          f"dropped={r['dropped_frames']} reconnects={r['reconnects']} errors={r['errors']} "
+          f"cpu={r['server_cpu_pct']}% rss={r['server_rss_mb']}MB", flush=True)
+
+
+if __name__ == "__main__":
+    main()
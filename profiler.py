@@ -0,0 +1,94 @@
+# 诊断工具：阻塞 hub 的采样分析、慢事件日志与对象内存估算。
+#
+# eventlet 的所有绿色线程都跑在主线程上，某个处理函数阻塞 hub 时主线程的当前栈就是它。
+# 采样用 ITIMER_REAL 墙钟定时器：SIGALRM 的处理函数在主线程下一条字节码处执行，拿到的就是被打断的栈
+# (原生采样线程只能在 hub 释放 GIL 时取栈，几乎总是落在空闲的 epoll 上)。
+# 输出 flamegraph.pl / speedscope 可直接读取的折叠栈格式 ("帧;帧;帧 次数")。
+import logging
+import os
+import signal
+import sys
+import time
+from collections import Counter, deque
+
+import eventlet
+
+LOG = logging.getLogger('balance.slow')
+MAX_DEPTH = 64
+_profiling = False
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def _collapse(frame):
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+def profile_hub(duration, interval=0.005):
+    # 须在主线程的绿色线程中调用；采样期间调用方让出 hub，其它事件照常处理。
+    # 已有采样在进行时返回 None
+    global _profiling
+    if _profiling:
+        return None
+    _profiling = True
+    stacks = Counter()
+
+    def on_sample(signum, frame):
+        stacks[_collapse(frame)] += 1
+
+    previous = signal.signal(signal.SIGALRM, on_sample)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, interval, interval)
+        eventlet.sleep(duration)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        _profiling = False
+    lines = [f"{stack} {count}" for stack, count in stacks.most_common()]
+    return "\n".join(lines) + "\n", sum(stacks.values())
+
+
+class SlowEventLog:
+    # 常开的慢事件记录：超过预算的事件写入日志，并保留最近若干条供管理员查看
+    def __init__(self, budget, size=200):
+        self.budget = budget
+        self.recent = deque(maxlen=size)
+
+    def record(self, name, room_id, duration):
+        if duration < self.budget:
+            return
+        self.recent.append({
+            "event": name, "room_id": room_id, "ms": round(duration * 1000, 1), "time": time.time()
+        })
+        LOG.warning("slow event %s room=%s %.1fms", name, room_id, duration * 1000)
+
+
+def deep_sizeof(obj, skip=()):
+    # 对象连同其引用的容器、字符串与 __slots__ 属性的近似内存占用 (字节)，同一对象只计一次。
+    # skip 中的对象 (如多个房间共享的编译产物) 不计入；函数与类只计自身，不展开
+    seen = {id(o) for o in skip}
+    size = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if o is None or id(o) in seen:
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            stack.extend(o)
+        elif not isinstance(o, type) and not callable(o):
+            for cls in type(o).__mro__:
+                for name in getattr(cls, "__slots__", ()):
+                    stack.append(getattr(o, name, None))
+    return size
@@ -0,0 +1,104 @@
+# 对局回放的紧凑编码：取代 GameRecord.details_json 中逐回合重复玩家名、规则与事件描述的完整历史。
+#
+# 编码为 zlib 压缩的 JSON Lines：
+#   第一行  头部 {"v", "rounds", "players": [[uid, 名字]], "rules": [描述], "events": [描述]}
+#   之后每行一回合 {"n", "avg", "target", "e", "r", "p", "val", "org", "hp", "dmg", "src", "win"}
+#     e / r 为事件与规则在头部表中的下标，p 为本回合参与者在 players 中的下标，
+#     val 之后都是与 p 对齐的数值列；src 为数字来源在本回合参与者中的位置。
+# 解码时逐块解压、逐回合产出，不在内存中还原整局的完整历史。
+import json
+import zlib
+
+VERSION = 1
+CHUNK_SIZE = 4096
+
+
+class _Table:
+    # 字符串 / 元组到下标的字典表
+    def __init__(self):
+        self.items = []
+        self.index = {}
+
+    def add(self, item):
+        if item not in self.index:
+            self.index[item] = len(self.items)
+            self.items.append(item)
+        return self.index[item]
+
+
+def encode_replay(history):
+    players, rules, events = _Table(), _Table(), _Table()
+    rounds = []
+    for entry in history:
+        data = entry["player_data"]
+        names = [d["name"] for d in data]
+        event = entry.get("event_desc")
+        rounds.append({
+            "n": entry["round_num"], "avg": entry["avg"], "target": entry["target"],
+            "e": events.add(event) if event else None,
+            "r": [rules.add(desc) for desc in entry.get("active_rules", [])],
+            "p": [players.add((d["uid"], d["name"])) for d in data],
+            "val": [d["val"] for d in data],
+            "org": [d["org_val"] for d in data],
+            "hp": [d["hp"] for d in data],
+            "dmg": [d["dmg"] for d in data],
+            "src": [names.index(d["source"]) if d["source"] in names else -1 for d in data],
+            "win": [1 if d["win"] else 0 for d in data],
+        })
+    header = {
+        "v": VERSION, "rounds": len(rounds), "players": [list(p) for p in players.items],
+        "rules": rules.items, "events": events.items,
+    }
+    lines = [header] + rounds
+    text = "\n".join(json.dumps(line, ensure_ascii=False, separators=(',', ':')) for line in lines)
+    return zlib.compress(text.encode("utf-8"), 9)
+
+
+def _lines(chunks):
+    decompressor = zlib.decompressobj()
+    pending = b""
+    for chunk in chunks:
+        pending += decompressor.decompress(chunk)
+        *complete, pending = pending.split(b"\n")
+        for line in complete:
+            yield json.loads(line)
+    pending += decompressor.flush()
+    if pending:
+        yield json.loads(pending)
+
+
+def decode_round(header, rec):
+    # 还原为与房间 full_history 相同的结构，前端可直接复用战报组件
+    players = header["players"]
+    data = []
+    for i, pid in enumerate(rec["p"]):
+        uid, name = players[pid]
+        src = rec["src"][i]
+        data.append({
+            "uid": uid, "name": name, "val": rec["val"][i], "org_val": rec["org"][i],
+            "source": players[rec["p"][src]][1] if src >= 0 else None,
+            "hp": rec["hp"][i], "dmg": rec["dmg"][i], "win": bool(rec["win"][i]),
+        })
+    return {
+        "round_num": rec["n"], "target": rec["target"], "avg": rec["avg"],
+        "event_desc": header["events"][rec["e"]] if rec["e"] is not None else None,
+        "active_rules": [header["rules"][r] for r in rec["r"]],
+        "player_data": data,
+    }
+
+
+def iter_replay(chunks):
+    # chunks 为压缩数据的分块迭代器；先产出头部，再逐回合产出完整结构
+    lines = _lines(chunks)
+    header = next(lines, None)
+    if header is None:
+        return
+    yield header
+    for rec in lines:
+        yield decode_round(header, rec)
+
+
+def decode_replay(blob):
+    rounds = iter_replay(blob[i:i + CHUNK_SIZE] for i in range(0, len(blob), CHUNK_SIZE))
+    next(rounds, None)
+    return list(rounds)
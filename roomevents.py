@@ -0,0 +1,94 @@
+# 房间内的轻量事件：点赞、准备 / 提交 / 确认标记与表情不再各自触发整房广播，
+# 按房间在短窗口内合并为一帧，并按发送者限速。
+#
+# 一帧只带变化字段的当前值 (而不是增量)，与随后的补丁或完整视图重复到达时结果一致。
+import time
+
+import eventlet
+
+FLAG_FIELDS = ("ready", "submitted", "confirmed")
+
+
+class RateLimiter:
+    # 令牌桶：每个 key 最多积攒 burst 个令牌，每秒补充 rate 个
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.buckets = {}  # key -> [令牌数, 上次补充时间]
+
+    def allow(self, key, now=None):
+        now = time.monotonic() if now is None else now
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if len(self.buckets) >= self.max_keys:
+                self._prune(now)
+            bucket = self.buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    def _prune(self, now):
+        # 已经补满的桶与新建的等价，可以丢弃
+        full = [key for key, (tokens, last) in self.buckets.items()
+                if tokens + (now - last) * self.rate >= self.burst]
+        for key in full:
+            del self.buckets[key]
+
+
+class RoomEventBatch:
+    # 一个房间在当前窗口内累积的事件；字段值在发送时才从房间读取
+    __slots__ = ("players", "spectators", "likes", "emotes")
+
+    def __init__(self):
+        self.players = {}         # uid -> 变化的字段名集合
+        self.spectators = set()   # likes_sent 变化的观战者
+        self.likes = {}           # 被点赞者 uid -> 本窗口次数 (前端据此播放特效)
+        self.emotes = []          # [[uid, 表情]]
+
+
+class RoomEventBus:
+    def __init__(self, window, flush, max_emotes=20):
+        self.window = window
+        self.flush = flush  # flush(room_id, batch)，在 hub 中调用
+        self.max_emotes = max_emotes  # 每个窗口每房间最多转发的表情数
+        self.pending = {}   # room_id -> RoomEventBatch
+
+    def _batch(self, room_id):
+        batch = self.pending.get(room_id)
+        if batch is None:
+            batch = self.pending[room_id] = RoomEventBatch()
+            eventlet.spawn_after(self.window, self._flush, room_id)
+        return batch
+
+    def _flush(self, room_id):
+        batch = self.pending.pop(room_id, None)
+        if batch is not None:
+            self.flush(room_id, batch)
+
+    def flag(self, room_id, uid, field):
+        self._batch(room_id).players.setdefault(uid, set()).add(field)
+
+    def like(self, room_id, sender_uid, target_uid, sender_is_player):
+        batch = self._batch(room_id)
+        batch.players.setdefault(target_uid, set()).add("likes")
+        if sender_is_player:
+            batch.players.setdefault(sender_uid, set()).add("likes_sent")
+        else:
+            batch.spectators.add(sender_uid)
+        batch.likes[target_uid] = batch.likes.get(target_uid, 0) + 1
+
+    def emote(self, room_id, uid, emote):
+        # 本窗口已满时丢弃，返回 False
+        batch = self._batch(room_id)
+        if len(batch.emotes) >= self.max_emotes:
+            return False
+        batch.emotes.append([uid, emote])
+        return True
+
+    def discard(self, room_id):
+        self.pending.pop(room_id, None)
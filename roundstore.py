@@ -0,0 +1,158 @@
+# 对局回合存档：房间实时状态只保留最近一回合，更早的回合按房间追加到 JSON Lines 文件。
+# 内存里只记每行的起始偏移，客户端翻页时按偏移读取；对局结束时一次读出整局用于落库。
+# 文件读写不在 hub 上做：追加只编码并入队，由存档协程按顺序放到原生线程池执行，
+# 连续的追加合并成一次调用；读取与删除也排进同一个队列，保证看到的是之前追加过的全部回合。
+# 进程重启后由 recover() 接回快照恢复的房间的存档 (见 snapshots.py)，其余文件删除。
+import json
+import logging
+import os
+
+import eventlet
+from eventlet import tpool
+from eventlet.event import Event
+from eventlet.queue import Queue, Empty
+
+LOG = logging.getLogger('balance.roundstore')
+
+
+class RoundStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.offsets = {}  # key -> [每回合在文件中的起始偏移]
+        self.sizes = {}    # key -> 已追加 (含尚未写盘) 的总字节数
+        self.ops = Queue()
+        self.worker = None
+        os.makedirs(directory, exist_ok=True)
+
+    def recover(self, counts):
+        # 启动时调用，须早于任何写入。counts: 恢复的房间 -> 快照时已存档的回合数；
+        # 快照之后才存入的回合仍在房间实时状态里，截掉以免重复，其它房间的存档没有用处
+        for name in os.listdir(self.directory):
+            if not name.endswith(".jsonl"): continue
+            key, path = name[:-len(".jsonl")], os.path.join(self.directory, name)
+            keep = counts.get(key, 0)
+            offsets, end = [], 0
+            if keep:
+                with open(path, "rb") as f:
+                    for line in f:
+                        if len(offsets) == keep or not line.endswith(b"\n"): break
+                        offsets.append(end)
+                        end += len(line)
+            if not offsets:
+                os.remove(path)
+                continue
+            with open(path, "r+b") as f:
+                f.truncate(end)
+            self.offsets[key] = offsets
+            self.sizes[key] = end
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".jsonl")
+
+    def _submit(self, kind, path, arg=None, done=None):
+        self.ops.put((kind, path, arg, done))
+        if self.worker is None:
+            self.worker = eventlet.spawn(self._run)
+
+    def append(self, key, entry):
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        offset = self.sizes.get(key, 0)
+        self.offsets.setdefault(key, []).append(offset)
+        self.sizes[key] = offset + len(line)
+        self._submit("write", self._path(key), line)
+
+    def count(self, key):
+        return len(self.offsets.get(key, ()))
+
+    def read(self, key, start=0, stop=None):
+        # 按存入顺序返回第 [start, stop) 回合；排在之前的追加写完后才读，调用方协程在此让出
+        offsets = self.offsets.get(key, [])[start:stop]
+        if not offsets:
+            return []
+        done = Event()
+        self._submit("read", self._path(key), offsets, done)
+        return done.wait()
+
+    def drop(self, key):
+        self.sizes.pop(key, None)
+        if self.offsets.pop(key, None) is not None:
+            self._submit("remove", self._path(key))
+
+    def flush(self):
+        # 等到此前排队的文件操作全部完成
+        done = Event()
+        self._submit("sync", None, None, done)
+        done.wait()
+
+    def close(self):
+        # 关停时 (atexit，hub 已不再调度) 在当前线程直接写完排队的追加与删除
+        writes = []
+        while True:
+            try:
+                kind, path, arg, done = self.ops.get_nowait()
+            except Empty:
+                break
+            if kind == "write":
+                writes.append((path, arg))
+            elif kind == "remove":
+                self._write_lines(writes)
+                writes = []
+                self._remove(path)
+        self._write_lines(writes)
+
+    def _run(self):
+        while True:
+            ops = [self.ops.get()]
+            while True:
+                try:
+                    ops.append(self.ops.get_nowait())
+                except Empty:
+                    break
+            writes = []
+            for kind, path, arg, done in ops:
+                if kind == "write":
+                    writes.append((path, arg))
+                    continue
+                if writes:
+                    self._call(self._write_lines, writes)
+                    writes = []
+                if kind == "read":
+                    try:
+                        done.send(tpool.execute(self._read_lines, path, arg))
+                    except Exception as e:
+                        done.send_exception(e)
+                elif kind == "remove":
+                    self._call(self._remove, path)
+                else:
+                    done.send(None)
+            if writes:
+                self._call(self._write_lines, writes)
+
+    def _call(self, func, *args):
+        try:
+            tpool.execute(func, *args)
+        except OSError:
+            # 存档只影响翻页与落库明细，写盘失败记日志，不能拖垮存档协程
+            LOG.exception("round store: %s failed", func.__name__)
+
+    @staticmethod
+    def _write_lines(writes):
+        lines = {}
+        for path, line in writes:
+            lines.setdefault(path, []).append(line)
+        for path, chunk in lines.items():
+            with open(path, "ab") as f:
+                f.write(b"".join(chunk))
+
+    @staticmethod
+    def _read_lines(path, offsets):
+        with open(path, "rb") as f:
+            f.seek(offsets[0])
+            return [json.loads(f.readline()) for _ in offsets]
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,138 @@
+# 规则注册表：每条永久规则与限定事件在这里声明它参与回合结算的钩子。
+# engine.compile_pipeline 把房间生效的规则编译成按顺序排好的流水线，结算时只执行生效规则的钩子；
+# 新增规则只需在这里注册，不必修改结算流程 (engine.resolve_round / game.resolve_room_round)。
+#
+# 结算钩子 (ctx 为 engine.RoundContext，均为纯函数)：
+#   weight(ctx, i, w) -> w             第 i 名玩家的数字计入均值的权重
+#   samples(ctx) -> (总和, 权重)         额外计入均值的样本
+#   target(ctx, target) -> target      目标值变换
+#   candidates(ctx, cands) -> cands    候选胜者过滤；返回后若 ctx.decided 为真，跳过其余过滤
+#   judge(ctx)                         选出胜者之后、计算伤害之前，可改写 ctx.base_damage
+#   damage(ctx, i, dmg) -> dmg         败者的伤害修正
+#   post(ctx, i, hp) -> hp             扣血之后对每名玩家 HP 的效果
+# 房间钩子 (game.py)：
+#   apply(room, event)                 限定事件生效时修改房间与事件副本 (倍率、黑暗、幸运数字)
+#   swap                               限定事件要求全员交换数字
+# 同类钩子按 order 从小到大执行，order 相同时按规则 id。
+import random
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+DUEL_RULE = 3  # 剩两人时强制生效的规则
+
+
+@dataclass(frozen=True, slots=True)
+class Rule:
+    id: int
+    desc: str
+    type: str  # perm / temp
+    order: int = 0
+    weight: Optional[Callable] = None
+    samples: Optional[Callable] = None
+    target: Optional[Callable] = None
+    candidates: Optional[Callable] = None
+    judge: Optional[Callable] = None
+    damage: Optional[Callable] = None
+    post: Optional[Callable] = None
+    apply: Optional[Callable] = None
+    swap: bool = False
+    duel_desc: Optional[str] = None  # 决战强制生效时的描述
+
+    def to_dict(self):
+        # 与前端 / 管理面板约定的规则格式
+        return {"id": self.id, "desc": self.desc, "type": self.type}
+
+
+RULES = {}  # id -> Rule，按注册顺序
+
+
+def register(rule):
+    if rule.id in RULES:
+        raise ValueError(f"rule {rule.id} already registered")
+    RULES[rule.id] = rule
+    return rule
+
+
+def rules_of_type(kind):
+    return [r for r in RULES.values() if r.type == kind]
+
+
+# --- 永久规则 ---
+
+def _conflict(ctx, candidates):
+    counts = Counter(ctx.values)
+    ctx.conflict = any(c > 1 for c in counts.values())
+    return [i for i in candidates if counts[ctx.values[i]] == 1]
+
+def _precise(ctx):
+    if not ctx.decided and ctx.min_diff is not None and ctx.min_diff < 1:
+        ctx.precise = True
+        ctx.base_damage = 2
+
+def _extreme(ctx, candidates):
+    if 0 in ctx.values and 100 in ctx.values:
+        ctx.extreme = ctx.decided = True
+        return [i for i in range(ctx.n) if ctx.values[i] == 100]
+    return candidates
+
+def _ghosts(ctx):
+    return sum(ctx.ghost_values), len(ctx.ghost_values)
+
+def _desperate(ctx, i, w):
+    return 3 if ctx.hps[i] < 3 else w
+
+def _find_wanted(ctx):
+    ctx.top_hp = max(ctx.hps) if ctx.hps else None
+
+def _wanted(ctx, i, dmg):
+    return dmg + 1 if ctx.hps[i] == ctx.top_hp else dmg
+
+
+register(Rule(1, "【冲突】若数字与他人重复，则判定为失败并扣除 1 点生命。", "perm", order=20, candidates=_conflict))
+register(Rule(2, "【精准】若赢家误差小于 1，败者将扣除 2 点生命。", "perm", judge=_precise))
+register(Rule(3, "【极值】若 0 与 100 同时出现，选 100 者直接获胜。", "perm", order=10, candidates=_extreme,
+              duel_desc="【极值(决战强制)】0 与 100 同时出现，选 100 者直接获胜。"))
+register(Rule(4, "【幽灵】已淘汰玩家的最后数字将永远参与均值计算(权重1)。", "perm", samples=_ghosts))
+register(Rule(5, "【绝境】HP < 3 的玩家，其数字对均值的权重变为 3 倍。", "perm", weight=_desperate))
+register(Rule(6, "【通缉】HP 最高者若未获胜，额外扣 1 血。", "perm", order=20, judge=_find_wanted,
+              damage=_wanted))
+
+
+# --- 限定事件 ---
+
+def _mutate_multiplier(room, event):
+    room.multiplier = round(random.randint(1, 20) * 0.1, 1)
+    event["desc"] = f"【波动】本回合目标倍率变更为 x{room.multiplier} !"
+
+def _safe_damage(ctx, i, dmg):
+    return 0 if 40 <= ctx.values[i] <= 60 else dmg
+
+def _safe_heal(ctx, i, hp):
+    return min(ctx.max_hp, hp + 1) if ctx.won[i] else hp
+
+def _darken(room, event):
+    room.blind_mode = True
+
+def _revolution(ctx, target):
+    return 100 - target
+
+def _draw_lucky_digit(room, event):
+    lucky_digit = random.randint(0, 9)
+    event["lucky_digit"] = lucky_digit
+    event["desc"] = f"【赌徒】幸运尾数 {lucky_digit}！选择以 {lucky_digit} 结尾数字的人，回合后 +1 HP！"
+
+def _lucky_heal(ctx, i, hp):
+    if ctx.lucky_digit is not None and ctx.values[i] % 10 == ctx.lucky_digit:
+        return min(ctx.max_hp, hp + 1)
+    return hp
+
+
+register(Rule(101, "【混乱】你选择的数字将与其他人进行交换！", "temp", swap=True))
+register(Rule(102, "【波动】本回合目标倍率发生突变！", "temp", apply=_mutate_multiplier))
+register(Rule(103, "【安全】选择数字在 40-60 时 +1 HP，且本回合胜者 +1 HP！", "temp", order=10,
+              damage=_safe_damage, post=_safe_heal))
+register(Rule(104, "【黑暗】隐藏全员 HP，且无法看到自己选择的数字！", "temp", apply=_darken))
+register(Rule(105, "【革命】逻辑反转！目标值变为：100 - (均值 x 倍率)！", "temp", target=_revolution))
+register(Rule(106, "【赌徒】幸运尾数！命中幸运数字的人 +1 HP！", "temp", order=20, apply=_draw_lucky_digit,
+              post=_lucky_heal))
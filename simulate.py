@@ -0,0 +1,295 @@
+# 无界面蒙特卡洛平衡模拟器：用 game.py 中与线上完全相同的规则跑完整对局，多进程并行。
+#
+#   python simulate.py --games 1000000 --players 6 --strategies random,level1,follow
+#   python simulate.py --multiplier 0.7 --event-chance 0.3 --disable-rule 4 --json
+#
+# 自定义策略可用 "模块:函数" 指定，函数签名为 strategy(room, player) -> int，参数为 state.Room / state.Player。
+import argparse
+import importlib
+import json
+import os
+import random
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+import game
+
+MAX_ROUNDS = 200  # 防止【安全】/【赌徒】反复回血导致的超长对局
+
+
+# --- 策略 ---
+
+def clamp(val):
+    return max(0, min(100, round(val)))
+
+def jitter(val, spread=3):
+    # 确定性策略加少量噪声，否则同策略玩家永远平局
+    return clamp(val + random.randint(-spread, spread))
+
+def strategy_random(room, player):
+    return random.randint(0, 100)
+
+def strategy_fifty(room, player):
+    return jitter(50)
+
+def strategy_level1(room, player):
+    return jitter(50 * room.multiplier)
+
+def strategy_level2(room, player):
+    return jitter(50 * room.multiplier ** 2)
+
+def strategy_follow(room, player):
+    # 沿用上一回合的目标值
+    return jitter(room.last_result.get("target", 40))
+
+def strategy_undercut(room, player):
+    return jitter(room.last_result.get("target", 40) * room.multiplier)
+
+def strategy_duelist(room, player):
+    # 决战时赌极值规则，否则按一阶推理
+    alive = sum(1 for p in room.players.values() if p.alive)
+    if alive <= 2:
+        return 100
+    return strategy_level1(room, player)
+
+STRATEGIES = {
+    "random": strategy_random,
+    "fifty": strategy_fifty,
+    "level1": strategy_level1,
+    "level2": strategy_level2,
+    "follow": strategy_follow,
+    "undercut": strategy_undercut,
+    "duelist": strategy_duelist,
+}
+
+def load_strategy(name):
+    if name in STRATEGIES:
+        return STRATEGIES[name]
+    module_name, _, func_name = name.partition(":")
+    if not func_name:
+        raise SystemExit(f"unknown strategy: {name}")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+# --- 对局 ---
+
+def play_game(seat_strategies):
+    room = game.init_room_state("sim", "sim")
+    for i in range(len(seat_strategies)):
+        uid = f"p{i}"
+        room.players[uid] = game.new_player(uid, uid)
+
+    rule_rounds = {}
+    while room.round < MAX_ROUNDS:
+        # 服务器在规则公告阶段逐条展示，这里直接跳过公告
+        room.announcement_queue.clear()
+        game.apply_pending_perm_rules(room)
+        game.begin_round(room)
+        for uid, p in room.players.items():
+            if p.alive:
+                p.guess = seat_strategies[int(uid[1:])][1](room, p)
+                p.submitted = True
+        finished, winner_uid = game.resolve_room_round(room)
+        for r in room.rules:
+            rule_rounds.setdefault(r["id"], room.round)
+        if finished:
+            winner = seat_strategies[int(winner_uid[1:])][0] if winner_uid else None
+            return room.round, winner, rule_rounds
+    return room.round, None, rule_rounds
+
+
+def run_chunk(task):
+    chunk_seed, games, strategy_names, players = task
+    random.seed(chunk_seed)
+    strategies = [(name, load_strategy(name)) for name in strategy_names]
+
+    lengths = Counter()
+    wins = Counter()
+    seats = Counter()
+    draws = 0
+    timeouts = 0
+    rule_games = Counter()
+    rule_length = Counter()
+    rule_trigger_round = Counter()
+    rule_wins = Counter()
+    for _ in range(games):
+        seat_strategies = [strategies[i % len(strategies)] for i in range(players)]
+        random.shuffle(seat_strategies)
+        for name, _ in seat_strategies:
+            seats[name] += 1
+        length, winner, rule_rounds = play_game(seat_strategies)
+        lengths[length] += 1
+        if winner:
+            wins[winner] += 1
+        elif length >= MAX_ROUNDS:
+            timeouts += 1
+        else:
+            draws += 1
+        for rid, first_round in rule_rounds.items():
+            rule_games[rid] += 1
+            rule_length[rid] += length
+            rule_trigger_round[rid] += first_round
+            if winner:
+                rule_wins[(rid, winner)] += 1
+    return {
+        "games": games, "lengths": lengths, "wins": wins, "seats": seats,
+        "draws": draws, "timeouts": timeouts, "rule_games": rule_games,
+        "rule_length": rule_length, "rule_trigger_round": rule_trigger_round,
+        "rule_wins": rule_wins,
+    }
+
+
+def merge(total, part):
+    for key, value in part.items():
+        if key not in total:
+            total[key] = value
+        elif isinstance(value, Counter):
+            total[key].update(value)
+        else:
+            total[key] += value
+    return total
+
+
+def configure(overrides):
+    # 在每个工作进程内覆盖 game 模块的平衡参数
+    if overrides.get("multiplier") is not None:
+        game.BASE_MULTIPLIER = overrides["multiplier"]
+    if overrides.get("event_chance") is not None:
+        game.EVENT_CHANCE = overrides["event_chance"]
+    if overrides.get("duel_swap_chance") is not None:
+        game.DUEL_SWAP_CHANCE = overrides["duel_swap_chance"]
+    disabled_rules = set(overrides.get("disable_rules") or ())
+    disabled_events = set(overrides.get("disable_events") or ())
+    game.PERMANENT_RULE_POOL = [r for r in game.PERMANENT_RULE_POOL if r["id"] not in disabled_rules]
+    game.ROUND_EVENT_POOL = [e for e in game.ROUND_EVENT_POOL if e["id"] not in disabled_events]
+
+
+# --- 报告 ---
+
+def percentile(lengths, q):
+    total = sum(lengths.values())
+    seen = 0
+    for length in sorted(lengths):
+        seen += lengths[length]
+        if seen >= total * q:
+            return length
+    return 0
+
+
+def summarize(stats, strategy_names, players):
+    games = stats["games"]
+    lengths = stats["lengths"]
+    mean_length = sum(k * v for k, v in lengths.items()) / games if games else 0
+    summary = {
+        "games": games,
+        "length": {
+            "mean": round(mean_length, 3),
+            "p50": percentile(lengths, 0.5),
+            "p90": percentile(lengths, 0.9),
+            "p99": percentile(lengths, 0.99),
+            "max": max(lengths) if lengths else 0,
+            "histogram": {str(k): lengths[k] for k in sorted(lengths)},
+        },
+        "draws": stats["draws"],
+        "timeouts": stats["timeouts"],
+        "strategies": {},
+        "rules": {},
+    }
+    for name in sorted(set(strategy_names)):
+        seats = stats["seats"][name]
+        win_count = stats["wins"][name]
+        summary["strategies"][name] = {
+            "wins": win_count,
+            "win_rate": round(win_count / games, 4) if games else 0,
+            # 每个座位的胜率，与 1/players 对比即可看出策略强弱
+            "win_rate_per_seat": round(win_count / seats, 4) if seats else 0,
+        }
+    for rid in sorted(stats["rule_games"]):
+        count = stats["rule_games"][rid]
+        summary["rules"][rid] = {
+            "games": count,
+            "trigger_rate": round(count / games, 4),
+            "mean_length": round(stats["rule_length"][rid] / count, 3),
+            "mean_trigger_round": round(stats["rule_trigger_round"][rid] / count, 3),
+            "win_share": {
+                name: round(stats["rule_wins"][(rid, name)] / count, 4)
+                for name in sorted(set(strategy_names))
+            },
+        }
+    summary["baseline_win_rate_per_seat"] = round(1 / players, 4) if players else 0
+    return summary
+
+
+def print_report(summary, elapsed):
+    print(f"games: {summary['games']}  ({elapsed:.1f}s, {summary['games'] / max(elapsed, 1e-9):.0f} games/s)")
+    length = summary["length"]
+    print(f"length: mean {length['mean']}  p50 {length['p50']}  p90 {length['p90']}  p99 {length['p99']}  max {length['max']}")
+    print(f"draws: {summary['draws']}  timeouts: {summary['timeouts']}")
+    print(f"\nstrategy      wins        win/game  win/seat  (even: {summary['baseline_win_rate_per_seat']})")
+    for name, s in summary["strategies"].items():
+        print(f"{name:<12}  {s['wins']:<10}  {s['win_rate']:<8}  {s['win_rate_per_seat']}")
+    print("\nrule  games       trigger   mean len  trigger rnd  win share")
+    for rid, r in summary["rules"].items():
+        share = ", ".join(f"{k} {v}" for k, v in r["win_share"].items())
+        print(f"{rid:<4}  {r['games']:<10}  {r['trigger_rate']:<8}  {r['mean_length']:<8}  {r['mean_trigger_round']:<11}  {share}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Balance game Monte Carlo simulator")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--players", type=int, default=6)
+    parser.add_argument("--strategies", default="random,level1,follow",
+                        help="逗号分隔，按座位轮流分配；可用 模块:函数 指定自定义策略")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk", type=int, default=2000, help="每个任务模拟的对局数")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--multiplier", type=float, default=None)
+    parser.add_argument("--event-chance", type=float, default=None)
+    parser.add_argument("--duel-swap-chance", type=float, default=None)
+    parser.add_argument("--disable-rule", type=int, action="append", default=[])
+    parser.add_argument("--disable-event", type=int, action="append", default=[])
+    parser.add_argument("--json", action="store_true", help="输出 JSON 而不是文本报告")
+    args = parser.parse_args(argv)
+
+    strategy_names = [s.strip() for s in args.strategies.split(",") if s.strip()]
+    for name in strategy_names:
+        load_strategy(name)
+    overrides = {
+        "multiplier": args.multiplier,
+        "event_chance": args.event_chance,
+        "duel_swap_chance": args.duel_swap_chance,
+        "disable_rules": args.disable_rule,
+        "disable_events": args.disable_event,
+    }
+
+    seed = args.seed if args.seed is not None else random.randrange(2 ** 32)
+    tasks = []
+    remaining = args.games
+    while remaining > 0:
+        size = min(args.chunk, remaining)
+        tasks.append((seed + len(tasks), size, strategy_names, args.players))
+        remaining -= size
+
+    started = time.time()
+    stats = {}
+    if args.workers <= 1:
+        configure(overrides)
+        for task in tasks:
+            merge(stats, run_chunk(task))
+    else:
+        with Pool(args.workers, initializer=configure, initargs=(overrides,)) as pool:
+            for part in pool.imap_unordered(run_chunk, tasks):
+                merge(stats, part)
+    elapsed = time.time() - started
+
+    summary = summarize(stats, strategy_names, args.players)
+    summary["seed"] = seed
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print_report(summary, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# 进行中房间的快照：部署或崩溃重启后恢复对局。
+# 快照文件为追加写的 JSON Lines，每行是一个房间的完整记录或删除标记 ({"id": ..., "deleted": true})；
+# 每次只追加上次以来有变化的房间，启动时按行重放，同一房间以最后一行为准。
+# 失效的行超过一半时整体重写 (先写临时文件再替换)。写文件与 fsync 放到原生线程池，不阻塞 hub。
+import json
+import os
+
+from eventlet import tpool
+from eventlet.semaphore import Semaphore
+
+
+class SnapshotLog:
+    def __init__(self, path):
+        self.path = path
+        self.lines = {}   # room_id -> 文件中该房间最新的一行
+        self.written = 0  # 文件中的总行数
+        self.lock = Semaphore()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    def load(self):
+        # 返回 {room_id: 记录}；崩溃时写了一半的末行 (没有换行符) 被忽略并截掉，
+        # 否则之后追加的行会接在残行后面一起作废
+        records = {}
+        try:
+            with open(self.path, "rb+") as f:
+                complete = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        f.truncate(complete)
+                        break
+                    complete += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.written += 1
+                    if record.get("deleted"):
+                        records.pop(record["id"], None)
+                        self.lines.pop(record["id"], None)
+                    else:
+                        records[record["id"]] = record
+                        self.lines[record["id"]] = line
+        except FileNotFoundError:
+            pass
+        return records
+
+    def encode(self, record):
+        return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+    def write(self, changes, block=False):
+        # changes: {room_id: 已编码的行，None 表示房间已删除}
+        if not changes:
+            return
+        with self.lock:
+            lines = []
+            for room_id, line in changes.items():
+                if line is None:
+                    if self.lines.pop(room_id, None) is None:
+                        continue  # 从未写入过的房间不需要删除标记
+                    line = self.encode({"id": room_id, "deleted": True})
+                else:
+                    self.lines[room_id] = line
+                lines.append(line)
+            if not lines:
+                return
+            if self.written + len(lines) > 2 * len(self.lines) + 16:
+                job, payload = self._rewrite, b"".join(self.lines.values())
+                self.written = len(self.lines)
+            else:
+                job, payload = self._append, b"".join(lines)
+                self.written += len(lines)
+            if block:
+                job(payload)
+            else:
+                tpool.execute(job, payload)
+
+    def _append(self, payload):
+        with open(self.path, "ab") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self, payload):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
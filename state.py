@@ -0,0 +1,122 @@
+# 房间内存模型：Room / Player / Spectator 用带 __slots__ 的 dataclass 表示，
+# 比同样字段的 dict 更省内存、属性访问更快。to_wire() 生成与前端约定一致的 dict。
+from collections import deque
+from dataclasses import dataclass, field, fields
+from typing import Optional
+
+LOG_LIMIT = 10  # 房间日志只保留最近的条数，最新的在前
+
+
+def new_logs():
+    return deque(maxlen=LOG_LIMIT)
+
+
+@dataclass(slots=True)
+class Player:
+    uid: str
+    name: str
+    hp: int
+    alive: bool = True
+    guess: Optional[int] = None
+    submitted: bool = False
+    confirmed: bool = False
+    ready: bool = False
+    last_dmg: int = 0
+    is_winner: bool = False
+    likes: int = 0
+    likes_sent: int = 0
+    rank_info: Optional[dict] = None
+    points_change: int = 0
+    suicided: bool = False
+    hp_at_death: int = 0
+    score: int = 0
+
+    def to_wire(self):
+        return {name: getattr(self, name) for name in PLAYER_FIELDS}
+
+
+@dataclass(slots=True)
+class Spectator:
+    uid: str
+    name: str
+    likes_sent: int = 0
+
+    def to_wire(self):
+        return {"uid": self.uid, "name": self.name, "likes_sent": self.likes_sent}
+
+
+@dataclass(slots=True)
+class Room:
+    id: str
+    name: str
+    multiplier: float
+    basic_rules: list
+    available_perm_rules: list
+    rev: int = 0
+    phase: str = "LOBBY"
+    round: int = 0
+    timer: int = 0
+    players: dict = field(default_factory=dict)      # uid -> Player，保持加入顺序
+    spectators: dict = field(default_factory=dict)   # uid -> Spectator
+    rules: list = field(default_factory=list)
+    new_rule: Optional[dict] = None
+    round_event: Optional[dict] = None
+    dead_guesses: list = field(default_factory=list)
+    blind_mode: bool = False
+    logs: deque = field(default_factory=new_logs)
+    last_result: dict = field(default_factory=dict)
+    full_history: list = field(default_factory=list)  # 实时状态中的最近回合，更早的见 roundstore.py
+    config: dict = field(default_factory=lambda: {"max_likes": 10})
+    kick_votes: dict = field(default_factory=dict)
+    pending_events: dict = field(default_factory=lambda: {"perm": [], "temp": None})
+    elimination_stack: list = field(default_factory=list)
+    announcement_queue: list = field(default_factory=list)
+    # 由 rules / round_event 编译而来 (见 game.compile_room_rules)，不下发给客户端
+    pipeline: object = None
+    rule_descs: tuple = ((), ())  # (常规回合, 决战回合) 的生效规则描述
+
+    def alive_players(self):
+        return [p for p in self.players.values() if p.alive]
+
+    def has_member(self, uid):
+        return uid in self.players or uid in self.spectators
+
+    def to_record(self):
+        # 快照用的完整记录 (见 snapshots.py)；编译产物 pipeline / rule_descs 恢复后重新编译
+        record = {name: getattr(self, name) for name in RECORD_FIELDS}
+        record["logs"] = list(self.logs)
+        record["players"] = [{name: getattr(p, name) for name in PLAYER_FIELDS} for p in self.players.values()]
+        record["spectators"] = [s.to_wire() for s in self.spectators.values()]
+        return record
+
+    @classmethod
+    def from_record(cls, record):
+        # 忽略新版本里已去掉的字段，缺少的字段取默认值
+        room = cls(**{k: v for k, v in record.items() if k in RECORD_FIELDS and k not in NESTED_FIELDS})
+        room.logs.extend(record.get("logs", ()))
+        for p in record.get("players", ()):
+            room.players[p["uid"]] = Player(**{k: v for k, v in p.items() if k in PLAYER_FIELDS})
+        for s in record.get("spectators", ()):
+            room.spectators[s["uid"]] = Spectator(**{k: v for k, v in s.items() if k in SPECTATOR_FIELDS})
+        return room
+
+    def to_wire(self):
+        # 浅拷贝：嵌套的列表 / dict 与房间共享，调用方不得修改
+        wire = {name: getattr(self, name) for name in ROOM_FIELDS}
+        wire["logs"] = list(self.logs)
+        wire["players"] = {uid: p.to_wire() for uid, p in self.players.items()}
+        wire["spectators"] = [s.to_wire() for s in self.spectators.values()]
+        return wire
+
+
+PLAYER_FIELDS = tuple(f.name for f in fields(Player))
+SPECTATOR_FIELDS = tuple(f.name for f in fields(Spectator))
+# 保持原先房间 dict 的键顺序
+ROOM_FIELDS = (
+    "id", "name", "rev", "phase", "round", "timer", "players", "spectators", "rules", "new_rule",
+    "round_event", "multiplier", "dead_guesses", "blind_mode", "logs", "last_result", "full_history",
+    "config", "kick_votes", "pending_events", "available_perm_rules", "elimination_stack", "basic_rules",
+    "announcement_queue",
+)
+RECORD_FIELDS = tuple(f.name for f in fields(Room) if f.name not in ("pipeline", "rule_descs"))
+NESTED_FIELDS = ("logs", "players", "spectators")
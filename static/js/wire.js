@@ -0,0 +1,223 @@
+// 大帧的客户端解码 (服务器端见 wire.py)：zlib 解压 (RFC 1950/1951) 与 MessagePack 解包。
+// 只实现服务器帧用到的部分，随页面一起由本服务提供，不依赖第三方 CDN。挂在 window.WireCodec 上。
+(function (global) {
+    'use strict';
+
+    // --- inflate ---
+    const LENGTH_BASE = [3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31, 35, 43, 51, 59, 67, 83, 99, 115, 131, 163, 195, 227, 258];
+    const LENGTH_EXTRA = [0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 0];
+    const DIST_BASE = [1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193, 257, 385, 513, 769, 1025, 1537, 2049, 3073, 4097, 6145, 8193, 12289, 16385, 24577];
+    const DIST_EXTRA = [0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12, 12, 13, 13];
+    const CODE_LENGTH_ORDER = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15];
+
+    // 规范 Huffman 码表：counts[n] 为长度 n 的码数，symbols 按码值排列
+    function huffman(lengths) {
+        const counts = new Uint16Array(16);
+        const offsets = new Uint16Array(16);
+        for (let i = 0; i < lengths.length; i++) counts[lengths[i]]++;
+        counts[0] = 0;
+        for (let n = 1; n < 16; n++) offsets[n] = offsets[n - 1] + counts[n - 1];
+        const symbols = new Uint16Array(lengths.length);
+        for (let i = 0; i < lengths.length; i++) {
+            if (lengths[i]) symbols[offsets[lengths[i]]++] = i;
+        }
+        return { counts, symbols };
+    }
+
+    let fixedTables = null;
+    function fixed() {
+        if (!fixedTables) {
+            const lengths = new Uint8Array(288);
+            lengths.fill(8, 0, 144);
+            lengths.fill(9, 144, 256);
+            lengths.fill(7, 256, 280);
+            lengths.fill(8, 280, 288);
+            fixedTables = [huffman(lengths), huffman(new Uint8Array(30).fill(5))];
+        }
+        return fixedTables;
+    }
+
+    function inflate(data) {
+        if (data.length < 2 || (data[0] & 0x0f) !== 8 || ((data[0] << 8) | data[1]) % 31 !== 0 || (data[1] & 0x20)) {
+            throw new Error('unsupported zlib stream');
+        }
+        let pos = 2, bitBuf = 0, bitCount = 0;
+        let out = new Uint8Array(data.length * 4 + 1024), outLen = 0;
+
+        const bits = (n) => {
+            while (bitCount < n) {
+                if (pos >= data.length) throw new Error('truncated zlib stream');
+                bitBuf |= data[pos++] << bitCount;
+                bitCount += 8;
+            }
+            const value = bitBuf & ((1 << n) - 1);
+            bitBuf >>>= n;
+            bitCount -= n;
+            return value;
+        };
+        const decode = (table) => {
+            let code = 0, first = 0, index = 0;
+            for (let n = 1; n < 16; n++) {
+                code |= bits(1);
+                const count = table.counts[n];
+                if (code - first < count) return table.symbols[index + code - first];
+                index += count;
+                first = (first + count) << 1;
+                code <<= 1;
+            }
+            throw new Error('invalid huffman code');
+        };
+        const reserve = (n) => {
+            if (outLen + n <= out.length) return;
+            const grown = new Uint8Array(Math.max(out.length * 2, outLen + n));
+            grown.set(out.subarray(0, outLen));
+            out = grown;
+        };
+        const dynamic = () => {
+            const nlit = bits(5) + 257, ndist = bits(5) + 1, ncode = bits(4) + 4;
+            const codeLengths = new Uint8Array(19);
+            for (let i = 0; i < ncode; i++) codeLengths[CODE_LENGTH_ORDER[i]] = bits(3);
+            const codeTable = huffman(codeLengths);
+            const lengths = new Uint8Array(nlit + ndist);
+            for (let i = 0; i < lengths.length;) {
+                const sym = decode(codeTable);
+                if (sym < 16) {
+                    lengths[i++] = sym;
+                    continue;
+                }
+                let value = 0, repeat;
+                if (sym === 16) {
+                    if (i === 0) throw new Error('invalid code lengths');
+                    value = lengths[i - 1];
+                    repeat = 3 + bits(2);
+                } else if (sym === 17) {
+                    repeat = 3 + bits(3);
+                } else {
+                    repeat = 11 + bits(7);
+                }
+                if (i + repeat > lengths.length) throw new Error('invalid code lengths');
+                while (repeat--) lengths[i++] = value;
+            }
+            return [huffman(lengths.subarray(0, nlit)), huffman(lengths.subarray(nlit))];
+        };
+
+        let last;
+        do {
+            last = bits(1);
+            const type = bits(2);
+            if (type === 0) {
+                // 存储块：丢掉当前字节剩余的位，读 LEN / NLEN 后原样复制
+                bitBuf = 0;
+                bitCount = 0;
+                if (pos + 4 > data.length) throw new Error('truncated zlib stream');
+                const len = data[pos] | (data[pos + 1] << 8);
+                pos += 4;
+                if (pos + len > data.length) throw new Error('truncated zlib stream');
+                reserve(len);
+                out.set(data.subarray(pos, pos + len), outLen);
+                outLen += len;
+                pos += len;
+            } else if (type === 1 || type === 2) {
+                const [lit, dist] = type === 1 ? fixed() : dynamic();
+                for (;;) {
+                    let sym = decode(lit);
+                    if (sym < 256) {
+                        reserve(1);
+                        out[outLen++] = sym;
+                    } else if (sym === 256) {
+                        break;
+                    } else {
+                        sym -= 257;
+                        if (sym >= 29) throw new Error('invalid length code');
+                        const len = LENGTH_BASE[sym] + bits(LENGTH_EXTRA[sym]);
+                        const dsym = decode(dist);
+                        if (dsym >= 30) throw new Error('invalid distance code');
+                        const distance = DIST_BASE[dsym] + bits(DIST_EXTRA[dsym]);
+                        if (distance > outLen) throw new Error('invalid distance');
+                        reserve(len);
+                        for (let i = 0; i < len; i++, outLen++) out[outLen] = out[outLen - distance];
+                    }
+                }
+            } else {
+                throw new Error('invalid block type');
+            }
+        } while (!last);
+        return out.subarray(0, outLen);
+    }
+
+    // --- MessagePack ---
+    const utf8 = new TextDecoder();
+
+    function unpack(bytes) {
+        const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+        let pos = 0;
+        const take = (n) => {
+            if (pos + n > bytes.length) throw new Error('truncated msgpack data');
+            const start = pos;
+            pos += n;
+            return start;
+        };
+        const str = (n) => { const start = take(n); return utf8.decode(bytes.subarray(start, start + n)); };
+        const bin = (n) => { const start = take(n); return bytes.slice(start, start + n); };
+        const array = (n) => {
+            const items = new Array(n);
+            for (let i = 0; i < n; i++) items[i] = read();
+            return items;
+        };
+        const map = (n) => {
+            const obj = {};
+            for (let i = 0; i < n; i++) {
+                const key = read();
+                obj[key] = read();
+            }
+            return obj;
+        };
+
+        function read() {
+            const b = bytes[take(1)];
+            if (b <= 0x7f) return b;
+            if (b <= 0x8f) return map(b & 0x0f);
+            if (b <= 0x9f) return array(b & 0x0f);
+            if (b <= 0xbf) return str(b & 0x1f);
+            if (b >= 0xe0) return b - 0x100;
+            switch (b) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: return bin(view.getUint8(take(1)));
+                case 0xc5: return bin(view.getUint16(take(2)));
+                case 0xc6: return bin(view.getUint32(take(4)));
+                case 0xca: return view.getFloat32(take(4));
+                case 0xcb: return view.getFloat64(take(8));
+                case 0xcc: return view.getUint8(take(1));
+                case 0xcd: return view.getUint16(take(2));
+                case 0xce: return view.getUint32(take(4));
+                case 0xcf: return Number(view.getBigUint64(take(8)));
+                case 0xd0: return view.getInt8(take(1));
+                case 0xd1: return view.getInt16(take(2));
+                case 0xd2: return view.getInt32(take(4));
+                case 0xd3: return Number(view.getBigInt64(take(8)));
+                case 0xd9: return str(view.getUint8(take(1)));
+                case 0xda: return str(view.getUint16(take(2)));
+                case 0xdb: return str(view.getUint32(take(4)));
+                case 0xdc: return array(view.getUint16(take(2)));
+                case 0xdd: return array(view.getUint32(take(4)));
+                case 0xde: return map(view.getUint16(take(2)));
+                case 0xdf: return map(view.getUint32(take(4)));
+            }
+            throw new Error('unsupported msgpack type 0x' + b.toString(16));
+        }
+
+        const value = read();
+        if (pos !== bytes.length) throw new Error('trailing msgpack data');
+        return value;
+    }
+
+    // 二进制帧：1 字节标志 (1 = zlib 压缩) + MessagePack 正文
+    function decodeFrame(bytes) {
+        const body = bytes[0] === 1 ? inflate(bytes.subarray(1)) : bytes.subarray(1);
+        return unpack(body);
+    }
+
+    global.WireCodec = { inflate, unpack, decodeFrame };
+})(typeof window !== 'undefined' ? window : globalThis);
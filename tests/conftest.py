@@ -0,0 +1,80 @@
+# 仓库没有打包配置，测试直接从仓库根目录导入各模块。
+# 服务器模块 (app.py) 指向临时数据库与 instance 目录后只导入一次，每个测试前删除所有房间并清空连接表。
+import os
+import sys
+
+import eventlet
+
+eventlet.monkey_patch()
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 每个测试前清空的服务器进程内状态
+SERVER_TABLES = ("rooms", "SID_TO_ROOM", "SID_TO_UID", "SYNC_SNAPSHOTS", "VIEW_CACHE", "ROOM_MEMBERS", "ADMIN_SIDS",
+                 "UID_ROOM")
+
+
+@pytest.fixture(scope="session")
+def server_module(tmp_path_factory):
+    path = tmp_path_factory.mktemp("server")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}/game.db"
+    os.environ["INSTANCE_PATH"] = str(path)
+    import app
+    return app
+
+
+@pytest.fixture
+def server(server_module):
+    for room_id in list(server_module.rooms):
+        server_module.delete_room(room_id)
+    if server_module.ROOM_LIST_FLUSH is not None:
+        server_module.ROOM_LIST_FLUSH.cancel()
+        server_module.ROOM_LIST_FLUSH = None
+    server_module.ROOM_LIST_SENT = {}
+    for name in SERVER_TABLES:
+        getattr(server_module, name).clear()
+    return server_module
+
+
+class Player:
+    # Socket.IO 测试客户端加上常用的登录 / 进房操作
+    def __init__(self, server, uid):
+        self.server = server
+        self.uid = uid
+        self.client = server.socketio.test_client(server.app)
+        self.client.emit('login', {'uid': uid, 'password': 'pw'})
+
+    def emit(self, event, *args):
+        self.client.emit(event, *args)
+        eventlet.sleep(0.01)
+
+    def received(self, name=None):
+        messages = self.client.get_received()
+        return [m for m in messages if name is None or m['name'] == name]
+
+    def args(self, name):
+        return [m['args'][0] for m in self.received(name)]
+
+    def create_room(self, name="room"):
+        self.client.get_received()
+        self.emit('create_room', {'name': name})
+        return self.args('room_created')[-1]['room_id']
+
+    def join(self, room_id, spectator=False):
+        self.emit('join_room', {'room_id': room_id, 'uid': self.uid, 'is_spectator': spectator})
+
+
+@pytest.fixture
+def players(server):
+    made = []
+
+    def make(*uids):
+        new = [Player(server, uid) for uid in uids]
+        made.extend(new)
+        return new if len(new) > 1 else new[0]
+    yield make
+    for p in made:
+        if p.client.is_connected():
+            p.client.disconnect()
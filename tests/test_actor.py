@@ -0,0 +1,85 @@
+import logging
+
+import eventlet
+
+from actor import RoomActors
+
+
+def test_commands_of_one_room_never_interleave():
+    actors = RoomActors()
+    trace = []
+
+    def slow(name):
+        trace.append(("start", name))
+        eventlet.sleep(0.01)  # 中途让出 hub
+        trace.append(("end", name))
+
+    for name in ("a", "b", "c"):
+        actors.post("r", slow, name)
+    eventlet.sleep(0.1)
+    assert trace == [("start", "a"), ("end", "a"), ("start", "b"), ("end", "b"), ("start", "c"), ("end", "c")]
+    assert actors.actors == {}
+
+
+def test_rooms_run_concurrently():
+    actors = RoomActors()
+    trace = []
+
+    def slow(room_id):
+        trace.append(("start", room_id))
+        eventlet.sleep(0.01)
+        trace.append(("end", room_id))
+
+    actors.post("r1", slow, "r1")
+    actors.post("r2", slow, "r2")
+    eventlet.sleep(0.05)
+    assert trace[:2] == [("start", "r1"), ("start", "r2")]
+
+
+def test_failed_command_is_logged_and_queue_continues(caplog):
+    waits = []
+    actors = RoomActors(on_wait=waits.append)
+    done = []
+
+    def boom():
+        raise ValueError("bad")
+
+    with caplog.at_level(logging.ERROR, logger='balance.actor'):
+        actors.post("r", boom)
+        actors.post("r", done.append, 1)
+        eventlet.sleep(0.01)
+    assert done == [1] and len(waits) == 2
+    assert "room r: command boom failed" in caplog.text
+
+
+def test_stale_timeout_is_dropped(players):
+    host = players("host")
+    server = host.server
+    room_id = host.create_room()
+    host.join(room_id)
+    room = server.rooms[room_id]
+    server.set_phase_timer(room, 60)
+    stale_seq = server.ROOM_TIMERS[room_id][2]
+    room.phase = "END"
+    server.set_phase_timer(room, 60)
+    # 旧计时器的超时在阶段切换后才出队，不再处理
+    server.on_phase_timeout(room_id, stale_seq)
+    assert room.phase == "END" and room_id in server.ROOM_TIMERS
+    server.cancel_phase_timer(room_id)
+
+
+def test_round_settles_only_once(players, monkeypatch):
+    host = players("host")
+    server = host.server
+    room_id = host.create_room()
+    host.join(room_id)
+    room = server.rooms[room_id]
+    settled = []
+    monkeypatch.setattr(server, "resolve_room_round", lambda r: settled.append(r.round) or (False, None))
+    room.phase = "INPUT"
+    # 提交齐与输入超时先后排进房间队列，只有第一个结算
+    server.ROOM_ACTORS.post(room_id, server.calculate_round, room_id)
+    server.ROOM_ACTORS.post(room_id, server.calculate_round, room_id)
+    eventlet.sleep(0.05)
+    assert len(settled) == 1
+    server.cancel_phase_timer(room_id)
@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_bench(*args):
+    # 子进程运行：bench.py 导入 app 前要先改环境变量，不能与测试里的服务器模块共用
+    env = {k: v for k, v in os.environ.items() if k not in ("DATABASE_URL", "INSTANCE_PATH")}
+    return subprocess.run([sys.executable, "bench.py", "--filter", "init_room_state|perform_reset",
+                           "--iterations", "0.05", *args], cwd=ROOT, env=env, capture_output=True, text=True,
+                          timeout=300)
+
+
+def test_save_and_compare_baseline(tmp_path):
+    baseline = tmp_path / "baseline.json"
+    first = run_bench("--save", str(baseline), "--json")
+    assert first.returncode == 0, first.stderr
+    results = json.loads(baseline.read_text(encoding="utf-8"))["results"]
+    assert set(results) == {"init_room_state", "perform_reset"}
+
+    same = run_bench("--compare", str(baseline), "--threshold", "100", "--json")
+    assert same.returncode == 0, same.stderr
+    assert json.loads(same.stdout)["regressions"] == []
+
+    # 基线改成快得多，当前结果就算回退，退出码为 1
+    report = json.loads(baseline.read_text(encoding="utf-8"))
+    for r in report["results"].values():
+        r["median_us"] /= 1000
+    baseline.write_text(json.dumps(report), encoding="utf-8")
+    slower = run_bench("--compare", str(baseline), "--json")
+    assert slower.returncode == 1
+    assert sorted(json.loads(slower.stdout)["regressions"]) == ["init_room_state", "perform_reset"]
@@ -0,0 +1,136 @@
+# 两个 worker 加载在同一进程里、共用 MESSAGE_QUEUE=local://... 的总线，走房间事件的跨 worker 转发路径
+import importlib.util
+import os
+import sys
+
+import eventlet
+import pytest
+
+from cluster import check_worker_id
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+def load_worker(worker_id):
+    os.environ["WORKER_ID"] = worker_id
+    spec = importlib.util.spec_from_file_location(f"app_worker_{worker_id}", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="module")
+def workers(tmp_path_factory):
+    path = tmp_path_factory.mktemp("cluster")
+    saved = dict(os.environ)
+    os.environ.update(DATABASE_URL=f"sqlite:///{path}/game.db", INSTANCE_PATH=str(path),
+                      MESSAGE_QUEUE=f"local://{path}")
+    try:
+        yield load_worker("a"), load_worker("b")
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+
+
+def received(client):
+    return [m["name"] for m in client.get_received()]
+
+
+def test_worker_id_must_not_contain_separator():
+    assert check_worker_id("1") == "1"
+    for bad in ("", "a_b"):
+        with pytest.raises(ValueError):
+            check_worker_id(bad)
+
+
+def test_room_events_are_forwarded_to_the_owner(workers):
+    owner, other = workers
+    c_owner = owner.socketio.test_client(owner.app)
+    c_other = other.socketio.test_client(other.app)
+    c_owner.emit("login", {"uid": "p1", "password": "pw"})
+    c_other.emit("login", {"uid": "p2", "password": "pw"})
+    eventlet.sleep(0.1)
+
+    c_owner.emit("create_room", {"name": "r"})
+    eventlet.sleep(0.2)
+    assert len(owner.rooms) == 1 and not other.rooms
+    room_id = next(iter(owner.rooms))
+    assert owner.room_owner(room_id) == "a"
+    # 另一个 worker 的房间列表来自共享的房间摘要 (摘要随合并后的大厅推送登记)
+    eventlet.sleep(owner.ROOM_LIST_COALESCE)
+    c_other.get_received()
+    c_other.emit("get_room_list")
+    eventlet.sleep(0.1)
+    lists = [m["args"][0] for m in c_other.get_received() if m["name"] == "room_list_update"]
+    assert [r["id"] for r in lists[-1]] == [room_id]
+
+    for client, uid in ((c_owner, "p1"), (c_other, "p2")):
+        client.get_received()
+        client.emit("join_room", {"room_id": room_id, "uid": uid})
+        eventlet.sleep(0.2)
+        assert "joined_room_success" in received(client)
+    assert set(owner.rooms[room_id].players) == {"p1", "p2"}
+    # 房主处理完转发的事件后，源 worker 记下了连接所在的房间，后续事件直接转发
+    assert room_id in other.SID_TO_ROOM.values()
+
+    c_other.emit("toggle_ready")
+    eventlet.sleep(0.2)
+    assert owner.rooms[room_id].players["p2"].ready
+    # 房主的广播经总线送达另一个 worker 上的连接
+    assert "room_events" in received(c_other)
+    assert "room_events" in received(c_owner)
+
+
+def test_lobby_patches_come_only_from_the_room_owner(workers, monkeypatch):
+    # 大厅订阅者收到所有 worker 的推送；每个房间只能由房主 worker 推送，否则会重复、互相矛盾
+    for worker in workers:
+        monkeypatch.setattr(worker, "ROOM_LIST_COALESCE", 0.05)
+    a, b = workers
+    watcher = b.socketio.test_client(b.app)
+    watcher.emit("get_room_list")
+    eventlet.sleep(0.1)
+    watcher.get_received()
+
+    created = []
+    for worker in (a, b):
+        room_id = worker.new_room_id()
+        worker.rooms[room_id] = worker.init_room_state(room_id, "lobby")
+        worker.broadcast_room_list()
+        created.append(room_id)
+        eventlet.sleep(0.15)
+    a.rooms[created[0]].name = "renamed"
+    for worker in (a, b):
+        worker.broadcast_room_list()
+    eventlet.sleep(0.15)
+
+    upserts = [(r["id"], r["name"]) for m in watcher.get_received() if m["name"] == "room_list_patch"
+               for r in m["args"][0]["upsert"]]
+    assert sorted(u for u in upserts if u[0] in created) == sorted(
+        [(created[0], "lobby"), (created[0], "renamed"), (created[1], "lobby")])
+
+
+def test_resume_token_from_one_worker_rejoins_room_on_the_owner(workers):
+    owner, other = workers
+    host = owner.socketio.test_client(owner.app)
+    guest = other.socketio.test_client(other.app)
+    host.emit("login", {"uid": "resume-host", "password": "pw"})
+    guest.emit("login", {"uid": "resume-guest", "password": "pw"})
+    eventlet.sleep(0.1)
+    token = [m["args"][0] for m in guest.get_received() if m["name"] == "login_result"][-1]["resume_token"]
+    host.emit("create_room", {"name": "r"})
+    eventlet.sleep(0.2)
+    room_id = [m["args"][0] for m in host.get_received() if m["name"] == "room_created"][-1]["room_id"]
+    guest.emit("join_room", {"room_id": room_id, "uid": "resume-guest"})
+    eventlet.sleep(0.2)
+    guest.disconnect()
+
+    # 两个 worker 共用 instance 目录里的密钥；房间 id 提示把 resume 直接转给房主
+    again = other.socketio.test_client(other.app)
+    again.emit("resume", {"token": token, "room_id": room_id})
+    eventlet.sleep(0.2)
+    messages = {m["name"]: m["args"][0] for m in again.get_received()}
+    assert messages["resume_result"]["success"] and messages["resume_result"]["in_room"]
+    assert messages["reconnect_room"]["room"]["id"] == room_id
+    for client in (host, again):
+        client.disconnect()
@@ -0,0 +1,153 @@
+# 结算引擎与原有语义 (提取引擎之前 calculate_round 的逐条判断写法) 逐回合比较；批量模式与逐回合结果一致
+import random
+from collections import Counter
+
+import pytest
+
+import engine
+from engine import RoundInput, EVENT_SWAP, EVENT_SAFE, EVENT_REVOLUTION, EVENT_LUCKY
+
+
+def reference_resolve(inp):
+    # 原有结算语义的直接写法，只用作对照
+    n = len(inp.guesses)
+    sources = inp.swap if inp.swap is not None and n > 1 else tuple(range(n))
+    values = tuple(inp.guesses[s] for s in sources)
+    hps = inp.hps
+    rules = frozenset(inp.rule_ids) | {3} if n <= 2 else frozenset(inp.rule_ids)
+
+    total_val = total_w = 0
+    for val, hp in zip(values, hps):
+        w = 3 if 5 in rules and hp < 3 else 1
+        total_val += val * w
+        total_w += w
+    if 4 in rules:
+        total_val += sum(inp.ghost_values)
+        total_w += len(inp.ghost_values)
+    avg = total_val / total_w if total_w else 0
+    target = avg * inp.multiplier
+    if inp.event_id == EVENT_REVOLUTION:
+        target = 100 - target
+
+    base_damage = 1
+    extreme = conflict = precise = False
+    if 3 in rules and 0 in values and 100 in values:
+        won = tuple(v == 100 for v in values)
+        extreme = True
+    else:
+        candidates = range(n)
+        if 1 in rules:
+            counts = Counter(values)
+            conflict = any(c > 1 for c in counts.values())
+            candidates = [i for i in candidates if counts[values[i]] == 1]
+        winners = set()
+        if candidates:
+            min_diff = min(abs(values[i] - target) for i in candidates)
+            winners = {i for i in candidates if abs(values[i] - target) == min_diff}
+            if 2 in rules and min_diff < 1:
+                base_damage = 2
+                precise = True
+        won = tuple(i in winners for i in range(n))
+
+    max_hp_val = max(hps) if 6 in rules and n else None
+    safe = inp.event_id == EVENT_SAFE
+    lucky = inp.lucky_digit if inp.event_id == EVENT_LUCKY else None
+    damage, hp_after = [], []
+    for val, hp, is_winner in zip(values, hps, won):
+        dmg = 0
+        if is_winner:
+            if safe:
+                hp = min(inp.max_hp, hp + 1)
+        else:
+            dmg = base_damage
+            if safe and 40 <= val <= 60:
+                dmg = 0
+            if hp == max_hp_val:
+                dmg += 1
+            hp -= dmg
+        if lucky is not None and val % 10 == lucky:
+            hp = min(inp.max_hp, hp + 1)
+        damage.append(dmg)
+        hp_after.append(hp)
+
+    return dict(
+        avg=avg, target=target, values=values, sources=tuple(sources), won=won, damage=tuple(damage),
+        hp_after=tuple(hp_after), hp_delta=tuple(a - b for a, b in zip(hp_after, hps)), rule_ids=rules,
+        extreme=extreme, conflict=conflict, precise=precise,
+    )
+
+
+def as_dict(result):
+    return {key: getattr(result, key) for key in (
+        "avg", "target", "values", "sources", "won", "damage", "hp_after", "hp_delta", "rule_ids",
+        "extreme", "conflict", "precise",
+    )}
+
+
+def random_input(rng):
+    n = rng.randint(1, 8)
+    event = rng.choice([None, 101, 102, 103, 104, 105, 106])
+    return RoundInput(
+        guesses=tuple(rng.choice([0, 100, 50, rng.randint(0, 100)]) for _ in range(n)),
+        hps=tuple(rng.randint(1, 10) for _ in range(n)),
+        rule_ids=frozenset(r for r in range(1, 7) if rng.random() < 0.4),
+        event_id=event,
+        multiplier=rng.choice([0.8, rng.randint(1, 20) / 10]),
+        ghost_values=tuple(rng.randint(0, 100) for _ in range(rng.randint(0, 4))),
+        lucky_digit=rng.randint(0, 9) if event == EVENT_LUCKY else None,
+        swap=engine.derangement(n, rng) if event == EVENT_SWAP and n > 1 else None,
+    )
+
+
+@pytest.fixture
+def inputs():
+    rng = random.Random(20240601)
+    return [random_input(rng) for _ in range(20000)]
+
+
+def test_resolve_round_matches_reference(inputs):
+    for inp in inputs:
+        assert as_dict(engine.resolve_round(inp)) == reference_resolve(inp), inp
+
+
+def test_precompiled_pipeline_matches(inputs):
+    for inp in inputs[:2000]:
+        pipeline = engine.compile_pipeline(frozenset(inp.rule_ids), inp.event_id)
+        assert engine.resolve_round(inp, pipeline) == engine.resolve_round(inp)
+
+
+def test_pipelines_are_shared_between_rooms():
+    assert engine.compile_pipeline(frozenset({1, 2}), None) is engine.compile_pipeline(frozenset({2, 1}), None)
+
+
+def test_resolve_rounds_matches_scalar(inputs):
+    assert engine.resolve_rounds(inputs) == [engine.resolve_round(inp) for inp in inputs]
+
+
+def test_resolve_rounds_without_numpy(inputs, monkeypatch):
+    monkeypatch.setattr(engine, "np", None)
+    assert engine.resolve_rounds(inputs[:500]) == [engine.resolve_round(inp) for inp in inputs[:500]]
+
+
+@pytest.mark.parametrize("inp, winners, damage", [
+    # 0.8 倍平均数：平均 30，目标 24，20 最接近
+    (RoundInput(guesses=(10, 20, 60), hps=(5, 5, 5)), (1,), (1, 0, 1)),
+    # 规则 1：重复的数字失去获胜资格
+    (RoundInput(guesses=(20, 20, 60), hps=(5, 5, 5), rule_ids=frozenset({1})), (2,), (1, 1, 0)),
+    # 决战 (两人) 强制规则 3：同时出现 0 与 100 时 100 获胜
+    (RoundInput(guesses=(0, 100), hps=(5, 5)), (1,), (1, 0)),
+    # 规则 2：误差小于 1 时其余玩家受 2 点伤害
+    (RoundInput(guesses=(0, 0, 0, 50), hps=(5, 5, 5, 5), rule_ids=frozenset({2}), multiplier=0), (0, 1, 2), (0, 0, 0, 2)),
+])
+def test_known_rounds(inp, winners, damage):
+    result = engine.resolve_round(inp)
+    assert result.winners == winners
+    assert result.damage == damage
+
+
+def test_derangement_moves_everyone():
+    rng = random.Random(7)
+    for n in range(2, 9):
+        perm = engine.derangement(n, rng)
+        assert sorted(perm) == list(range(n))
+        assert all(i != p for i, p in enumerate(perm))
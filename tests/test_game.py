@@ -0,0 +1,64 @@
+import game
+from engine import EVENT_SWAP
+
+
+def duel_room():
+    room = game.init_room_state("r", "r")
+    for uid in ("a", "b"):
+        room.players[uid] = game.new_player(uid, uid)
+    return room
+
+
+def test_duel_swap_is_forced_when_in_pool(monkeypatch):
+    monkeypatch.setattr(game, "DUEL_SWAP_CHANCE", 1.0)
+    room = duel_room()
+    game.begin_round(room)
+    assert room.round_event["id"] == EVENT_SWAP
+
+
+def test_duel_swap_respects_disabled_event(monkeypatch):
+    monkeypatch.setattr(game, "DUEL_SWAP_CHANCE", 1.0)
+    monkeypatch.setattr(game, "EVENT_CHANCE", 1.0)
+    monkeypatch.setattr(game, "ROUND_EVENT_POOL", [e for e in game.ROUND_EVENT_POOL if e["id"] != EVENT_SWAP])
+    for _ in range(50):
+        room = duel_room()
+        game.begin_round(room)
+        assert room.round_event is not None and room.round_event["id"] != EVENT_SWAP
+
+
+def test_round_resolution_eliminates_and_finishes(monkeypatch):
+    monkeypatch.setattr(game, "EVENT_CHANCE", 0.0)
+    room = game.init_room_state("r", "r")
+    for uid in ("a", "b", "c"):
+        room.players[uid] = game.new_player(uid, uid)
+    room.players["c"].hp = 1
+    game.begin_round(room)
+    for uid, guess in (("a", 10), ("b", 20), ("c", 60)):
+        player = room.players[uid]
+        player.guess, player.submitted = guess, True
+    finished, winner = game.resolve_room_round(room)
+    assert (finished, winner) == (False, None)
+    assert [p.hp for p in room.players.values()] == [9, 10, 0]
+    assert room.elimination_stack == ["c"]
+    assert not room.players["c"].alive
+
+
+def test_room_pipeline_follows_rules_and_events(monkeypatch):
+    monkeypatch.setattr(game, "EVENT_CHANCE", 0.0)
+    room = game.init_room_state("r", "r")
+    assert room.pipeline.rule_ids == frozenset()
+    game.trigger_room_rule(room, game.PERM_RULE_BY_ID[1], author_name="a")
+    assert room.pipeline.rule_ids == frozenset({1})
+    assert room.rule_descs[0] == (room.rules[0]["desc"],)
+    # 决战版本多出强制的极值规则
+    assert len(room.rule_descs[1]) == 2
+
+    rules_pipeline = room.pipeline
+    game.apply_round_event(room, game.ROUND_EVENT_BY_ID[EVENT_SWAP])
+    assert room.pipeline.swap and room.pipeline.rule_ids == frozenset({1})
+    game.begin_round(room)
+    # 事件结束后换回同一规则集的共享流水线
+    assert room.round_event is None and room.pipeline is rules_pipeline
+
+    game.reset_room_state(room)
+    assert room.pipeline.rule_ids == frozenset()
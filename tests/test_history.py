@@ -0,0 +1,90 @@
+# 个人战绩分页：PlayerResult 索引、(timestamp, id) 游标与旧记录回填
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def add_games(server, uid, timestamps):
+    # 按给定时间写入对局，返回按 (timestamp, id) 倒序排列的 record id
+    with server.app.app_context():
+        ids = []
+        for ts in timestamps:
+            players = [{'uid': uid, 'game_rank': 1, 'total_players': 2, 'score_change': 3, 'rank': {}}]
+            record = server.GameRecord(timestamp=ts, players_json=json.dumps(players), details_json='[]')
+            server.db.session.add(record)
+            server.db.session.flush()
+            server.db.session.add_all(server.player_results_from_record(record, players))
+            ids.append((ts, record.id))
+        server.db.session.commit()
+    return [i for _, i in sorted(ids, reverse=True)]
+
+
+def fetch(player, **data):
+    player.emit('get_history', dict(uid=player.uid, **data))
+    return player.args('history_data')[-1]
+
+
+def test_pages_cover_all_games_once_in_order(players):
+    player = players("history-pager")
+    base = datetime(2024, 1, 1)
+    # 同一时间戳的多局要靠 id 区分先后
+    stamps = [base + timedelta(minutes=i // 3) for i in range(25)]
+    expected = add_games(player.server, player.uid, stamps)
+
+    seen, cursor = [], None
+    while True:
+        page = fetch(player, limit=4, cursor=cursor)
+        assert page['cursor'] == cursor
+        assert len(page['items']) <= 4
+        seen += [item['id'] for item in page['items']]
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_history_only_lists_own_games(players):
+    mine, other = players("history-mine", "history-other")
+    expected = add_games(mine.server, mine.uid, [datetime(2024, 2, 1)])
+    add_games(mine.server, other.uid, [datetime(2024, 2, 2)])
+    page = fetch(mine)
+    assert [item['id'] for item in page['items']] == expected
+    assert page['next_cursor'] is None
+
+
+@pytest.mark.parametrize("cursor", ["junk", [1, 2], ["not a date", 3], ["2024-01-01T00:00:00", True], [None]])
+def test_malformed_cursor_reads_first_page(players, cursor):
+    player = players("history-cursor")
+    if not fetch(player)['items']:
+        add_games(player.server, player.uid, [datetime(2024, 3, 1), datetime(2024, 3, 2)])
+    first = fetch(player)
+    page = fetch(player, cursor=cursor)
+    assert page['cursor'] is None
+    assert page['items'] == first['items']
+
+
+def test_limit_is_clamped(server):
+    assert server.parse_history_limit(None) == server.HISTORY_PAGE_SIZE
+    assert server.parse_history_limit("x") == server.HISTORY_PAGE_SIZE
+    assert server.parse_history_limit(0) == server.HISTORY_PAGE_SIZE
+    assert server.parse_history_limit(-5) == 1
+    assert server.parse_history_limit(10 ** 6) == server.HISTORY_MAX_PAGE_SIZE
+
+
+def test_backfill_builds_results_from_game_records(server):
+    with server.app.app_context():
+        saved = [(r.uid, r.record_id) for r in server.PlayerResult.query.all()]
+        server.PlayerResult.query.delete()
+        record = server.GameRecord(timestamp=datetime(2023, 5, 5), details_json='[]', players_json=json.dumps(
+            [{'uid': 'old-a', 'game_rank': 1, 'score_change': 2}, {'uid': 'old-b', 'game_rank': 2}, {'name': 'no uid'}]))
+        broken = server.GameRecord(timestamp=datetime(2023, 5, 6), players_json='{not json')
+        server.db.session.add_all([record, broken])
+        server.db.session.commit()
+
+        server.backfill_player_results()
+        rows = server.PlayerResult.query.filter_by(record_id=record.id).order_by(server.PlayerResult.uid).all()
+        assert [(r.uid, r.game_rank, r.score_change) for r in rows] == [('old-a', 1, 2), ('old-b', 2, 0)]
+        assert server.PlayerResult.query.filter_by(record_id=broken.id).count() == 0
+        restored = {(r.uid, r.record_id) for r in server.PlayerResult.query.all()}
+        assert set(saved) <= restored
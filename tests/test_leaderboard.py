@@ -0,0 +1,88 @@
+import random
+
+from leaderboard import Leaderboard
+
+
+def naive_ranks(scores):
+    order = sorted(scores, key=lambda uid: (-scores[uid], uid))
+    return {uid: i + 1 for i, uid in enumerate(order)}
+
+
+def test_rank_orders_by_score_then_uid():
+    board = Leaderboard()
+    board.load([("b", "B", 10, None), ("a", "A", 10, None), ("c", "C", 30, None), ("d", "D", None, None)])
+    assert [board.rank(uid) for uid in "cabd"] == [1, 2, 3, 4]
+    assert [e["uid"] for e in board.top(2)] == ["c", "a"]
+    assert board.get("d")["score"] == 0
+    assert board.rank("missing") is None
+
+
+def test_incremental_updates_match_full_sort():
+    rng = random.Random(5)
+    board = Leaderboard()
+    scores = {}
+    for step in range(2000):
+        uid = f"u{rng.randint(0, 80)}"
+        if uid not in scores:
+            scores[uid] = rng.randint(0, 50)
+            board.add(uid, uid, scores[uid])
+        else:
+            delta = rng.randint(-5, 5)
+            scores[uid] += delta
+            board.update(uid, score_delta=delta)
+        if step % 100 == 0:
+            ranks = naive_ranks(scores)
+            assert {uid: board.rank(uid) for uid in scores} == ranks
+    assert len(board) == len(scores)
+    assert [e["uid"] for e in board.top(10)] == sorted(scores, key=lambda u: (-scores[u], u))[:10]
+
+
+def test_update_reports_leaderboard_changes():
+    board = Leaderboard()
+    board.add("a", "A", 5)
+    assert board.update("a", password="x") is False
+    assert board.update("a", nickname="A") is False
+    assert board.update("a", nickname="AA") is True
+    assert board.update("a", score_delta=3) is True
+    assert board.get("a")["score"] == 8
+    assert board.update("missing", score_delta=1) is False
+
+
+def test_add_existing_uid_replaces_entry():
+    board = Leaderboard()
+    board.add("a", "A", 5)
+    board.add("b", "B", 7)
+    board.add("a", "A", 9)
+    assert len(board) == 2
+    assert board.rank("a") == 1 and board.rank("b") == 2
+
+
+def test_get_leaderboard_reports_own_rank_and_subscribes(players, monkeypatch):
+    low, high = players("board-low", "board-high")
+    server = low.server
+    monkeypatch.setattr(server, "LEADERBOARD_SIZE", 2)
+    monkeypatch.setattr(server, "LEADERBOARD_PUSHED", server.leaderboard_top())
+    server.update_user("board-high", score_delta=10 ** 6)
+    server.update_user("board-low", score_delta=10 ** 6 - 1)
+    low.received()
+    low.emit('get_leaderboard', {'uid': 'board-low'})
+    (data,) = low.args('leaderboard_data')
+    assert [e['uid'] for e in data['top']] == ['board-high', 'board-low']
+    assert data['me']['rank'] == 2 and data['total'] == len(server.LEADERBOARD)
+
+    # 前 N 名变化时推送给订阅者
+    server.update_user("board-low", score_delta=2)
+    (update,) = low.args('leaderboard_update')
+    assert [e['uid'] for e in update['top']] == ['board-low', 'board-high']
+
+    # 榜外玩家的分数变化不推送
+    server.update_user(high.uid, score_delta=-(10 ** 6))
+    low.received()
+    monkeypatch.setattr(server, "LEADERBOARD_SIZE", 1)
+    monkeypatch.setattr(server, "LEADERBOARD_PUSHED", server.leaderboard_top())
+    server.update_user(high.uid, score_delta=1)
+    assert low.args('leaderboard_update') == []
+
+    low.emit('leave_leaderboard')
+    server.update_user("board-low", score_delta=-(10 ** 6))
+    assert low.args('leaderboard_update') == []
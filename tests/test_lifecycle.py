@@ -0,0 +1,110 @@
+# 断线清理、重连宽限、空闲房间回收与房间内存估算
+import eventlet
+import pytest
+
+from profiler import deep_sizeof
+from state import Player
+
+
+@pytest.fixture
+def short_grace(server, monkeypatch):
+    monkeypatch.setattr(server, "RECONNECT_GRACE", 0.05)
+    return server
+
+
+def test_deep_sizeof_counts_shared_objects_once():
+    shared = ["x" * 1000]
+    assert deep_sizeof([shared, shared]) < deep_sizeof([shared, ["x" * 1000]])
+    player = Player(uid="a", name="A", hp=10)
+    assert deep_sizeof(player) > deep_sizeof(player, skip=(player.name,))
+
+
+def test_disconnect_clears_session_tables(players):
+    host = players("life-a")
+    server = host.server
+    room_id = host.create_room()
+    host.join(room_id)
+    sid = next(iter(server.ROOM_MEMBERS[room_id]))
+    host.client.disconnect()
+    eventlet.sleep(0.01)
+    assert sid not in server.SID_TO_ROOM and sid not in server.SID_TO_UID and sid not in server.SID_CODECS
+    assert not server.ROOM_MEMBERS.get(room_id)
+    assert (room_id, "life-a") in server.GRACE_TIMERS
+
+
+def test_grace_expiry_removes_spectators_and_empty_lobby_rooms(players, short_grace):
+    host, watcher = players("life-host", "life-spec")
+    room_id = host.create_room()
+    host.join(room_id)
+    watcher.join(room_id, spectator=True)
+    watcher.client.disconnect()
+    eventlet.sleep(0.15)
+    assert "life-spec" not in short_grace.rooms[room_id].spectators
+    assert "life-spec" not in short_grace.UID_ROOM
+
+    host.client.disconnect()
+    eventlet.sleep(0.15)
+    assert room_id not in short_grace.rooms
+
+
+def test_rejoining_cancels_grace(players, short_grace):
+    host, guest = players("life-b", "life-c")
+    room_id = host.create_room()
+    host.join(room_id)
+    guest.join(room_id)
+    guest.client.disconnect()
+    again = players("life-c")
+    again.join(room_id)
+    eventlet.sleep(0.15)
+    assert "life-c" in short_grace.rooms[room_id].players
+    assert (room_id, "life-c") not in short_grace.GRACE_TIMERS
+
+
+def test_players_in_a_running_game_leave_on_reset(players, short_grace):
+    host, guest = players("life-d", "life-e")
+    room_id = host.create_room()
+    host.join(room_id)
+    guest.join(room_id)
+    room = short_grace.rooms[room_id]
+    room.phase = "END"
+    guest.client.disconnect()
+    eventlet.sleep(0.15)
+    assert "life-e" in room.players
+    assert short_grace.LEFT_PLAYERS[room_id] == {"life-e"}
+
+    short_grace.perform_reset(room_id)
+    assert set(room.players) == {"life-d"}
+    assert room_id not in short_grace.LEFT_PLAYERS
+
+
+def test_leaving_withdraws_kick_votes(server):
+    room = server.init_room_state("kick-room", "r")
+    server.rooms[room.id] = room
+    for uid in ("a", "b", "c"):
+        room.players[uid] = server.new_player(uid, uid)
+    room.kick_votes = {"a": ["b"], "c": ["a", "b"]}
+    server.remove_member(room, "b")
+    assert room.kick_votes == {"a": [], "c": ["a"]}
+    server.remove_member(room, "a")
+    assert room.kick_votes == {"c": []}
+
+
+def test_idle_rooms_are_reaped(server):
+    room = server.init_room_state("idle-room", "r")
+    server.rooms[room.id] = room
+    server.reap_room(room.id)
+    assert room.id not in server.rooms
+
+
+def test_admin_memory_report(players):
+    host = players("life-f")
+    room_id = host.create_room()
+    host.join(room_id)
+    host.received()
+    host.emit('admin_command', {'password': host.server.ADMIN_PASSWORD, 'cmd': 'memory'})
+    report = host.args('admin_memory')[-1]
+    (entry,) = [r for r in report['rooms'] if r['id'] == room_id]
+    assert entry['connections'] == 1 and entry['state_bytes'] > 0 and entry['sync_bytes'] > 0
+    assert report['tables']['sid_to_room'] == 1
+    text = host.server.app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'balance_session_entries{table="uid_room"} 1.0' in text
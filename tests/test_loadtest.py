@@ -0,0 +1,42 @@
+import json
+import os
+
+import pytest
+
+import loadtest
+
+
+def test_percentile_and_range_parsing():
+    assert loadtest.percentile([], 0.5) is None
+    assert loadtest.percentile([5, 1, 3, 2, 4], 0.5) == 3
+    assert loadtest.percentile(list(range(101)), 0.99) == 99
+    assert loadtest.parse_range("0.5,3") == (0.5, 3.0)
+    assert loadtest.parse_range("2") == (2.0, 2.0)
+
+
+def test_state_ops_match_server(server):
+    state = {"players": {"a": {"hp": 10}}, "logs": ["x"], "phase": "INPUT"}
+    ops = [["set", ["players", "a", "hp"], 9], ["push", ["logs"], ["y"]], ["del", ["phase"]]]
+    mine, theirs = json.loads(json.dumps(state)), json.loads(json.dumps(state))
+    loadtest.apply_state_ops(mine, ops)
+    server.apply_state_ops(theirs, ops)
+    assert mine == theirs == {"players": {"a": {"hp": 9}}, "logs": ["x", "y"]}
+
+
+def test_proc_stats_reads_own_process():
+    if not os.path.exists(f"/proc/{os.getpid()}"):
+        pytest.skip("no /proc")
+    stats = loadtest.ProcStats(os.getpid())
+    assert stats.cpu_seconds() > 0
+    assert stats.rss_bytes() > 1024 * 1024
+
+
+def test_one_room_step_against_a_local_server(capsys):
+    if loadtest.socketio is None or not hasattr(loadtest.socketio, "Client"):
+        pytest.skip("python-socketio[client] not installed")
+    loadtest.main(["--steps", "1", "--players", "3", "--spectators", "0", "--step-seconds", "4",
+                   "--think", "0.1,0.3", "--ramp", "0.5", "--json", "--seed", "1"])
+    step = json.loads(capsys.readouterr().out)["steps"][0]
+    assert step["clients"] == 3
+    assert step["submits"] > 0 and step["frames"] > 0
+    assert step["errors"] == 0
@@ -0,0 +1,66 @@
+# 大厅订阅：房间列表只推给停留在列表页的连接，合并推送且只带有变化的房间
+import eventlet
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def quick_flush(server, monkeypatch):
+    monkeypatch.setattr(server, "ROOM_LIST_COALESCE", 0.05)
+
+
+def settle():
+    eventlet.sleep(0.15)
+
+
+def test_get_room_list_subscribes_to_coalesced_patches(players):
+    watcher, host = players("lobby-watcher", "lobby-host")
+    watcher.emit('get_room_list')
+    assert watcher.args('room_list_update') == [[]]
+
+    room_id = host.create_room("first")
+    host.join(room_id)
+    settle()
+    # 创建与进房两次变更合并成一次推送
+    (patch,) = watcher.args('room_list_patch')
+    assert patch == {'upsert': [{'id': room_id, 'name': 'first', 'count': 1, 'phase': 'LOBBY'}], 'remove': []}
+
+    # 没有变化时不推送
+    host.server.broadcast_room_list()
+    settle()
+    assert watcher.args('room_list_patch') == []
+
+    host.emit('leave_room_req')
+    host.server.delete_room(room_id)
+    host.server.broadcast_room_list()
+    settle()
+    assert watcher.args('room_list_patch')[-1] == {'upsert': [], 'remove': [room_id]}
+
+
+def test_joining_a_room_leaves_the_lobby(players):
+    host, guest = players("lobby-owner", "lobby-guest")
+    guest.emit('get_room_list')
+    room_id = host.create_room()
+    guest.join(room_id)
+    guest.received()
+    host.server.rooms[room_id].name = "renamed"
+    host.server.broadcast_room_list()
+    settle()
+    assert guest.args('room_list_patch') == []
+
+
+def test_rejected_join_stays_in_the_lobby(players, monkeypatch):
+    host, late = players("lobby-full-host", "lobby-late")
+    monkeypatch.setattr(host.server, "MAX_PLAYERS", 1)
+    room_id = host.create_room()
+    host.join(room_id)
+    late.emit('get_room_list')
+    late.received()
+
+    late.join(room_id)
+    assert late.args('error_msg') == [{'msg': '房间已满'}]
+    assert list(host.server.SID_TO_ROOM.values()) == [room_id]
+    assert set(host.server.rooms[room_id].players) == {"lobby-full-host"}
+    host.server.rooms[room_id].name = "still watching"
+    host.server.broadcast_room_list()
+    settle()
+    assert [p['upsert'][0]['name'] for p in late.args('room_list_patch')] == ["still watching"]
@@ -0,0 +1,44 @@
+from lrucache import LRUCache
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert "a" in cache and "c" in cache
+    assert cache.evictions == 1
+
+
+def test_put_existing_key_refreshes_without_evicting():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("a", 10)
+    cache.put("c", 3)
+    assert cache.peek("a") == 10
+    assert "b" not in cache
+    assert len(cache) == 2
+
+
+def test_peek_does_not_touch_order_or_stats():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.peek("a") == 1
+    cache.put("c", 3)
+    assert "a" not in cache
+    assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
+
+
+def test_stats_and_invalidate():
+    cache = LRUCache(maxsize=4)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("x") is None
+    assert cache.invalidate("a") == 1
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["hit_rate"]) == (0, 1, 2, round(1 / 3, 4))
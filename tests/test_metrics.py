@@ -0,0 +1,53 @@
+from metrics import Registry, timed
+
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    sent = registry.counter('frames_total', '帧数', ['event'])
+    sent.inc(1, 'a')
+    sent.inc(2, 'a')
+    sent.inc(1, 'say "hi"')
+    registry.gauge('rooms', '房间数', ['phase'], collect=lambda: {("INPUT",): 3})
+    text = registry.render()
+    assert '# TYPE frames_total counter' in text
+    assert 'frames_total{event="a"} 3.0' in text
+    assert 'frames_total{event="say \\"hi\\""} 1.0' in text
+    assert 'rooms{phase="INPUT"} 3.0' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram('latency', '耗时', buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        latency.observe(value)
+    text = registry.render()
+    assert 'latency_bucket{le="0.1"} 1' in text
+    assert 'latency_bucket{le="1.0"} 3' in text
+    assert 'latency_bucket{le="+Inf"} 4' in text
+    assert 'latency_count 4' in text
+    assert 'latency_sum 4.05' in text
+
+
+def test_timed_records_even_on_error():
+    registry = Registry()
+    latency = registry.histogram('latency', '耗时', ['name'])
+
+    @timed(latency, 'boom')
+    def boom():
+        raise ValueError
+
+    try:
+        boom()
+    except ValueError:
+        pass
+    assert latency.values[('boom',)][0][-1] + sum(latency.values[('boom',)][0][:-1]) == 1
+
+
+def test_metrics_endpoint_counts_events_and_frames(players):
+    a = players("a")
+    a.create_room()
+    text = a.server.app.test_client().get('/metrics').get_data(as_text=True)
+    assert 'balance_event_duration_seconds_count{event="create_room"}' in text
+    assert 'balance_frames_sent_total{event="room_created"}' in text
+    assert 'balance_rooms{phase="LOBBY"} 1.0' in text
+    assert 'balance_connections 1.0' in text
@@ -0,0 +1,57 @@
+# 每房间的阶段截止定时器：到点调用 handle_timeout，重设 / 删除房间会取消旧定时器
+import eventlet
+
+
+def make_room(server, phase):
+    room = server.init_room_state("timer-room", "timer")
+    room.phase = phase
+    server.rooms[room.id] = room
+    return room
+
+
+def test_deadline_fires_handle_timeout(server):
+    room = make_room(server, "END")
+    # 重置后没有玩家的房间会被删除
+    room.players["p"] = server.new_player("p", "p")
+    server.set_phase_timer(room, 0.05)
+    assert room.timer == 0.05
+    eventlet.sleep(0.15)
+    assert server.rooms[room.id].phase == "LOBBY"
+    assert room.id not in server.ROOM_TIMERS
+
+
+def test_rearming_cancels_previous_deadline(server):
+    room = make_room(server, "END")
+    server.set_phase_timer(room, 0.05)
+    server.set_phase_timer(room, 10)
+    eventlet.sleep(0.15)
+    assert room.phase == "END"
+    assert 9 < server.phase_time_left(room.id) <= 10
+
+
+def test_deleting_room_cancels_timer(server, monkeypatch):
+    fired = []
+    monkeypatch.setattr(server, "handle_timeout", fired.append)
+    room = make_room(server, "INPUT")
+    server.set_phase_timer(room, 0.05)
+    server.delete_room(room.id)
+    eventlet.sleep(0.15)
+    assert fired == []
+    assert server.phase_time_left(room.id) == 0
+
+
+def test_timer_update_sent_once_per_phase_and_on_sync(players):
+    host = players("timer-host")
+    room_id = host.create_room()
+    host.join(room_id)
+    host.received()
+
+    room = host.server.rooms[room_id]
+    room.phase = "END"
+    host.server.set_phase_timer(room, 30)
+    eventlet.sleep(0.05)
+    assert host.args('timer_update') == [{"timer": 30}]
+
+    host.emit('request_sync')
+    (left,) = host.args('timer_update')
+    assert 29 < left["timer"] <= 30
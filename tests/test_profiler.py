@@ -0,0 +1,50 @@
+import logging
+import time
+
+import eventlet
+
+from profiler import SlowEventLog, profile_hub
+
+
+def burn_cpu(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def test_profile_sees_greenlet_blocking_the_hub():
+    blocker = eventlet.spawn_after(0.05, burn_cpu, 0.3)
+    collapsed, samples = profile_hub(0.5)
+    blocker.wait()
+    assert samples > 0
+    stacks = dict(line.rsplit(" ", 1) for line in collapsed.strip().splitlines())
+    busy = sum(int(count) for stack, count in stacks.items() if "test_profiler.py:burn_cpu" in stack)
+    assert busy >= samples // 3
+
+
+def test_only_one_profile_at_a_time():
+    first = eventlet.spawn(profile_hub, 0.2)
+    eventlet.sleep(0)
+    assert profile_hub(0.1) is None
+    assert first.wait() is not None
+
+
+def test_slow_event_log_keeps_offenders_only(caplog):
+    log = SlowEventLog(0.05, size=2)
+    with caplog.at_level(logging.WARNING, logger='balance.slow'):
+        log.record('fast', 'r', 0.01)
+        for name in ('a', 'b', 'c'):
+            log.record(name, 'r', 0.2)
+    assert [e["event"] for e in log.recent] == ['b', 'c']
+    assert "slow event c room=r 200.0ms" in caplog.text
+
+
+def test_admin_reads_slow_events(players, monkeypatch):
+    a = players("a")
+    monkeypatch.setattr(a.server.SLOW_EVENTS, "budget", 0)
+    a.server.SLOW_EVENTS.recent.clear()
+    a.join(a.create_room())
+    a.received()
+    a.emit('admin_command', {'password': a.server.ADMIN_PASSWORD, 'cmd': 'slow_events'})
+    events = a.args('admin_slow_events')[-1]['events']
+    assert {'create_room', 'join_room'} <= {e['event'] for e in events}
@@ -0,0 +1,87 @@
+import json
+import random
+
+import game
+from replay import decode_replay, encode_replay, iter_replay
+
+
+def play_history(seed, players=5):
+    # 用游戏逻辑打完一局，得到与服务器相同结构的 full_history
+    rng_state = random.getstate()
+    random.seed(seed)
+    try:
+        room = game.init_room_state("r", "r")
+        for i in range(players):
+            uid = f"p{i}"
+            room.players[uid] = game.new_player(uid, f"玩家{i}")
+        while room.round < 60:
+            room.announcement_queue.clear()
+            game.apply_pending_perm_rules(room)
+            game.begin_round(room)
+            for p in room.players.values():
+                if p.alive:
+                    p.guess = random.choice([0, 100, random.randint(0, 100)])
+                    p.submitted = True
+            finished, _ = game.resolve_room_round(room)
+            if finished:
+                break
+        return room.full_history
+    finally:
+        random.setstate(rng_state)
+
+
+def test_round_trip_full_games():
+    for seed in range(20):
+        history = play_history(seed)
+        assert history
+        assert decode_replay(encode_replay(history)) == history
+
+
+def test_iter_replay_streams_small_chunks():
+    history = play_history(3)
+    blob = encode_replay(history)
+    rounds = iter_replay(blob[i:i + 7] for i in range(0, len(blob), 7))
+    header = next(rounds)
+    assert header["rounds"] == len(history)
+    assert {uid for uid, _ in header["players"]} == {f"p{i}" for i in range(5)}
+    assert list(rounds) == history
+
+
+def test_empty_history():
+    assert decode_replay(encode_replay([])) == []
+    assert list(iter_replay([])) == []
+
+
+def save_record(server, **columns):
+    with server.app.app_context():
+        record = server.GameRecord(players_json="{}", **columns)
+        server.db.session.add(record)
+        server.db.session.commit()
+        return record.id
+
+
+def test_get_replay_streams_rounds(players):
+    a = players("a")
+    history = play_history(5)
+    record_id = save_record(a.server, replay=encode_replay(history))
+    a.received()
+    a.emit('get_replay', {'record_id': record_id})
+    names = [m['name'] for m in a.received()]
+    assert names == ['replay_start'] + ['replay_round'] * len(history) + ['replay_end']
+
+
+def test_get_replay_missing_record(players):
+    a = players("a")
+    a.received()
+    a.emit('get_replay', {'record_id': 987654})
+    assert len(a.received('error_msg')) == 1
+
+
+def test_migrate_replays_converts_old_rows(server):
+    history = play_history(7)
+    record_id = save_record(server, details_json=json.dumps(history))
+    with server.app.app_context():
+        server.migrate_replays(batch_size=1)
+        record = server.db.session.get(server.GameRecord, record_id)
+        assert record.details_json is None
+        assert decode_replay(record.replay) == history
@@ -0,0 +1,75 @@
+import os
+import stat
+
+import eventlet
+from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy import event
+
+
+def login_token(player):
+    return player.args('login_result')[-1]['resume_token']
+
+
+def resume(server, token, room_id=None):
+    client = server.socketio.test_client(server.app)
+    client.emit('resume', {'token': token, 'room_id': room_id})
+    eventlet.sleep(0.01)
+    messages = client.get_received()
+    client.disconnect()
+    return {m['name']: m['args'][0] for m in messages}
+
+
+def test_secret_key_is_generated_once_and_private(server):
+    path = os.path.join(server.app.instance_path, 'secret_key')
+    assert server.app.config['SECRET_KEY'] != server.DEFAULT_SECRET_KEY
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert server.load_secret_key() == server.app.config['SECRET_KEY']
+
+
+def test_resume_rejoins_room_without_sql(players):
+    host = players("resume-a")
+    token = login_token(host)
+    room_id = host.create_room()
+    host.join(room_id)
+    server = host.server
+    server.USER_CACHE.invalidate("resume-a")
+
+    statements = []
+    def count(*args):
+        statements.append(args[2])
+    with server.app.app_context():
+        engine = server.db.engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        messages = resume(server, token, room_id)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    assert statements == []
+    assert messages['resume_result']['success'] and messages['resume_result']['in_room']
+    assert messages['resume_result']['user']['uid'] == "resume-a"
+    assert messages['reconnect_room']['room']['id'] == room_id
+    # 每次恢复都换发新令牌
+    assert messages['resume_result']['resume_token']
+
+
+def test_bad_or_forged_tokens_are_rejected(players):
+    host = players("resume-b")
+    token = login_token(host)
+    server = host.server
+    assert resume(server, token[:-2] + "xx")['resume_result'] == {'success': False}
+    assert resume(server, None)['resume_result'] == {'success': False}
+    forged = URLSafeTimedSerializer(server.DEFAULT_SECRET_KEY, salt='resume').dumps(["resume-b", 0])
+    assert resume(server, forged)['resume_result'] == {'success': False}
+
+
+def test_password_change_revokes_earlier_tokens(players):
+    host = players("resume-c")
+    old = login_token(host)
+    host.emit('change_password', {'uid': 'resume-c', 'new_password': 'pw2'})
+    new = host.args('password_changed')[-1]['resume_token']
+    server = host.server
+    assert resume(server, old)['resume_result'] == {'success': False}
+    assert resume(server, new)['resume_result']['success']
+    # 作废时间落在 user 行上，重启后仍然有效
+    with server.app.app_context():
+        assert server.db.session.get(server.User, "resume-c").token_epoch == server.TOKENS_REVOKED["resume-c"]
@@ -0,0 +1,96 @@
+from copy import deepcopy
+
+import eventlet
+
+from roomevents import RateLimiter, RoomEventBus
+
+
+def test_rate_limiter_bursts_then_refills():
+    limit = RateLimiter(rate=1, burst=3)
+    assert [limit.allow("a", now=0) for _ in range(4)] == [True, True, True, False]
+    assert limit.allow("b", now=0)
+    assert not limit.allow("a", now=0.5)
+    assert limit.allow("a", now=1.6)
+
+
+def test_rate_limiter_prunes_full_buckets():
+    limit = RateLimiter(rate=1, burst=2, max_keys=2)
+    limit.allow("a", now=0)
+    limit.allow("b", now=0)
+    limit.allow("c", now=10)
+    assert set(limit.buckets) == {"c"}
+
+
+def test_bus_coalesces_one_window_per_room():
+    sent = []
+    bus = RoomEventBus(0.05, lambda room_id, batch: sent.append((room_id, batch)))
+    bus.flag("r", "a", "ready")
+    bus.flag("r", "b", "submitted")
+    bus.like("r", "spec", "a", sender_is_player=False)
+    bus.like("r", "b", "a", sender_is_player=True)
+    assert bus.emote("r", "a", "😆")
+    bus.flag("other", "c", "ready")
+    bus.discard("other")
+    eventlet.sleep(0.1)
+    assert len(sent) == 1
+    room_id, batch = sent[0]
+    assert room_id == "r"
+    assert batch.players == {"a": {"ready", "likes"}, "b": {"submitted", "likes_sent"}}
+    assert batch.spectators == {"spec"} and batch.likes == {"a": 2}
+    assert batch.emotes == [["a", "😆"]]
+
+
+def test_bus_caps_emotes_per_window():
+    bus = RoomEventBus(0.05, lambda room_id, batch: None, max_emotes=2)
+    assert [bus.emote("r", "a", "x") for _ in range(3)] == [True, True, False]
+
+
+def test_ready_toggles_become_one_frame_without_patch(players):
+    host, guest, spec = players("host", "guest", "spec")
+    room_id = host.create_room()
+    for p in (host, guest):
+        p.join(room_id)
+    spec.join(room_id, spectator=True)
+    state = None
+    for m in host.received():
+        if m['name'] == 'state_update':
+            state = deepcopy(m['args'][0])
+        elif m['name'] == 'state_patch':
+            host.server.apply_state_ops(state, m['args'][0]["ops"])
+            state["rev"] = m['args'][0]["rev"]
+    spec.received()
+
+    host.client.emit('toggle_ready')
+    guest.client.emit('toggle_ready')
+    for _ in range(10):
+        spec.client.emit('send_emote', {'emote': '😆'})
+    spec.client.emit('send_like', {'target_uid': 'host'})
+    eventlet.sleep(0.15)
+
+    received = host.received()
+    assert [m['name'] for m in received] == ['room_events']
+    frame = received[0]['args'][0]
+    assert frame["players"]["host"]["ready"] is True and frame["players"]["guest"]["ready"] is True
+    assert frame["players"]["host"]["likes"] == 1 and frame["likes"] == {"host": 1}
+    assert frame["spectators"] == {"spec": {"likes_sent": 1}}
+    # 表情按发送者限速 (连发 3 个)，且使用会话里的 uid
+    assert frame["emotes"] == [["spec", "😆"]] * 3
+
+    for uid, changes in frame["players"].items():
+        state["players"][uid].update(changes)
+    # 快照已同步这些值，后续补丁不再重复携带
+    host.server.broadcast_room_state(room_id)
+    eventlet.sleep(0.01)
+    assert host.args('state_patch') == []
+    state["spectators"][0].update(frame["spectators"]["spec"])
+    assert state == host.server.project_room(host.server.rooms[room_id], "alive")
+
+
+def test_emotes_need_room_membership(players):
+    host, outsider = players("host", "outsider")
+    room_id = host.create_room()
+    host.join(room_id)
+    host.received()
+    outsider.emit('send_emote', {'emote': '😭'})
+    eventlet.sleep(0.15)
+    assert host.received('room_events') == []
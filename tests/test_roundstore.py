@@ -0,0 +1,85 @@
+import os
+
+import eventlet
+
+from roundstore import RoundStore
+
+
+def test_append_is_buffered_until_the_worker_runs(tmp_path):
+    store = RoundStore(str(tmp_path))
+    store.append("r", {"round": 1})
+    # 追加本身不碰文件，写盘由存档协程放到线程池里做
+    assert not os.path.exists(tmp_path / "r.jsonl")
+    assert store.count("r") == 1
+    store.flush()
+    assert os.path.exists(tmp_path / "r.jsonl")
+
+
+def test_read_sees_rounds_not_yet_written(tmp_path):
+    store = RoundStore(str(tmp_path))
+    for i in range(5):
+        store.append("r", {"round": i, "note": "第 %d 回合" % i})
+    assert store.read("r") == [{"round": i, "note": "第 %d 回合" % i} for i in range(5)]
+    assert [e["round"] for e in store.read("r", 1, 3)] == [1, 2]
+    assert store.read("r", 5) == []
+    assert store.read("missing") == []
+
+
+def test_drop_then_reuse_key_starts_fresh(tmp_path):
+    store = RoundStore(str(tmp_path))
+    store.append("r", {"round": 1})
+    store.append("r", {"round": 2})
+    store.drop("r")
+    store.append("r", {"round": 3})
+    assert store.count("r") == 1
+    assert store.read("r") == [{"round": 3}]
+
+
+def test_recover_removes_archives_of_unknown_rooms(tmp_path):
+    (tmp_path / "old.jsonl").write_text("{}\n")
+    RoundStore(str(tmp_path)).recover({})
+    assert not os.path.exists(tmp_path / "old.jsonl")
+
+
+def test_hub_keeps_running_while_rounds_are_archived(tmp_path):
+    store = RoundStore(str(tmp_path))
+    ticks = []
+    ticker = eventlet.spawn(lambda: [ticks.append(eventlet.sleep(0)) for _ in range(20)])
+    for i in range(200):
+        store.append("r%d" % (i % 4), {"round": i})
+    assert store.count("r0") == 50
+    store.flush()
+    ticker.wait()
+    assert len(ticks) == 20
+    assert [e["round"] for e in store.read("r3")][:3] == [3, 7, 11]
+
+
+def test_archive_keeps_live_window_and_pages_history(players):
+    a = players("a")
+    room_id = a.create_room()
+    a.join(room_id)
+    room = a.server.rooms[room_id]
+    room.full_history.extend({"round": i} for i in range(1, 15))
+    a.server.archive_rounds(room)
+    assert [e["round"] for e in room.full_history] == [14]
+    assert a.server.ROUND_STORE.count(room_id) == 13
+
+    a.received()
+    a.emit('get_round_history')
+    page = a.args('round_history')[-1]
+    assert [e["round"] for e in page["rounds"]] == list(range(4, 14))
+    assert page["next_cursor"] == 3
+    a.emit('get_round_history', {'cursor': page["next_cursor"]})
+    page = a.args('round_history')[-1]
+    assert [e["round"] for e in page["rounds"]] == [1, 2, 3]
+    assert page["next_cursor"] is None
+
+
+def test_deleting_room_drops_its_archive(players):
+    a = players("a")
+    room_id = a.create_room()
+    a.server.ROUND_STORE.append(room_id, {"round": 1})
+    a.server.delete_room(room_id)
+    assert a.server.ROUND_STORE.count(room_id) == 0
+    a.server.ROUND_STORE.flush()
+    assert not os.path.exists(a.server.ROUND_STORE._path(room_id))
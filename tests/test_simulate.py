@@ -0,0 +1,65 @@
+# 离线平衡模拟：对局能结束、同一种子结果可复现、平衡参数覆盖生效
+import json
+import random
+from collections import Counter
+
+import pytest
+
+import game
+import simulate
+
+
+@pytest.fixture
+def restore_game(monkeypatch):
+    # configure() 直接改 game 模块的全局参数，测试结束后还原
+    for name in ("BASE_MULTIPLIER", "EVENT_CHANCE", "DUEL_SWAP_CHANCE", "PERMANENT_RULE_POOL", "ROUND_EVENT_POOL"):
+        monkeypatch.setattr(game, name, getattr(game, name))
+
+
+def test_games_finish_and_are_reproducible():
+    task = (1234, 40, ["random", "level1", "follow"], 5)
+    first = simulate.run_chunk(task)
+    assert first == simulate.run_chunk(task)
+    assert first["games"] == 40
+    assert sum(first["lengths"].values()) == 40
+    assert sum(first["wins"].values()) + first["draws"] + first["timeouts"] == 40
+    assert sum(first["seats"].values()) == 40 * 5
+
+
+def test_play_game_reports_a_seated_winner():
+    random.seed(5)
+    seats = [("fifty", simulate.strategy_fifty), ("level2", simulate.strategy_level2), ("undercut", simulate.strategy_undercut)]
+    length, winner, rule_rounds = simulate.play_game(seats)
+    assert 1 <= length <= simulate.MAX_ROUNDS
+    assert winner in (None, "fifty", "level2", "undercut")
+    assert all(1 <= r <= length for r in rule_rounds.values())
+
+
+def test_configure_removes_disabled_rules(restore_game):
+    simulate.configure({"disable_rules": [1, 2], "disable_events": [101], "event_chance": 0.0})
+    assert {r["id"] for r in game.PERMANENT_RULE_POOL}.isdisjoint({1, 2})
+    assert 101 not in {e["id"] for e in game.ROUND_EVENT_POOL}
+    assert game.EVENT_CHANCE == 0.0
+    stats = simulate.run_chunk((9, 30, ["random"], 4))
+    assert not {1, 2} & set(stats["rule_games"])
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(SystemExit):
+        simulate.load_strategy("no-such-strategy")
+
+
+def test_json_report(restore_game, capsys):
+    simulate.main(["--games", "30", "--players", "4", "--workers", "1", "--chunk", "7", "--seed", "3", "--json"])
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["games"] == 30 and summary["seed"] == 3
+    assert set(summary["strategies"]) == {"random", "level1", "follow"}
+    assert sum(summary["length"]["histogram"].values()) == 30
+    assert summary["baseline_win_rate_per_seat"] == 0.25
+
+
+def test_percentile():
+    lengths = Counter({1: 5, 2: 4, 10: 1})
+    assert simulate.percentile(lengths, 0.5) == 1
+    assert simulate.percentile(lengths, 0.9) == 2
+    assert simulate.percentile(lengths, 0.99) == 10
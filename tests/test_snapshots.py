@@ -0,0 +1,131 @@
+import json
+import os
+
+import eventlet
+
+import game
+from roundstore import RoundStore
+from snapshots import SnapshotLog
+from state import Room
+
+
+def write(log, *records, deleted=()):
+    changes = {r["id"]: log.encode(r) for r in records}
+    changes.update({room_id: None for room_id in deleted})
+    log.write(changes, block=True)
+
+
+def test_last_line_wins_and_deletions(tmp_path):
+    path = tmp_path / "rooms.jsonl"
+    log = SnapshotLog(str(path))
+    write(log, {"id": "a", "v": 1}, {"id": "b", "v": 1})
+    write(log, {"id": "a", "v": 2}, deleted=["b"])
+    assert SnapshotLog(str(path)).load() == {"a": {"id": "a", "v": 2}}
+
+
+def test_load_ignores_torn_final_line(tmp_path):
+    path = tmp_path / "rooms.jsonl"
+    log = SnapshotLog(str(path))
+    write(log, {"id": "a", "v": 1}, {"id": "b", "v": 1})
+    with open(path, "ab") as f:
+        f.write(b'{"id":"a","v":2,"na')  # 崩溃时写了一半
+
+    restored = SnapshotLog(str(path))
+    assert restored.load() == {"a": {"id": "a", "v": 1}, "b": {"id": "b", "v": 1}}
+    # 残行被截掉，之后追加的行不会接在它后面
+    write(restored, {"id": "b", "v": 3})
+    assert SnapshotLog(str(path)).load() == {"a": {"id": "a", "v": 1}, "b": {"id": "b", "v": 3}}
+
+
+def test_torn_line_of_valid_json_is_still_dropped(tmp_path):
+    path = tmp_path / "rooms.jsonl"
+    log = SnapshotLog(str(path))
+    write(log, {"id": "a", "v": 1})
+    with open(path, "ab") as f:
+        f.write(b'{"id":"a","v":2}')  # 换行符之前中断：这一行没有写完
+    assert SnapshotLog(str(path)).load() == {"a": {"id": "a", "v": 1}}
+
+
+def test_rewrite_compacts_stale_lines(tmp_path):
+    path = tmp_path / "rooms.jsonl"
+    log = SnapshotLog(str(path))
+    for v in range(40):
+        write(log, {"id": "a", "v": v})
+    with open(path, "rb") as f:
+        assert len(f.readlines()) < 40
+    assert SnapshotLog(str(path)).load() == {"a": {"id": "a", "v": 39}}
+
+
+def test_missing_file(tmp_path):
+    assert SnapshotLog(str(tmp_path / "none" / "rooms.jsonl")).load() == {}
+
+
+def test_room_record_round_trip():
+    room = game.init_room_state("r", "房间")
+    room.players["a"] = game.new_player("a", "甲")
+    room.spectators["s"] = game.new_spectator("s", "观众")
+    room.logs.appendleft("R1 ...")
+    game.trigger_room_rule(room, game.PERM_RULE_BY_ID[2])
+    record = json.loads(json.dumps(room.to_record()))
+    restored = Room.from_record(dict(record, removed_field=1))
+    assert restored.to_record() == record
+    assert restored.pipeline is None
+    game.compile_room_rules(restored)
+    assert restored.pipeline is room.pipeline
+
+
+def test_round_store_recover_keeps_restored_rooms(tmp_path):
+    store = RoundStore(str(tmp_path))
+    for i in range(3):
+        store.append("kept", {"round": i})
+    store.append("gone", {"round": 0})
+    store.flush()
+    with open(tmp_path / "kept.jsonl", "ab") as f:
+        f.write(b'{"round": 3')  # 崩溃时写了一半
+
+    store = RoundStore(str(tmp_path))
+    store.recover({"kept": 2})
+    assert not os.path.exists(tmp_path / "gone.jsonl")
+    assert store.read("kept") == [{"round": 0}, {"round": 1}]
+    store.append("kept", {"round": 2})
+    assert store.read("kept", 2) == [{"round": 2}]
+
+
+def test_restart_restores_rooms_timers_and_archives(players, tmp_path, monkeypatch):
+    host = players("host")
+    server = host.server
+    room_id = host.create_room()
+    host.join(room_id)
+    room = server.rooms[room_id]
+    room.round, room.phase = 3, "INPUT"
+    server.set_phase_timer(room, 30)
+    archive = RoundStore(str(tmp_path / "rounds"))
+    monkeypatch.setattr(server, "ROUND_STORE", archive)
+    for i in range(3):
+        archive.append(room_id, {"round": i})
+    archive.flush()
+    snapshots = SnapshotLog(str(tmp_path / "rooms.jsonl"))
+    snapshots.write({room_id: server.room_snapshot(room)}, block=True)
+    expected = room.to_record()
+
+    # 模拟进程重启：内存里的房间都没了，只剩快照与存档文件
+    server.cancel_phase_timer(room_id)
+    del server.rooms[room_id]
+    server.UID_ROOM.clear()
+    monkeypatch.setattr(server, "ROOM_SNAPSHOTS", SnapshotLog(str(tmp_path / "rooms.jsonl")))
+    monkeypatch.setattr(server, "ROUND_STORE", RoundStore(str(tmp_path / "rounds")))
+    server.restore_rooms()
+
+    restored = server.rooms[room_id]
+    assert restored.to_record() == expected
+    assert restored.pipeline is not None
+    assert server.UID_ROOM == {"host": room_id}
+    assert 5 <= server.phase_time_left(room_id) <= 30
+    assert server.ROUND_STORE.count(room_id) == 3
+
+    again = server.socketio.test_client(server.app)
+    again.emit('identify', {'uid': 'host'})
+    eventlet.sleep(0.01)
+    reconnect = [m["args"][0] for m in again.get_received() if m["name"] == "reconnect_room"]
+    again.disconnect()
+    assert reconnect[-1]["room"]["id"] == room_id
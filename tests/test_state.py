@@ -0,0 +1,56 @@
+# 带 __slots__ 的房间模型与 uid -> 房间索引
+import eventlet
+import pytest
+
+import game
+from state import PLAYER_FIELDS, Player, Spectator
+
+
+def test_models_are_slotted_and_keep_the_wire_shape():
+    player = game.new_player("a", "A", score=3)
+    with pytest.raises(AttributeError):
+        player.extra = 1
+    assert list(player.to_wire()) == list(PLAYER_FIELDS)
+
+    room = game.init_room_state("r", "name")
+    room.players["a"] = player
+    room.spectators["s"] = game.new_spectator("s", "S")
+    wire = room.to_wire()
+    assert wire["players"] == {"a": player.to_wire()}
+    assert wire["spectators"] == [{"uid": "s", "name": "S", "likes_sent": 0}]
+    assert room.has_member("s") and room.has_member("a") and not room.has_member("x")
+
+
+def test_reset_keeps_members_and_clears_the_game():
+    room = game.init_room_state("r", "name")
+    room.players["a"] = game.new_player("a", "A")
+    room.players["a"].hp, room.players["a"].alive = 0, False
+    room.phase, room.round = "END", 7
+    game.reset_room_state(room)
+    assert (room.phase, room.round) == ("LOBBY", 0)
+    assert room.players["a"].alive and room.players["a"].hp == game.MAX_HP
+
+
+def test_uid_index_follows_joins_leaves_and_deletes(players):
+    host, watcher = players("index-host", "index-spec")
+    server = host.server
+    room_id = host.create_room()
+    host.join(room_id)
+    watcher.join(room_id, spectator=True)
+    assert server.UID_ROOM == {"index-host": room_id, "index-spec": room_id}
+    assert isinstance(server.rooms[room_id].spectators["index-spec"], Spectator)
+    assert isinstance(server.rooms[room_id].players["index-host"], Player)
+
+    watcher.emit('leave_room_req')
+    assert "index-spec" not in server.UID_ROOM
+
+    # 重连按索引直接找到房间
+    again = server.socketio.test_client(server.app)
+    again.emit('identify', {'uid': 'index-host'})
+    eventlet.sleep(0.01)
+    reconnect = [m["args"][0] for m in again.get_received() if m["name"] == "reconnect_room"]
+    again.disconnect()
+    assert reconnect[-1]["room"]["id"] == room_id and reconnect[-1]["is_spectator"] is False
+
+    server.delete_room(room_id)
+    assert server.UID_ROOM == {}
@@ -0,0 +1,70 @@
+# 房间状态的版本化补丁：diff_state / apply_state_ops 往返，以及服务器的 state_update / state_patch 序列
+from copy import deepcopy
+
+import pytest
+
+
+def test_diff_and_apply_round_trip(server):
+    old = {"a": 1, "nested": {"x": [1, 2], "y": "keep"}, "gone": True, "log": ["one"]}
+    new = {"a": 2, "nested": {"x": [3], "y": "keep", "z": {}}, "log": ["one", "two", "three"]}
+    ops = []
+    server.diff_state(old, new, [], ops)
+    assert ["push", ["log"], ["two", "three"]] in ops
+    assert ["del", ["gone"]] in ops
+    state = deepcopy(old)
+    server.apply_state_ops(state, ops)
+    assert state == new
+
+
+def test_diff_of_equal_states_is_empty(server):
+    ops = []
+    state = {"a": {"b": [1, 2, 3]}}
+    server.diff_state(state, deepcopy(state), [], ops)
+    assert ops == []
+
+
+def test_applied_ops_do_not_alias_the_source(server):
+    new = {"players": {"u": {"hp": 10}}}
+    ops = []
+    server.diff_state({}, new, [], ops)
+    state = {}
+    server.apply_state_ops(state, ops)
+    new["players"]["u"]["hp"] = 0
+    assert state["players"]["u"]["hp"] == 10
+
+
+def test_join_sends_snapshot_then_patches_follow_rev(players):
+    host, guest, late = players("host", "guest", "late")
+    room_id = host.create_room()
+    host.join(room_id)
+    snapshot = host.args('state_update')[-1]
+    assert snapshot["id"] == room_id and "host" in snapshot["players"]
+
+    guest.join(room_id)
+    state = deepcopy(snapshot)
+    for patch in host.args('state_patch'):
+        assert patch["base"] == state["rev"] and patch["rev"] > state["rev"]
+        host.server.apply_state_ops(state, patch["ops"])
+        state["rev"] = patch["rev"]
+    guest.received()
+
+    late.join(room_id)
+    patches = host.args('state_patch')
+    assert [p["base"] for p in patches] == [state["rev"]]
+    host.server.apply_state_ops(state, patches[0]["ops"])
+    state["rev"] = patches[0]["rev"]
+    assert state == host.server.project_room(host.server.rooms[room_id], "alive")
+    assert guest.args('state_patch') == patches
+
+
+def test_request_sync_resends_full_state(players):
+    host = players("host")
+    room_id = host.create_room()
+    host.join(room_id)
+    host.received()
+    host.emit('toggle_ready')
+    host.received()
+    host.emit('request_sync')
+    snapshot = host.args('state_update')[-1]
+    assert snapshot == host.server.project_room(host.server.rooms[room_id], "alive")
+    assert snapshot["players"]["host"]["ready"] is True
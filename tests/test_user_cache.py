@@ -0,0 +1,66 @@
+# 用户资料缓存：热路径读缓存，修改写穿到数据库，写后队列落库后让过期的缓存项失效
+import time
+
+import eventlet
+
+
+def db_user(server, uid):
+    with server.app.app_context():
+        server.db.session.expire_all()
+        user = server.db.session.get(server.User, uid)
+        return user.nickname, user.score
+
+
+def test_repeat_login_is_served_from_cache(players):
+    player = players("cache-login")
+    server = player.server
+    assert "cache-login" in server.USER_CACHE
+    player.received()
+    misses = server.USER_CACHE.misses
+    player.emit('login', {'uid': 'cache-login', 'password': 'pw'})
+    (result,) = player.args('login_result')
+    assert result['success'] and not result['is_new']
+    assert server.USER_CACHE.misses == misses
+
+    player.emit('login', {'uid': 'cache-login', 'password': 'wrong'})
+    assert player.args('login_result') == [{'success': False, 'msg': '密码错误'}]
+
+
+def test_profile_changes_write_through(players):
+    player = players("cache-writer")
+    server = player.server
+    server.update_user("cache-writer", score_delta=5)
+    player.emit('change_nickname', {'uid': 'cache-writer', 'new_nick': 'renamed'})
+    (reply,) = player.args('reroll_success')
+    assert reply['user']['nickname'] == 'renamed' and reply['user']['score'] == 4
+    assert db_user(server, "cache-writer") == ('renamed', 4)
+    assert server.USER_CACHE.peek("cache-writer")["score"] == 4
+
+
+def test_score_delta_does_not_overwrite_pending_results(players):
+    player = players("cache-relative")
+    server = player.server
+    with server.app.app_context():
+        server.User.query.filter_by(id="cache-relative").update({server.User.score: 7})
+        server.db.session.commit()
+    # 缓存里还是旧分数 0，相对更新只扣 1
+    server.update_user("cache-relative", score_delta=-1)
+    assert db_user(server, "cache-relative")[1] == 6
+
+
+def test_results_invalidate_profiles_loaded_after_submit(players):
+    player = players("cache-result")
+    server = player.server
+    server.USER_CACHE.invalidate("cache-result")
+    job = {"created": time.time() - 1, "timestamp": "2024-01-01T00:00:00", "titles": {}, "details": [],
+           "players": [{"uid": "cache-result", "score_change": 3, "game_rank": 1, "total_players": 3,
+                        "is_suicide": False}]}
+    # 入队之后、落库之前加载的缓存项不含这 3 分
+    assert server.get_user_profile("cache-result")["score"] == 0
+    server.GAME_RESULTS.submit(job)
+    with eventlet.Timeout(5):
+        while server.GAME_RESULTS.pending_jobs():
+            eventlet.sleep(0.05)
+    eventlet.sleep(0.05)
+    assert "cache-result" not in server.USER_CACHE
+    assert server.get_user_profile("cache-result")["score"] == 3
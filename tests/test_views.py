@@ -0,0 +1,83 @@
+# 按受众裁剪的房间视图，以及只编码一次的视图在数据包里的拼接
+import json
+import logging
+import re
+
+import eventlet
+
+import game
+import wire
+from views import project_room
+
+
+def input_room():
+    room = game.init_room_state("r", "r")
+    for uid in ("a", "b"):
+        room.players[uid] = game.new_player(uid, uid)
+    room.players["b"].alive = False
+    room.players["a"].guess, room.players["a"].submitted = 42, True
+    room.phase = "INPUT"
+    room.pending_events["temp"] = 104
+    return room
+
+
+def test_guesses_are_hidden_during_input_except_for_admins():
+    room = input_room()
+    for audience in ("alive", "dead", "spec"):
+        view = project_room(room, audience)
+        assert view["players"]["a"]["guess"] is None
+        assert "pending_events" not in view
+    assert project_room(room, "admin") == room.to_wire()
+    assert room.players["a"].guess == 42
+
+    room.phase = "RESULT"
+    assert project_room(room, "spec")["players"]["a"]["guess"] == 42
+
+
+def test_blind_mode_hides_hp_from_alive_players_only():
+    room = input_room()
+    room.blind_mode = True
+    room.last_result = {"details": [{"uid": "a", "hp": 7}]}
+    alive = project_room(room, "alive")
+    assert alive["players"]["a"]["hp"] is None
+    assert alive["last_result"]["details"] == [{"uid": "a", "hp": None}]
+    assert project_room(room, "spec")["players"]["a"]["hp"] == game.MAX_HP
+    assert "available_perm_rules" in alive
+    assert "available_perm_rules" not in project_room(room, "dead")
+
+
+def test_encoded_views_are_spliced_into_packets():
+    view = {"players": {"a": {"hp": 3}}, "name": "房间"}
+    encoded = wire.encode(view)
+    packet = ["state_update", encoded]
+    assert json.loads(wire.dumps(packet)) == ["state_update", view]
+    nested = ["reconnect_room", {"room": encoded, "is_spectator": False}]
+    assert json.loads(wire.dumps(nested)) == ["reconnect_room", {"room": view, "is_spectator": False}]
+    assert wire.dumps({"plain": 1}) == json.dumps({"plain": 1})
+
+
+def test_spectators_never_see_guesses_and_admins_get_full_view(players, caplog):
+    host, watcher = players("views-host", "views-spec")
+    room_id = host.create_room()
+    host.join(room_id)
+    watcher.join(room_id, spectator=True)
+    server = host.server
+    room = server.rooms[room_id]
+    room.phase = "INPUT"
+    room.players["views-host"].guess, room.players["views-host"].submitted = 77, True
+    server.broadcast_room_state(room_id)
+    eventlet.sleep(0.05)
+    for message in watcher.received():
+        # 只查独立的数字：房间 id 里的时间戳可能含有 77
+        assert not re.search(r"(?<![\w.])77(?![\w.])", json.dumps(message["args"]))
+
+    with caplog.at_level(logging.INFO, logger="balance.server"):
+        watcher.emit('admin_login', {'password': 'wrong-guess'})
+        assert len(watcher.received('admin_auth_fail')) == 1
+        watcher.emit('admin_login', {'password': server.ADMIN_PASSWORD})
+    assert "wrong-guess" not in caplog.text and server.ADMIN_PASSWORD not in caplog.text
+    assert "admin login failed" in caplog.text
+    full = [m["args"][0] for m in watcher.received("state_update")]
+    assert full[-1]["players"]["views-host"]["guess"] == 77
+    assert "pending_events" in full[-1]
+
@@ -0,0 +1,83 @@
+# 大帧的二进制编码：服务器端 pack / unpack、编码协商，以及页面自带的 static/js/wire.js 能解开服务器的帧
+import json
+import random
+import shutil
+import subprocess
+import zlib
+from pathlib import Path
+
+import eventlet
+import pytest
+
+import wire
+
+ROOT_JS = Path(__file__).resolve().parent.parent / "static" / "js" / "wire.js"
+
+
+def sample_frames():
+    rng = random.Random(12)
+    room = {"players": {f"p{i}": {"hp": rng.randint(0, 10), "name": "玩家" * 3, "guess": None,
+                                  "score": rng.randint(-5, 2 ** 40)} for i in range(8)},
+            "logs": [{"round": r, "avg": rng.random() * 100, "target": rng.random() * 80} for r in range(20)]}
+    return [{}, [], {"small": True, "n": -1}, room, {"s": "x" * 70000, "big": list(range(3000))}]
+
+
+def test_pack_round_trips_and_compresses_large_bodies():
+    for obj in sample_frames():
+        frame = wire.pack(obj)
+        assert wire.unpack(frame) == obj
+        body = wire.msgpack.packb(obj)
+        assert frame[0] == (wire.FLAG_ZLIB if len(body) >= wire.COMPRESS_THRESHOLD else wire.FLAG_PLAIN)
+
+
+def test_negotiate_falls_back_to_json(monkeypatch):
+    assert wire.negotiate("msgpack") == "msgpack"
+    assert wire.negotiate(None) == "json"
+    assert wire.negotiate("cbor") == "json"
+    assert isinstance(wire.encode_for({"a": 1}, "json"), wire.Encoded)
+    monkeypatch.setattr(wire, "msgpack", None)
+    assert wire.negotiate("msgpack") == "json"
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node to run the browser decoder")
+def test_browser_decoder_reads_server_frames(tmp_path):
+    frames = [wire.pack(obj).hex() for obj in sample_frames()]
+    streams = [zlib.compress(bytes(range(256)) * n, level).hex() for n, level in ((0, 9), (3, 0), (300, 1), (50, 6))]
+    cases = tmp_path / "cases.json"
+    cases.write_text(json.dumps({"frames": frames, "streams": streams}))
+    script = f"""
+        require({json.dumps(str(ROOT_JS))});
+        const c = require({json.dumps(str(cases))});
+        process.stdout.write(JSON.stringify({{
+            frames: c.frames.map(h => WireCodec.decodeFrame(Buffer.from(h, 'hex'))),
+            streams: c.streams.map(h => Buffer.from(WireCodec.inflate(Buffer.from(h, 'hex'))).toString('hex')),
+        }}));
+    """
+    out = json.loads(subprocess.run(["node", "-e", script], capture_output=True, text=True, check=True).stdout)
+    assert out["frames"] == json.loads(json.dumps(sample_frames()))
+    assert out["streams"] == [zlib.decompress(bytes.fromhex(h)).hex() for h in streams]
+
+
+def test_page_uses_the_bundled_decoder(server):
+    client = server.app.test_client()
+    page = client.get("/").get_data(as_text=True)
+    assert "/static/js/wire.js" in page
+    assert "@msgpack/msgpack" not in page and "pako" not in page
+    assert b"WireCodec" in client.get("/static/js/wire.js").data
+
+
+def test_msgpack_clients_get_binary_room_views(players, server):
+    host = players("wire-host")
+    room_id = host.create_room()
+    binary = server.socketio.test_client(server.app, query_string="codec=msgpack")
+    binary.emit('login', {'uid': 'wire-bin', 'password': 'pw'})
+    binary.emit('join_room', {'room_id': room_id, 'uid': 'wire-bin', 'is_spectator': True})
+    eventlet.sleep(0.01)
+    updates = [m["args"][0] for m in binary.get_received() if m["name"] == "state_update"]
+    binary.disconnect()
+    assert isinstance(updates[-1], bytes)
+    assert wire.unpack(updates[-1]) == server.project_room(server.rooms[room_id], "spec")
+
+    host.join(room_id)
+    (plain,) = host.args('state_update')
+    assert isinstance(plain, dict)
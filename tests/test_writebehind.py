@@ -0,0 +1,109 @@
+import os
+import time
+
+import eventlet
+
+from writebehind import WriteBehindQueue
+
+
+def make_queue(tmp_path, applied, **kwargs):
+    def apply_batch(batch):
+        if any(job.get("bad") for job in batch):
+            raise ValueError("bad job")
+        applied.extend(job["n"] for job in batch)
+    return WriteBehindQueue(str(tmp_path), apply_batch, **kwargs)
+
+
+def test_bad_job_is_dead_lettered_and_later_jobs_apply(tmp_path):
+    applied = []
+    queue = make_queue(tmp_path, applied, linger=0.05, retry_delay=0.01, max_retries=2)
+    queue.start()
+    bad_id = None
+    for n in range(5):
+        job_id = queue.submit({"n": n, "bad": n == 2})
+        if n == 2:
+            bad_id = job_id
+    eventlet.sleep(0.3)
+    queue.submit({"n": 5})
+    eventlet.sleep(0.2)
+    assert sorted(applied) == [0, 1, 3, 4, 5]
+    assert os.listdir(queue.dead_dir) == [bad_id + ".json"]
+    assert queue.pending_jobs() == []
+
+
+def test_replay_applies_journal_and_skips_bad_jobs(tmp_path):
+    applied = []
+    writer = make_queue(tmp_path, [])
+    writer.submit({"n": 1})
+    writer.submit({"n": 2, "bad": True})
+    writer.submit({"n": 3})
+
+    # 进程重启：新队列从日志目录重放，坏任务不阻止启动
+    queue = make_queue(tmp_path, applied)
+    assert queue.replay() == 3
+    assert applied == [1, 3]
+    assert queue.pending_jobs() == []
+    assert len(os.listdir(queue.dead_dir)) == 1
+
+
+def test_jobs_submitted_together_share_a_batch(tmp_path):
+    batches = []
+    queue = WriteBehindQueue(str(tmp_path), lambda batch: batches.append([job["n"] for job in batch]), linger=0.1)
+    queue.start()
+    for n in range(5):
+        queue.submit({"n": n})
+    eventlet.sleep(0.3)
+    assert batches == [[0, 1, 2, 3, 4]]
+
+
+def game_job(uids, change=1):
+    return {
+        "created": time.time(),
+        "timestamp": "2024-01-01T00:00:00",
+        "players": [{"uid": uid, "score_change": change, "game_rank": i + 1, "total_players": len(uids),
+                     "is_suicide": False} for i, uid in enumerate(uids)],
+        "titles": {},
+        "details": [],
+    }
+
+
+def test_flush_alongside_hub_activity_does_not_deadlock(server):
+    # 写协程落库的同时，其他协程也在用同一个 scoped session 查库，hub 上的计时器照常运行
+    uids = [f"wb-{i}" for i in range(4)]
+    with server.app.app_context():
+        for uid in uids:
+            server.db.session.merge(server.User(id=uid, password="pw", nickname=uid))
+        server.db.session.commit()
+        before = {uid: server.db.session.get(server.User, uid).score for uid in uids}
+
+    def reader():
+        # 查询后持有连接再让出 hub，连接池经常被占满，落库要在池上等待
+        for _ in range(20):
+            with server.app.app_context():
+                server.db.session.get(server.User, uids[0])
+                eventlet.sleep(0.005)
+
+    ticks = []
+
+    def ticker():
+        while True:
+            ticks.append(1)
+            eventlet.sleep(0.01)
+
+    clock = eventlet.spawn(ticker)
+    try:
+        with eventlet.Timeout(10):
+            readers = [eventlet.spawn(reader) for _ in range(20)]
+            for _ in range(20):
+                server.GAME_RESULTS.submit(game_job(uids))
+            for r in readers:
+                r.wait()
+            while server.GAME_RESULTS.pending_jobs():
+                eventlet.sleep(0.05)
+    finally:
+        clock.kill()
+    assert ticks
+    with server.app.app_context():
+        server.db.session.expire_all()
+        assert {uid: server.db.session.get(server.User, uid).score for uid in uids} == \
+            {uid: before[uid] + 20 for uid in uids}
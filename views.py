@@ -0,0 +1,53 @@
+# 房间的受众视图：按连接身份裁剪房间，不把规则上应隐藏的字段发给客户端。
+#   alive  存活玩家：输入阶段看不到任何人的数字；【黑暗】事件中看不到 HP
+#   dead   已淘汰玩家：输入阶段看不到数字
+#   spec   观战者：同上
+#   admin  管理员：完整房间 (含预设事件)
+# 投影基于 Room.to_wire() 的浅拷贝，调用方不得修改其中共享的列表。
+
+AUDIENCES = ("alive", "dead", "spec", "admin")
+
+ADMIN_ONLY_KEYS = ("pending_events",)
+ALIVE_ONLY_KEYS = ("available_perm_rules",)  # 只有存活玩家自刎时需要
+
+
+def audience_of(room, uid, is_admin=False):
+    if is_admin:
+        return "admin"
+    p = room.players.get(uid)
+    if p is None:
+        return "spec"
+    return "alive" if p.alive else "dead"
+
+
+def _hide_hp(details):
+    return [dict(d, hp=None) for d in details]
+
+
+def project_room(room, audience):
+    # room 为 state.Room；返回线路格式的 dict
+    view = room.to_wire()
+    if audience == "admin":
+        return view
+    for key in ADMIN_ONLY_KEYS:
+        del view[key]
+    if audience != "alive":
+        for key in ALIVE_ONLY_KEYS:
+            del view[key]
+
+    hide_guess = room.phase == "INPUT"
+    hide_hp = audience == "alive" and room.blind_mode
+    # to_wire() 已为每名玩家生成新 dict，可直接改写
+    for p in view["players"].values():
+        if hide_guess:
+            p["guess"] = None
+        if hide_hp:
+            p["hp"] = None
+            p["last_dmg"] = None
+    if hide_hp and room.last_result.get("details"):
+        # 本回合结算明细里的剩余 HP 同样隐藏
+        view["last_result"] = dict(room.last_result, details=_hide_hp(room.last_result["details"]))
+        if room.full_history:
+            last = room.full_history[-1]
+            view["full_history"] = room.full_history[:-1] + [dict(last, player_data=_hide_hp(last["player_data"]))]
+    return view
@@ -0,0 +1,83 @@
+# Socket.IO 数据包的 JSON 编码：与标准库 json 相同，但允许嵌入事先编码好的片段 (Encoded)，
+# 同一份房间视图在多次发送间只序列化一次。作为 SocketIO(json=wire) 使用。
+#
+# 大帧 (完整房间视图、战绩) 另有二进制编码：客户端连接时声明 codec=msgpack，
+# 服务器以 Socket.IO 二进制附件发送 1 字节标志 + MessagePack 正文，超过阈值时正文用 zlib 压缩。
+# 服务器没有安装 msgpack 或客户端未声明时一律使用 JSON。浏览器端的解码见 static/js/wire.js。
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # 没有 msgpack 时只提供 JSON
+    msgpack = None
+
+COMPRESS_THRESHOLD = 1024
+FLAG_PLAIN = 0
+FLAG_ZLIB = 1
+
+
+class Encoded:
+    __slots__ = ("text",)
+
+    def __init__(self, text):
+        self.text = text
+
+    def __getstate__(self):
+        return self.text
+
+    def __setstate__(self, text):
+        self.text = text
+
+
+def encode(obj):
+    return Encoded(json.dumps(obj, separators=(',', ':')))
+
+
+def negotiate(requested):
+    return "msgpack" if requested == "msgpack" and msgpack is not None else "json"
+
+
+def pack(obj):
+    body = msgpack.packb(obj)
+    if len(body) >= COMPRESS_THRESHOLD:
+        return bytes([FLAG_ZLIB]) + zlib.compress(body, 6)
+    return bytes([FLAG_PLAIN]) + body
+
+
+def unpack(data):
+    body = data[1:]
+    if data[0] == FLAG_ZLIB:
+        body = zlib.decompress(body)
+    return msgpack.unpackb(body)
+
+
+def encode_for(obj, codec):
+    # 按连接协商的编码生成帧：JSON 为可直接拼接的 Encoded，二进制为 bytes
+    return pack(obj) if codec == "msgpack" else encode(obj)
+
+
+def _has_encoded(obj, depth=2):
+    # 只检查数据包的前两层：[事件名, 参数] 与参数 dict 的值
+    if isinstance(obj, Encoded):
+        return True
+    if depth == 0:
+        return False
+    if isinstance(obj, list):
+        return any(_has_encoded(x, depth - 1) for x in obj)
+    if isinstance(obj, dict):
+        return any(_has_encoded(v, depth - 1) for v in obj.values())
+    return False
+
+
+def dumps(obj, **kwargs):
+    if not _has_encoded(obj):
+        return json.dumps(obj, **kwargs)
+    if isinstance(obj, Encoded):
+        return obj.text
+    if isinstance(obj, list):
+        return "[" + ",".join(dumps(x, **kwargs) for x in obj) + "]"
+    return "{" + ",".join(json.dumps(str(k)) + ":" + dumps(v, **kwargs) for k, v in obj.items()) + "}"
+
+
+loads = json.loads
@@ -0,0 +1,140 @@
+# 写后队列：游戏线程只把结果写进本地日志文件并入队，后台写协程把多个任务合并成一次事务落库。
+# 每个任务一个日志文件，落库成功后删除；进程崩溃后启动时重放剩余文件。
+# apply_batch 必须是幂等的 (按任务 id 去重)，这样重放与关停时的 flush 都不会重复计分。
+# 整批落库失败时按指数退避重试，仍失败则逐个任务重试，找出的坏任务移到 dead/ 子目录并记日志，
+# 不再挡住后面的任务；修好数据后把文件移回日志目录，下次启动时会重放。
+import json
+import logging
+import os
+import time
+import uuid
+
+import eventlet
+from eventlet import tpool
+from eventlet.queue import Queue, Empty
+
+LOG = logging.getLogger('balance.writebehind')
+
+
+class WriteBehindQueue:
+    def __init__(self, journal_dir, apply_batch, on_applied=None, batch_size=64, linger=0.2, retry_delay=2.0,
+                 max_retries=4, id_prefix=""):
+        self.journal_dir = journal_dir
+        self.dead_dir = os.path.join(journal_dir, "dead")
+        self.id_prefix = id_prefix  # 多个进程共用去重表时用于区分任务来源
+        self.apply_batch = apply_batch
+        self.on_applied = on_applied  # 落库成功后回调，可用于失效缓存
+        self.batch_size = batch_size
+        self.linger = linger
+        self.retry_delay = retry_delay
+        self.max_retries = max_retries
+        self.queue = Queue()
+        self.writer = None
+        os.makedirs(journal_dir, exist_ok=True)
+
+    def submit(self, payload):
+        job_id = f"{self.id_prefix}{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        job = dict(payload, id=job_id)
+        data = json.dumps(job, ensure_ascii=False).encode("utf-8")
+        # 写文件与 fsync 只是普通文件 IO，放到原生线程池，不阻塞 hub；落盘之后才入队
+        tpool.execute(self._write_journal, job_id, data)
+        self.queue.put(job)
+        return job_id
+
+    def _write_journal(self, job_id, data):
+        path = os.path.join(self.journal_dir, job_id + ".json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def start(self):
+        if self.writer is None:
+            self.writer = eventlet.spawn(self._run)
+
+    def pending_jobs(self):
+        jobs = []
+        for name in sorted(os.listdir(self.journal_dir)):
+            if not name.endswith(".json"): continue
+            try:
+                with open(os.path.join(self.journal_dir, name), encoding="utf-8") as f:
+                    jobs.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return jobs
+
+    def replay(self):
+        # 启动时或关停时同步落库所有残留任务；坏任务移入 dead/，不影响启动
+        jobs = self.pending_jobs()
+        for i in range(0, len(jobs), self.batch_size):
+            batch = jobs[i:i + self.batch_size]
+            try:
+                self.apply_batch(batch)
+            except Exception:
+                LOG.exception("write-behind replay: batch of %d failed, retrying one by one", len(batch))
+                batch = [job for job in batch if self._apply_one(job)]
+            self._discard(batch)
+        return len(jobs)
+
+    flush = replay
+
+    def _apply_one(self, job):
+        # 单个任务只试一次：整批已经重试过，到这里仍失败的多半是数据本身有问题
+        try:
+            self.apply_batch([job])
+            return True
+        except Exception:
+            LOG.exception("write-behind job %s failed", job.get("id"))
+            self._dead_letter(job)
+            return False
+
+    def _dead_letter(self, job):
+        os.makedirs(self.dead_dir, exist_ok=True)
+        name = job["id"] + ".json"
+        try:
+            os.replace(os.path.join(self.journal_dir, name), os.path.join(self.dead_dir, name))
+        except FileNotFoundError:
+            pass
+        LOG.error("write-behind job %s moved to %s", job["id"], self.dead_dir)
+
+    def _discard(self, batch):
+        for job in batch:
+            try:
+                os.remove(os.path.join(self.journal_dir, job["id"] + ".json"))
+            except FileNotFoundError:
+                pass
+
+    def _apply_with_retries(self, batch):
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.apply_batch(batch)
+                return True
+            except Exception:
+                LOG.exception("write-behind batch of %d failed (attempt %d/%d)", len(batch), attempt + 1,
+                              self.max_retries + 1)
+            if attempt < self.max_retries:
+                eventlet.sleep(delay)
+                delay *= 2
+        return False
+
+    def _run(self):
+        # 落库在本协程里执行，不进 tpool：进程已 monkey_patch，Flask-SQLAlchemy 的 scoped session
+        # 与连接池的锁都是绿色的，放到原生线程里会和 hub 互相等待。合并成一批后一次事务只占 hub 很短时间。
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.linger
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0: break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except Empty:
+                    break
+            if not self._apply_with_retries(batch):
+                batch = [job for job in batch if self._apply_one(job)]
+            self._discard(batch)
+            if self.on_applied and batch:
+                self.on_applied(batch)
@@ -5,5 +5,6 @@ eventlet.monkey_patch()
 from app import app
 
 if __name__ == "__main__":
+    import os
     from app import socketio
-    socketio.run(app)
\ No newline at end of file
+    socketio.run(app, host=os.environ.get('HOST', '127.0.0.1'), port=int(os.environ.get('PORT', 5000)))
\ No newline at end of file